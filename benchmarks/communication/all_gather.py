@@ -8,21 +8,27 @@ sys.path.append(COMMS_BENCH_DIR)
 
 import communication.constants as COMM_CONST
 from communication.utils import (
+    adaptive_scan,
     benchmark_parser,
     bytes_to_human_readable,
+    create_trial_events,
     get_bw,
     get_metric_strings,
+    get_payload_views,
     get_scan_range,
     init_processes,
+    issue_comm_op,
     print_header,
     print_rank_0,
+    record_result,
     setup_single_payload,
     sync_all,
+    trial_durations,
 )
 
 
 # Run all_gather and print metrics
-def timed_all_gather(input, output, start_event, end_event, args):
+def timed_all_gather(input, output, trial_events, args):
     if args.dist == "torch":
         import torch.distributed as dist
     elif args.dist == "deepspeed":
@@ -31,22 +37,17 @@ def timed_all_gather(input, output, start_event, end_event, args):
     sync_all()
     # Warmups, establish connections, etc.
     for i in range(args.warmups):
-        if args.dist == "torch":
-            dist.all_gather_into_tensor(output, input)
-        elif args.dist == "deepspeed":
-            dist.allgather_fn(output, input, group=None, async_op=args.async_op)
+        issue_comm_op("all_gather", input, output, args, async_op=args.async_op)
     sync_all()
 
     # time the actual comm op trials times and average it
-    start_event.record()
+    trial_events[0].record()
     for i in range(args.trials):
-        if args.dist == "torch":
-            dist.all_gather_into_tensor(output, input)
-        elif args.dist == "deepspeed":
-            dist.allgather_fn(output, input, group=None, async_op=args.async_op)
-    end_event.record()
+        issue_comm_op("all_gather", input, output, args, async_op=args.async_op)
+        trial_events[i + 1].record()
     sync_all()
-    duration = start_event.elapsed_time(end_event) / 1000
+    samples = trial_durations(trial_events)
+    duration = sum(samples)
 
     # maintain and clean performance data
     avg_duration = duration / args.trials
@@ -57,34 +58,47 @@ def timed_all_gather(input, output, start_event, end_event, args):
     )
     desc = f"{input.nelement()}x{input.element_size()}"
 
+    result = record_result(args, "all_gather", size, avg_duration, samples=samples)
+
     if not args.raw:
         size = bytes_to_human_readable(size)
 
     print_rank_0(
         f"{size:<20} {desc:25s} {duration_str:20s} {tput_str:20s} {busbw_str:20s}"
     )
+    return result
+
+
+def measure_all_gather(elements_per_gpu, trial_events, args):
+    payload_views = get_payload_views(args, elements_per_gpu=elements_per_gpu, op="all_gather")
+    if payload_views is None:
+        return None
+    input, output = payload_views
+    return timed_all_gather(input, output, trial_events, args)
 
 
 def run_all_gather(args):
 
     print_header(args, "all_gather")
 
-    start_event = torch.cuda.Event(enable_timing=True)
-    end_event = torch.cuda.Event(enable_timing=True)
+    trial_events = create_trial_events(args)
 
-    if args.scan:
+    if args.scan and args.adaptive_scan:
+        adaptive_scan('all_gather', lambda elements_per_gpu: measure_all_gather(elements_per_gpu, trial_events, args), args)
+    elif args.scan:
         # Create list of message sizes
         payloads = get_scan_range(args)
         # loop over various tensor sizes
         for payload in payloads:
-            input, output = setup_single_payload(
-                args, elements_per_gpu=payload, op="all_gather"
-            )
-            timed_all_gather(input, output, start_event, end_event, args)
+            payload_views = get_payload_views(args, elements_per_gpu=payload, op="all_gather")
+            if payload_views is None:
+                break
+            input, output = payload_views
+            timed_all_gather(input, output, trial_events, args)
     else:
         elements_per_gpu = 2 ** int(args.elements_per_gpu)
         input, output = setup_single_payload(args, elements_per_gpu=elements_per_gpu, op="all_gather")
-        timed_all_gather(input, output, start_event, end_event, args)
+        timed_all_gather(input, output, trial_events, args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+from collections import deque
+
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.utils import (
+    _element_size,
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_bw,
+    get_device,
+    get_device_memory,
+    get_metric_strings,
+    get_scan_range,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    sync_all,
+)
+
+
+def print_window_header(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    tput = f"Throughput ({args.bw_unit})"
+    busbw = f"BusBW ({args.bw_unit})"
+    header = f"\n---- In-flight window of {args.window_op} on {dist.get_world_size()} devices for {args.trials} trials ----------------------\n"
+    header += f"{'Payload / GPU':20s} {'Window':8s} {'Duration':15s} {'Op latency':15s} {tput:20s} {busbw:20s} {'Speedup':10s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+
+
+def setup_window_buffers(args, elements_per_gpu, depth, device):
+    """
+    One distinct (input, output) pair per in-flight op, so that no two outstanding collectives share memory
+    """
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    dtype = getattr(torch, args.dtype)
+    world_size = dist.get_world_size()
+    output_elements = elements_per_gpu * world_size if args.window_op == "all_gather" else 0
+    if args.window_op == "all_to_all":
+        output_elements = elements_per_gpu
+    window_bytes = depth * (elements_per_gpu + output_elements) * _element_size(dtype)
+    if window_bytes > get_device_memory(device) * args.mem_factor:
+        print_rank_0(
+            f"WARNING: a window of {depth} x {bytes_to_human_readable(elements_per_gpu * _element_size(dtype))} exceeds --mem-factor, skipping"
+        )
+        return None
+
+    inputs = torch.ones(depth, elements_per_gpu, dtype=dtype, device=device)
+    outputs = None
+    if output_elements > 0:
+        outputs = torch.zeros(depth, output_elements, dtype=dtype, device=device)
+    return [(inputs[i], outputs[i] if outputs is not None else None) for i in range(depth)]
+
+
+def wait_for_completion(handle, device):
+    handle.wait()
+    if device.type == "cuda":
+        # NCCL's wait() only orders the current stream behind the op, block the host until it is really done
+        while not handle.is_completed():
+            # yield the core to the co-scheduled compute and the backend's threads instead of spinning on it
+            time.sleep(0)
+
+
+def windowed_loop(buffers, iterations, device, args):
+    """
+    Issue iterations async ops with at most len(buffers) in flight, returning the per-op issue-to-completion times
+    """
+    in_flight = deque()
+    latencies = []
+    for i in range(iterations):
+        if len(in_flight) == len(buffers):
+            handle, issued = in_flight.popleft()
+            wait_for_completion(handle, device)
+            latencies.append(time.perf_counter() - issued)
+        input, output = buffers[i % len(buffers)]
+        in_flight.append((issue_comm_op(args.window_op, input, output, args, async_op=True), time.perf_counter()))
+    while len(in_flight) > 0:
+        handle, issued = in_flight.popleft()
+        wait_for_completion(handle, device)
+        latencies.append(time.perf_counter() - issued)
+    return latencies
+
+
+def timed_window(buffers, device, args):
+    sync_all()
+    windowed_loop(buffers, args.warmups, device, args)
+    sync_all()
+
+    start = time.perf_counter()
+    latencies = windowed_loop(buffers, args.trials, device, args)
+    duration = time.perf_counter() - start
+    return duration / args.trials, sum(latencies) / len(latencies)
+
+
+def timed_window_payload(elements_per_gpu, device, args):
+    baseline = None
+    for depth in args.window_depths:
+        buffers = setup_window_buffers(args, elements_per_gpu, depth, device)
+        if buffers is None:
+            break
+        avg_duration, latency = timed_window(buffers, device, args)
+        del buffers
+        if baseline is None:
+            baseline = avg_duration
+
+        size = elements_per_gpu * _element_size(getattr(torch, args.dtype))
+        tput, busbw = get_bw(args.window_op, size, avg_duration, args)
+        tput_str, busbw_str, duration_str = get_metric_strings(args, tput, busbw, avg_duration)
+        _, _, latency_str = get_metric_strings(args, tput, busbw, latency)
+        if not args.raw:
+            size = bytes_to_human_readable(size)
+        print_rank_0(
+            f"{size:<20} {depth:<8d} {duration_str:15s} {latency_str:15s} {tput_str:20s} {busbw_str:20s} {baseline / avg_duration:<10.2f}"
+        )
+
+
+def run_async_window(args):
+    print_window_header(args)
+    device = get_device(args)
+
+    if args.scan:
+        for payload in get_scan_range(args):
+            timed_window_payload(payload, device, args)
+    else:
+        timed_window_payload(2 ** int(args.elements_per_gpu), device, args)
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_async_window(args)
+    if args.dist == 'torch':
+        import torch.distributed as dist
+
+        # Tear gloo down explicitly, its async work threads otherwise abort the interpreter at exit
+        dist.destroy_process_group()
@@ -8,7 +8,7 @@ from communication.utils import *
 from communication.constants import *
 
 
-def timed_broadcast(input, start_event, end_event, args):
+def timed_broadcast(input, trial_events, args):
     if args.dist == 'torch':
         import torch.distributed as dist
     elif args.dist == 'deepspeed':
@@ -21,12 +21,13 @@ def timed_broadcast(input, start_event, end_event, args):
     sync_all()
 
     # time the actual comm op trials times and average it
-    start_event.record()
+    trial_events[0].record()
     for i in range(args.trials):
         dist.broadcast(input, 0, async_op=args.async_op)
-    end_event.record()
+        trial_events[i + 1].record()
     sync_all()
-    duration = start_event.elapsed_time(end_event) / 1000
+    samples = trial_durations(trial_events)
+    duration = sum(samples)
 
     # maintain and clean performance data
     avg_duration = duration / args.trials
@@ -36,10 +37,13 @@ def timed_broadcast(input, start_event, end_event, args):
     tput_str, busbw_str, duration_str = get_metric_strings(args, tput, busbw, avg_duration)
     desc = f'{input.nelement()}x{input.element_size()}'
 
+    result = record_result(args, 'broadcast', size, avg_duration, samples=samples)
+
     if not args.raw:
         size = convert_size(size)
 
     print_rank_0(f"{size:<20} {desc:25s} {duration_str:20s} {tput_str:20s} {busbw_str:20s}")
+    return result
 
 
 def run_broadcast(local_rank, args):
@@ -53,9 +57,9 @@ def run_broadcast(local_rank, args):
 
     world_size = dist.get_world_size()
     global_rank = dist.get_rank()
+    device = get_device(args)
 
-    start_event = torch.cuda.Event(enable_timing=True)
-    end_event = torch.cuda.Event(enable_timing=True)
+    trial_events = create_trial_events(args)
 
     if args.scan:
         M_LIST = []
@@ -68,11 +72,12 @@ def run_broadcast(local_rank, args):
             global_rank = dist.get_rank()
             try:
                 mat = torch.ones(world_size, M,
-                                 dtype=getattr(torch, args.dtype)).cuda(local_rank)
+                                 dtype=getattr(torch, args.dtype)).to(device)
                 sync_all()
-                input = ((mat.mul_(float(global_rank))).view(-1))
+                input = ((mat.mul_(global_rank)).view(-1))
                 del mat
-                torch.cuda.empty_cache()
+                if device.type == 'cuda':
+                    torch.cuda.empty_cache()
             except RuntimeError as e:
                 if 'out of memory' in str(e):
                     if dist.get_rank() == 0:
@@ -82,7 +87,7 @@ def run_broadcast(local_rank, args):
                 else:
                     raise e
             sync_all()
-            timed_broadcast(input, start_event, end_event, args)
+            timed_broadcast(input, trial_events, args)
     else:
         # Send the biggest message size our GPUs can fit. If you're facing OOM errors, reduce the mem_factor
         # Don't need output tensor, so we double mem_factor
@@ -91,10 +96,13 @@ def run_broadcast(local_rank, args):
                                      mem_factor=args.mem_factor * 2,
                                      local_rank=local_rank,
                                      args=args)
+        if device.type != 'cuda':
+            # host memory is shared by every local rank, stick to --elements-per-gpu
+            elements_per_gpu = 2 ** int(args.elements_per_gpu)
         try:
             mat = torch.ones(elements_per_gpu, dtype=getattr(torch,
-                                                             args.dtype)).cuda(local_rank)
-            input = ((mat.mul_(float(global_rank))).view(-1))
+                                                             args.dtype)).to(device)
+            input = ((mat.mul_(global_rank)).view(-1))
         except RuntimeError as e:
             if 'out of memory' in str(e):
                 if dist.get_rank() == 0:
@@ -102,7 +110,7 @@ def run_broadcast(local_rank, args):
                 sync_all()
                 return
         sync_all()
-        timed_broadcast(input, start_event, end_event, args)
+        timed_broadcast(input, trial_events, args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+import importlib
+import json
+import math
+import os
+import sys
+import time
+
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.utils import (
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_bw,
+    get_device,
+    get_metric_strings,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    sync_all,
+)
+
+
+def shapes_from_module(module):
+    """
+    Parameter shapes of a model (e.g. a megatron GPT2ModelPipe) in named_parameters() order
+    """
+    return [(name, tuple(param.shape)) for name, param in module.named_parameters()]
+
+
+def shapes_from_spec(hidden_size, num_layers, vocab_size, tp_size=1):
+    """
+    Per-rank parameter shapes of a megatron GPT layer stack, in named_parameters() order
+    """
+    h = hidden_size
+    shapes = [("word_embeddings.weight", (vocab_size // tp_size, h))]
+    for layer in range(num_layers):
+        prefix = f"layers.{layer}"
+        shapes += [
+            (f"{prefix}.input_layernorm.weight", (h,)),
+            (f"{prefix}.input_layernorm.bias", (h,)),
+            (f"{prefix}.attention.query_key_value.weight", (3 * h // tp_size, h)),
+            (f"{prefix}.attention.query_key_value.bias", (3 * h // tp_size,)),
+            (f"{prefix}.attention.dense.weight", (h, h // tp_size)),
+            (f"{prefix}.attention.dense.bias", (h,)),
+            (f"{prefix}.post_attention_layernorm.weight", (h,)),
+            (f"{prefix}.post_attention_layernorm.bias", (h,)),
+            (f"{prefix}.mlp.dense_h_to_4h.weight", (4 * h // tp_size, h)),
+            (f"{prefix}.mlp.dense_h_to_4h.bias", (4 * h // tp_size,)),
+            (f"{prefix}.mlp.dense_4h_to_h.weight", (h, 4 * h // tp_size)),
+            (f"{prefix}.mlp.dense_4h_to_h.bias", (h,)),
+        ]
+    shapes += [("final_layernorm.weight", (h,)), ("final_layernorm.bias", (h,))]
+    return shapes
+
+
+def shapes_from_factory(spec):
+    """
+    Parameter shapes of the model returned by the "module:function" spec, built on the meta device so that no
+    parameter memory is allocated
+    """
+    module_name, _, function_name = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), function_name)
+    with torch.device("meta"):
+        model = factory()
+    return shapes_from_module(model)
+
+
+def load_param_shapes(args):
+    if args.model is not None:
+        return shapes_from_factory(args.model)
+    if args.param_shapes is None:
+        return shapes_from_spec(
+            args.model_hidden_size,
+            args.model_num_layers,
+            args.model_vocab_size,
+            args.model_tp_size,
+        )
+    # Either {"name": [shape]} as dumped from named_parameters(), or a plain list of shapes
+    with open(args.param_shapes, "r") as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        return [(name, tuple(shape)) for name, shape in spec.items()]
+    return [(f"param.{i}", tuple(shape)) for i, shape in enumerate(spec)]
+
+
+def build_buckets(tensors, bucket_size):
+    # Gradients become ready back to front, so buckets are filled in reverse parameter order like DDP
+    buckets = []
+    current = []
+    current_numel = 0
+    for tensor in reversed(tensors):
+        current.append(tensor)
+        current_numel += tensor.numel()
+        if current_numel >= bucket_size:
+            buckets.append(current)
+            current = []
+            current_numel = 0
+    if len(current) > 0:
+        buckets.append(current)
+    return buckets
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timed_loop(step, device, args):
+    sync_all()
+    for i in range(args.warmups):
+        step()
+    sync_all()
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        step()
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def per_tensor_step(tensors, args):
+    handles = [issue_comm_op("all_reduce", tensor, None, args, async_op=True) for tensor in tensors]
+    for handle in handles:
+        handle.wait()
+
+
+def coalesced_step(tensors, device, args):
+    import torch.distributed as dist
+
+    try:
+        from torch.distributed.distributed_c10d import _coalescing_manager
+    except ImportError:
+        _coalescing_manager = None
+
+    if _coalescing_manager is None or args.backend == "gloo":
+        # gloo does not implement coalescing groups, older torch only has the (deprecated) list API
+        dist.all_reduce_coalesced(tensors)
+        return
+
+    with _coalescing_manager(device=device, async_ops=True) as cm:
+        for tensor in tensors:
+            dist.all_reduce(tensor)
+    cm.wait()
+
+
+def flatten_buckets(buckets, flat_buffers):
+    for bucket, flat in zip(buckets, flat_buffers):
+        torch.cat([tensor.view(-1) for tensor in bucket], out=flat)
+
+
+def unflatten_buckets(buckets, flat_buffers):
+    for bucket, flat in zip(buckets, flat_buffers):
+        offset = 0
+        for tensor in bucket:
+            tensor.view(-1).copy_(flat[offset:offset + tensor.numel()])
+            offset += tensor.numel()
+
+
+def bucketed_step(buckets, flat_buffers, args):
+    flatten_buckets(buckets, flat_buffers)
+    handles = [issue_comm_op("all_reduce", flat, None, args, async_op=True) for flat in flat_buffers]
+    for handle in handles:
+        handle.wait()
+    unflatten_buckets(buckets, flat_buffers)
+
+
+def copy_step(buckets, flat_buffers):
+    flatten_buckets(buckets, flat_buffers)
+    unflatten_buckets(buckets, flat_buffers)
+
+
+def print_bucketing_header(args, num_tensors, total_bytes):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    tput = f"Throughput ({args.bw_unit})"
+    busbw = f"BusBW ({args.bw_unit})"
+    header = f"\n---- Bucketed all_reduce of {num_tensors} tensors ({bytes_to_human_readable(total_bytes)}) on {dist.get_world_size()} devices for {args.trials} trials ----------------------\n"
+    header += f"{'Mode':15s} {'Bucket (elems)':15s} {'Collectives':12s} {'Duration':15s} {tput:20s} {busbw:20s} {'Copy overhead':15s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+
+
+def print_bucketing_row(args, mode, bucket_size, num_collectives, total_bytes, duration, copy_duration=None):
+    tput, busbw = get_bw("all_reduce", total_bytes, duration, args)
+    tput_str, busbw_str, duration_str = get_metric_strings(args, tput, busbw, duration)
+    copy_str = "-"
+    if copy_duration is not None:
+        copy_str = f"{copy_duration * 1e3:.3f} ms ({100 * copy_duration / duration:.0f}%)"
+    print_rank_0(
+        f"{mode:15s} {str(bucket_size):15s} {num_collectives:<12d} {duration_str:15s} {tput_str:20s} {busbw_str:20s} {copy_str:15s}"
+    )
+
+
+def run_bucketing(args):
+    device = get_device(args)
+    dtype = getattr(torch, args.dtype)
+
+    shapes = load_param_shapes(args)
+    tensors = [torch.ones(math.prod(shape), dtype=dtype, device=device).view(shape) for _, shape in shapes]
+    total_bytes = sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    print_bucketing_header(args, len(tensors), total_bytes)
+
+    duration = timed_loop(lambda: per_tensor_step(tensors, args), device, args)
+    print_bucketing_row(args, "per_tensor", "-", len(tensors), total_bytes, duration)
+
+    if args.dist == "torch":
+        duration = timed_loop(lambda: coalesced_step(tensors, device, args), device, args)
+        print_bucketing_row(args, "coalesced", "-", 1, total_bytes, duration)
+
+    for bucket_size in args.bucket_sizes:
+        buckets = build_buckets(tensors, int(bucket_size))
+        flat_buffers = [
+            torch.empty(sum(tensor.numel() for tensor in bucket), dtype=dtype, device=device)
+            for bucket in buckets
+        ]
+        duration = timed_loop(lambda: bucketed_step(buckets, flat_buffers, args), device, args)
+        copy_duration = timed_loop(lambda: copy_step(buckets, flat_buffers), device, args)
+        print_bucketing_row(args, "bucketed", int(bucket_size), len(buckets), total_bytes, duration, copy_duration)
+        del flat_buffers
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_bucketing(args)
@@ -0,0 +1,193 @@
+import argparse
+import json
+import math
+from collections import defaultdict
+
+import numpy as np
+
+MODEL_VERSION = 1
+
+
+def _fit_segment(sizes, durations):
+    """
+    Hockney fit t = alpha + n * beta, weighted so that every point counts by its relative error
+    """
+    weights = 1.0 / durations
+    design = np.stack([np.ones_like(sizes), sizes], axis=1) * weights[:, None]
+    (alpha, beta), *_ = np.linalg.lstsq(design, durations * weights, rcond=None)
+    if alpha < 0:
+        # latency can't be negative, refit through the origin
+        alpha = 0.0
+        beta = np.sum(sizes * weights * weights * durations) / np.sum((sizes * weights) ** 2)
+    beta = max(beta, 0.0)
+    residuals = (alpha + beta * sizes - durations) / durations
+    return float(alpha), float(beta), float(np.sum(residuals**2))
+
+
+def fit_hockney(sizes, durations, max_segments=3, min_points=3):
+    """
+    Piecewise alpha-beta fit of duration vs message size.
+
+    Breakpoints (e.g. eager -> rendezvous, tree -> ring) are placed where splitting the scan into more
+    segments pays for its extra parameters (BIC over relative errors).
+    """
+    order = np.argsort(sizes)
+    sizes = np.asarray(sizes, dtype=np.float64)[order]
+    durations = np.asarray(durations, dtype=np.float64)[order]
+    n = len(sizes)
+
+    # segment_fits[(i, j)] = fit of the points i..j-1 as one segment
+    segment_fits = {}
+    for i in range(n):
+        for j in range(i + min_points, n + 1):
+            segment_fits[(i, j)] = _fit_segment(sizes[i:j], durations[i:j])
+
+    # best[k][j] = (sse, splits) of the first j points using k segments
+    best = [{0: (0.0, [])}]
+    for k in range(1, max_segments + 1):
+        best.append({})
+        for j in range(k * min_points, n + 1):
+            candidates = [
+                (best[k - 1][i][0] + segment_fits[(i, j)][2], best[k - 1][i][1] + [i])
+                for i in best[k - 1]
+                if (i, j) in segment_fits
+            ]
+            if len(candidates) > 0:
+                best[k][j] = min(candidates, key=lambda candidate: candidate[0])
+
+    chosen = None
+    for k in range(1, max_segments + 1):
+        if n not in best[k]:
+            continue
+        sse, starts = best[k][n]
+        # alpha, beta and the breakpoint position are free parameters of every segment
+        bic = n * math.log(max(sse, 1e-12) / n) + 3 * k * math.log(n)
+        if chosen is None or bic < chosen[0]:
+            chosen = (bic, starts)
+    if chosen is None:
+        # too few points to split, fit whatever there is as one segment
+        chosen = (None, [0])
+        segment_fits[(0, n)] = _fit_segment(sizes, durations)
+
+    starts = chosen[1]
+    ends = starts[1:] + [n]
+    segments = []
+    for start, end in zip(starts, ends):
+        alpha, beta, _ = segment_fits[(start, end)]
+        segments.append(
+            {
+                "min_bytes": float(sizes[start]),
+                "max_bytes": float(sizes[end - 1]),
+                "alpha": alpha,
+                "beta": beta,
+                # a flat or decreasing segment has no finite bandwidth, JSON has no Infinity
+                "bandwidth": 1.0 / beta if beta > 0 else None,
+            }
+        )
+    # breakpoints sit halfway (geometrically) between the last point of one segment and the first of the next
+    breakpoints = [
+        math.sqrt(previous["max_bytes"] * following["min_bytes"])
+        for previous, following in zip(segments[:-1], segments[1:])
+    ]
+    return {"segments": segments, "breakpoints": breakpoints}
+
+
+def fit_model(results, max_segments=3, min_points=3):
+    """
+    Fit one piecewise alpha-beta model per (op, world_size) from record_result() dictionaries
+    """
+    grouped = defaultdict(list)
+    for result in results:
+        grouped[(result["op"], int(result["world_size"]))].append(result)
+
+    model = {"version": MODEL_VERSION, "units": {"alpha": "s", "beta": "s/byte", "bandwidth": "bytes/s"}, "ops": {}}
+    for (op, world_size), group in sorted(grouped.items()):
+        fit = fit_hockney(
+            [result["bytes"] for result in group],
+            [result["duration"] for result in group],
+            max_segments=max_segments,
+            min_points=min_points,
+        )
+        fit["dtypes"] = sorted({result["dtype"] for result in group})
+        fit["num_points"] = len(group)
+        model["ops"].setdefault(op, {})[str(world_size)] = fit
+    return model
+
+
+def predict(model, op, world_size, num_bytes):
+    """
+    Predicted duration (s) of op on num_bytes per rank, using the closest fitted group size
+    """
+    fits = model["ops"][op]
+    # fall back to the nearest measured world size on a log scale
+    nearest = min(fits, key=lambda fitted: abs(math.log(int(fitted)) - math.log(world_size)))
+    segments = fits[nearest]["segments"]
+    segment = segments[-1]
+    for candidate, breakpoint in zip(segments, fits[nearest]["breakpoints"]):
+        if num_bytes < breakpoint:
+            segment = candidate
+            break
+    return segment["alpha"] + num_bytes * segment["beta"]
+
+
+def load_results(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_model(model, path):
+    with open(path, "w") as f:
+        json.dump(model, f, indent=2, allow_nan=False)
+
+
+def load_model(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def print_model(model):
+    for op, fits in model["ops"].items():
+        for world_size, fit in sorted(fits.items(), key=lambda item: int(item[0])):
+            print(f"{op} on {world_size} ranks ({fit['num_points']} points, dtypes {','.join(fit['dtypes'])})")
+            for segment in fit["segments"]:
+                bandwidth = "unbounded" if segment["bandwidth"] is None else f"{segment['bandwidth'] / 1e9:.3f} GB/s"
+                print(
+                    f"  [{segment['min_bytes']:.3g}, {segment['max_bytes']:.3g}] bytes: "
+                    f"alpha={segment['alpha'] * 1e6:.3f} us, 1/beta={bandwidth}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit and query alpha-beta models of collective performance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="Fit a model to --results-file JSON lines")
+    fit_parser.add_argument("results", nargs="+", help="JSON lines written with --results-file")
+    fit_parser.add_argument("--output", "-o", type=str, default="comm_model.json")
+    fit_parser.add_argument("--max-segments", type=int, default=3, help="Maximum number of protocol regimes per op")
+    fit_parser.add_argument("--min-points", type=int, default=3, help="Minimum scan points per regime")
+
+    query_parser = subparsers.add_parser("query", help="Predict the duration of a collective")
+    query_parser.add_argument("model", type=str)
+    query_parser.add_argument("--op", type=str, required=True)
+    query_parser.add_argument("--world-size", type=int, required=True)
+    query_parser.add_argument("--bytes", type=float, nargs="+", required=True)
+
+    args = parser.parse_args()
+    if args.command == "fit":
+        results = []
+        for path in args.results:
+            results += load_results(path)
+        model = fit_model(results, max_segments=args.max_segments, min_points=args.min_points)
+        save_model(model, args.output)
+        print_model(model)
+        print(f"Model written to {args.output}")
+    else:
+        model = load_model(args.model)
+        for num_bytes in args.bytes:
+            duration = predict(model, args.op, args.world_size, num_bytes)
+            print(f"{args.op} world_size={args.world_size} bytes={int(num_bytes)}: {duration * 1e6:.3f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.utils import (
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_bw,
+    get_device,
+    get_metric_strings,
+    get_scan_range,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    sync_all,
+)
+
+# Codecs whose encoded payload can be reduced by the backend as is
+CAST_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def make_gradient(numel, device, rank):
+    """
+    Gaussian noise whose scale varies from chunk to chunk (layer to layer), different on every rank
+    """
+    generator = torch.Generator().manual_seed(1234 + rank)
+    grad = torch.randn(numel, generator=generator) * 1e-3
+    chunk = 4096
+    num_chunks = (numel + chunk - 1) // chunk
+    scales = torch.exp(2 * torch.randn(num_chunks, generator=generator))
+    grad *= scales.repeat_interleave(chunk)[:numel]
+    return grad.to(device)
+
+
+def encode(codec, grad, args):
+    """
+    Compressed wire representation of grad as a list of tensors
+    """
+    if codec in CAST_DTYPES:
+        return [grad.to(CAST_DTYPES[codec])]
+    elif codec == "int8":
+        # absmax block quantization, one fp32 scale per --quant-block-size elements
+        block = args.quant_block_size
+        padded = torch.nn.functional.pad(grad, (0, (-grad.numel()) % block)).view(-1, block)
+        scales = padded.abs().amax(dim=1, keepdim=True).clamp_(min=1e-30) / 127
+        codes = torch.round(padded / scales).to(torch.int8)
+        return [codes.view(-1), scales.view(-1)]
+    elif codec == "topk":
+        k = max(1, int(grad.numel() * args.topk_ratio))
+        _, indices = torch.topk(grad.abs(), k, sorted=False)
+        return [grad[indices], indices]
+    else:
+        print_rank_0(f"codec {codec} is not supported")
+        exit(0)
+
+
+def decode(codec, payload, numel, args):
+    """
+    Inverse of encode() for one rank's payload, as an fp32 tensor of numel elements
+    """
+    if codec in CAST_DTYPES:
+        return payload[0].to(torch.float32)
+    elif codec == "int8":
+        codes, scales = payload
+        values = codes.view(-1, args.quant_block_size).to(torch.float32) * scales.view(-1, 1)
+        return values.view(-1)[:numel]
+    elif codec == "topk":
+        values, indices = payload
+        dense = torch.zeros(numel, dtype=torch.float32, device=values.device)
+        return dense.index_put_((indices,), values, accumulate=True)
+
+
+def reduces_in_backend(codec, args):
+    # Casts are all-reduced natively, quantized and sparse payloads have to be gathered and decoded per rank
+    return codec in CAST_DTYPES and args.compress_op == "all_reduce"
+
+
+def setup_gather_outputs(payload, world_size):
+    return [torch.empty(world_size * tensor.numel(), dtype=tensor.dtype, device=tensor.device) for tensor in payload]
+
+
+def communicate(codec, payload, outputs, args):
+    if reduces_in_backend(codec, args):
+        issue_comm_op("all_reduce", payload[0], None, args)
+        return [payload]
+    world_size = len(outputs[0]) // payload[0].numel()
+    for tensor, output in zip(payload, outputs):
+        issue_comm_op("all_gather", tensor, output, args)
+    # one payload per rank, as views of the gathered buffers
+    return [[output.view(world_size, -1)[rank] for output in outputs] for rank in range(world_size)]
+
+
+def combine(codec, gathered, numel, args):
+    decoded = [decode(codec, payload, numel, args) for payload in gathered]
+    if args.compress_op == "all_reduce":
+        return torch.stack(decoded).sum(dim=0) if len(decoded) > 1 else decoded[0]
+    return torch.cat(decoded)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def compressed_step(codec, grad, work, outputs, device, args):
+    # the fp32 codec reduces work in place, so every step starts from a fresh copy of the gradient (untimed)
+    work.copy_(grad)
+    synchronize(device)
+    start = time.perf_counter()
+    payload = encode(codec, work, args)
+    synchronize(device)
+    encoded = time.perf_counter()
+    gathered = communicate(codec, payload, outputs, args)
+    synchronize(device)
+    communicated = time.perf_counter()
+    result = combine(codec, gathered, grad.numel(), args)
+    synchronize(device)
+    end = time.perf_counter()
+    return result, (encoded - start, communicated - encoded, end - communicated)
+
+
+def reference_result(grad, device, args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    if args.compress_op == "all_reduce":
+        reference = grad.clone()
+        issue_comm_op("all_reduce", reference, None, args)
+    else:
+        reference = torch.empty(grad.numel() * dist.get_world_size(), dtype=grad.dtype, device=device)
+        issue_comm_op("all_gather", grad, reference, args)
+    return reference
+
+
+def timed_codec(codec, grad, reference, device, args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    work = torch.empty_like(grad)
+    payload = encode(codec, grad, args)
+    wire_bytes = sum(tensor.numel() * tensor.element_size() for tensor in payload)
+    outputs = None if reduces_in_backend(codec, args) else setup_gather_outputs(payload, dist.get_world_size())
+
+    sync_all()
+    for i in range(args.warmups):
+        compressed_step(codec, grad, work, outputs, device, args)
+    sync_all()
+
+    stages = torch.zeros(3, dtype=torch.float64)
+    for i in range(args.trials):
+        result, durations = compressed_step(codec, grad, work, outputs, device, args)
+        stages += torch.tensor(durations, dtype=torch.float64)
+    stages /= args.trials
+
+    error = result - reference
+    rel_error = (torch.linalg.vector_norm(error) / torch.linalg.vector_norm(reference)).item()
+    max_error = error.abs().max().item()
+    return wire_bytes, stages.tolist(), rel_error, max_error
+
+
+def print_compression_header(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    tput = f"Eff. tput ({args.bw_unit})"
+    header = f"\n---- Compressed {args.compress_op} on {dist.get_world_size()} devices for {args.trials} trials ----------------------\n"
+    header += f"{'fp32 payload':15s} {'Codec':8s} {'Wire / GPU':12s} {'Encode':12s} {'Comm':12s} {'Decode':12s} {'Total':12s} {tput:18s} {'Rel. error':12s} {'Max error':12s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+
+
+def timed_compression_payload(numel, device, args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    grad = make_gradient(numel, device, dist.get_rank())
+    reference = reference_result(grad, device, args)
+    size = numel * grad.element_size()
+
+    for codec in args.codecs:
+        wire_bytes, (encode_time, comm_time, decode_time), rel_error, max_error = timed_codec(
+            codec, grad, reference, device, args
+        )
+        total_time = encode_time + comm_time + decode_time
+        # effective bandwidth: the uncompressed fp32 payload moved in the end-to-end time
+        tput, _ = get_bw(args.compress_op, size, total_time, args)
+        tput_str = get_metric_strings(args, tput, 0, total_time)[0]
+        times = [get_metric_strings(args, 0, 0, duration)[2] for duration in (encode_time, comm_time, decode_time, total_time)]
+        size_str = str(size) if args.raw else bytes_to_human_readable(size)
+        wire_str = str(wire_bytes) if args.raw else bytes_to_human_readable(wire_bytes)
+        print_rank_0(
+            f"{size_str:15s} {codec:8s} {wire_str:12s} {times[0]:12s} {times[1]:12s} {times[2]:12s} {times[3]:12s} "
+            f"{tput_str:18s} {rel_error:<12.3e} {max_error:<12.3e}"
+        )
+
+
+def run_compression(args):
+    print_compression_header(args)
+    device = get_device(args)
+
+    if args.scan:
+        for payload in get_scan_range(args):
+            timed_compression_payload(payload, device, args)
+    else:
+        timed_compression_payload(2 ** int(args.elements_per_gpu), device, args)
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_compression(args)
@@ -7,3 +7,5 @@ DEFAULT_DIST = 'torch'
 DEFAULT_MAXSIZE = 24
 ELEMENT_UNITS=1024**2 # Units in which cli flag --elements-per-gpu is defined
 TORCH_DISTRIBUTED_DEFAULT_PORT = 29500
+DEFAULT_BUCKET_SIZES = [1e6, 5e6, 2.5e7, 1e8, 5e8] # In elements, like DeepSpeed's allreduce_bucket_size
+RUN_ALL_OPS = ['all_reduce', 'all_gather', 'all_to_all', 'broadcast', 'pt2pt', 'overlap', 'async_window', 'compression', 'bucketing', 'hierarchical', 'straggler', 'trace_replay']
@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.utils import (
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_bw,
+    get_device,
+    get_metric_strings,
+    get_node_groups,
+    get_payload_views,
+    get_scan_range,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    setup_single_payload,
+    sync_all,
+)
+
+
+def setup_workspace(comm_op, input, args):
+    """
+    Scratch buffers of the two-level collectives, allocated once per payload outside the timed loop
+    """
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    intra_group, _ = get_node_groups(args)
+    ranks_per_node = dist.get_world_size(group=intra_group)
+    numel = input.numel()
+    if comm_op == "all_reduce":
+        # reduce_scatter needs a multiple of the node size, pad the flat buffer if the payload isn't one
+        padded_numel = ranks_per_node * ((numel + ranks_per_node - 1) // ranks_per_node)
+        padded = input if padded_numel == numel else torch.zeros(padded_numel, dtype=input.dtype, device=input.device)
+        shard = torch.empty(padded_numel // ranks_per_node, dtype=input.dtype, device=input.device)
+        return padded, shard
+    elif comm_op == "all_gather":
+        return (torch.empty(numel * ranks_per_node, dtype=input.dtype, device=input.device),)
+
+
+def hierarchical_all_reduce(input, workspace, args):
+    """
+    reduce_scatter within the node, all_reduce of the shards across nodes, all_gather within the node
+    """
+    intra_group, inter_group = get_node_groups(args)
+    padded, shard = workspace
+    if padded is not input:
+        padded[: input.numel()].copy_(input)
+    issue_comm_op("reduce_scatter", padded, shard, args, group=intra_group)
+    issue_comm_op("all_reduce", shard, None, args, group=inter_group)
+    issue_comm_op("all_gather", shard, padded, args, group=intra_group)
+    if padded is not input:
+        input.copy_(padded[: input.numel()])
+
+
+def hierarchical_all_gather(input, output, workspace, args):
+    """
+    all_gather within the node, then all_gather of the node blocks across nodes
+    """
+    intra_group, inter_group = get_node_groups(args)
+    (node_output,) = workspace
+    issue_comm_op("all_gather", input, node_output, args, group=intra_group)
+    # with ranks numbered node by node, node-major order is global rank order
+    issue_comm_op("all_gather", node_output, output, args, group=inter_group)
+
+
+def run_collective(comm_op, hierarchical, input, output, workspace, args):
+    if not hierarchical:
+        issue_comm_op(comm_op, input, output, args)
+    elif comm_op == "all_reduce":
+        hierarchical_all_reduce(input, workspace, args)
+    else:
+        hierarchical_all_gather(input, output, workspace, args)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def check_hierarchical(comm_op, input, output, workspace, args):
+    """
+    Both implementations on the same small-integer data, which every dtype sums exactly
+    """
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    generator = torch.Generator().manual_seed(dist.get_rank())
+    data = torch.randint(0, 4, (input.numel(),), generator=generator).to(input.dtype).to(input.device)
+    results = []
+    for hierarchical in (False, True):
+        input.copy_(data)
+        run_collective(comm_op, hierarchical, input, output, workspace, args)
+        results.append((output if comm_op == "all_gather" else input).clone())
+    return torch.equal(results[0], results[1])
+
+
+def timed_collective(comm_op, hierarchical, input, output, workspace, device, args):
+    sync_all()
+    for i in range(args.warmups):
+        run_collective(comm_op, hierarchical, input, output, workspace, args)
+    sync_all()
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        run_collective(comm_op, hierarchical, input, output, workspace, args)
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def print_hierarchical_header(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    intra_group, _ = get_node_groups(args)
+    ranks_per_node = dist.get_world_size(group=intra_group)
+    num_nodes = dist.get_world_size() // ranks_per_node
+    flat_busbw = f"Flat BusBW ({args.bw_unit})"
+    hier_busbw = f"Hier. BusBW ({args.bw_unit})"
+    header = f"\n---- Flat vs hierarchical collectives on {num_nodes} nodes x {ranks_per_node} devices for {args.trials} trials ----------------------\n"
+    header += f"{'Payload / GPU':20s} {'Op':12s} {'Flat':15s} {'Hierarchical':15s} {flat_busbw:20s} {hier_busbw:20s} {'Speedup':10s} {'Check':8s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+
+
+def timed_hierarchical_payload(comm_op, input, output, device, args):
+    workspace = setup_workspace(comm_op, input, args)
+    matches = check_hierarchical(comm_op, input, output, workspace, args)
+    flat_duration = timed_collective(comm_op, False, input, output, workspace, device, args)
+    hier_duration = timed_collective(comm_op, True, input, output, workspace, device, args)
+
+    size = input.element_size() * input.nelement()
+    _, flat_busbw = get_bw(comm_op, size, flat_duration, args)
+    _, hier_busbw = get_bw(comm_op, size, hier_duration, args)
+    _, flat_busbw_str, flat_str = get_metric_strings(args, 0, flat_busbw, flat_duration)
+    _, hier_busbw_str, hier_str = get_metric_strings(args, 0, hier_busbw, hier_duration)
+    if not args.raw:
+        size = bytes_to_human_readable(size)
+    check = "OK" if matches else "MISMATCH"
+    print_rank_0(
+        f"{size:<20} {comm_op:12s} {flat_str:15s} {hier_str:15s} {flat_busbw_str:20s} {hier_busbw_str:20s} "
+        f"{flat_duration / hier_duration:<10.2f} {check:8s}"
+    )
+
+
+def run_hierarchical(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    print_hierarchical_header(args)
+    intra_group, _ = get_node_groups(args)
+    if dist.get_world_size(group=intra_group) in (1, dist.get_world_size()):
+        print_rank_0("WARNING: a single node or a single rank per node, both implementations are effectively flat")
+    device = get_device(args)
+
+    for comm_op in ("all_reduce", "all_gather"):
+        if args.scan:
+            for payload in get_scan_range(args):
+                payload_views = get_payload_views(args, elements_per_gpu=payload, op=comm_op)
+                if payload_views is None:
+                    break
+                input, output = payload_views
+                timed_hierarchical_payload(comm_op, input, output, device, args)
+        else:
+            elements_per_gpu = 2 ** int(args.elements_per_gpu)
+            input, output = setup_single_payload(args, elements_per_gpu=elements_per_gpu, op=comm_op)
+            timed_hierarchical_payload(comm_op, input, output, device, args)
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_hierarchical(args)
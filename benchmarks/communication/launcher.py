@@ -0,0 +1,112 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import torch.multiprocessing as mp
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def local_env(rank, world_size, master_port):
+    """
+    The rendezvous variables torchrun would set, which init_torch_distributed reads through env2int
+    """
+    return {
+        "MASTER_ADDR": "127.0.0.1",
+        "MASTER_PORT": str(master_port),
+        "RANK": str(rank),
+        "LOCAL_RANK": str(rank),
+        "WORLD_SIZE": str(world_size),
+        "LOCAL_WORLD_SIZE": str(world_size),
+    }
+
+
+def _worker(rank, fn, args, world_size, master_port, queue):
+    os.environ.update(local_env(rank, world_size, master_port))
+    args.local_rank = rank
+    fn(args, rank)
+
+    import torch.distributed as dist
+
+    from communication.utils import RESULTS
+
+    queue.put((rank, list(RESULTS)))
+    if dist.is_initialized():
+        # gloo's async work threads otherwise abort the interpreter at exit
+        dist.destroy_process_group()
+
+
+def spawn_local(fn, args, world_size):
+    """
+    Run fn(args, rank) on world_size local processes and return {rank: results recorded by that rank}
+    """
+    master_port = find_free_port()
+    context = mp.get_context("spawn")
+    queue = context.SimpleQueue()
+    processes = mp.start_processes(
+        _worker,
+        args=(fn, args, world_size, master_port, queue),
+        nprocs=world_size,
+        join=False,
+        start_method="spawn",
+    )
+
+    # Drain while waiting, a full queue would block the workers forever
+    results = {}
+    finished = False
+    while not finished:
+        finished = processes.join(timeout=0.1)
+        while not queue.empty():
+            rank, rank_results = queue.get()
+            results[rank] = rank_results
+    return results
+
+
+def launch_script(script, script_args, world_size, stdout=None, extra_env=None):
+    """
+    Run an arbitrary benchmark script on world_size local processes, like torchrun --nproc_per_node
+    """
+    master_port = find_free_port()
+    processes = []
+    for rank in range(world_size):
+        env = dict(os.environ, **(extra_env or {}), **local_env(rank, world_size, master_port))
+        processes.append(
+            subprocess.Popen([sys.executable, script] + script_args, env=env, stdout=stdout, stderr=stdout)
+        )
+
+    returncode = 0
+    while any(process.poll() is None for process in processes):
+        failed = [process.returncode for process in processes if process.returncode not in (None, 0)]
+        if len(failed) > 0 and returncode == 0:
+            returncode = failed[0]
+            # one dead rank hangs the others in their next collective
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+        time.sleep(0.1)
+    if returncode == 0:
+        returncode = next((process.returncode for process in processes if process.returncode != 0), 0)
+    return returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a communication benchmark on N local ranks")
+    parser.add_argument("--nproc", "-n", type=int, required=True, help="Number of local ranks")
+    parser.add_argument("script", type=str, help="Benchmark script, e.g. all_reduce.py")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER, help="Arguments passed to every rank")
+    args = parser.parse_args()
+    sys.exit(launch_script(args.script, args.script_args, args.nproc))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+import time
+
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.utils import (
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_device,
+    get_payload_views,
+    get_scan_range,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    setup_single_payload,
+    sync_all,
+)
+
+
+def print_overlap_header(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    m, n, k = args.overlap_gemm
+    header = f"\n---- Overlap of {args.overlap_op} with {args.overlap_gemms}x mm({m}x{n}, {n}x{k}) on {dist.get_world_size()} devices for {args.trials} trials ----------------------\n"
+    header += f"{'Payload / GPU':20s} {'Comm (ms)':15s} {'Compute (ms)':15s} {'Overlapped (ms)':18s} {'Ideal (ms)':15s} {'Efficiency':15s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+
+
+def setup_gemm(args, device):
+    # Same operand layout as sizing/utils.py::benchmark_mm, generated directly on the device
+    m, n, k = args.overlap_gemm
+    dtype = torch.half if device.type == "cuda" else torch.float32
+    A = torch.randn(m, n, device=device, dtype=dtype)
+    B = torch.randn(n, k, device=device, dtype=dtype)
+    C = torch.empty(m, k, device=device, dtype=dtype)
+    return A, B, C
+
+
+def run_gemms(A, B, C, args):
+    with torch.no_grad():
+        for i in range(args.overlap_gemms):
+            torch.mm(A, B, out=C)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timed_compute(A, B, C, device, args):
+    sync_all()
+    for i in range(args.warmups):
+        run_gemms(A, B, C, args)
+    sync_all()
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        run_gemms(A, B, C, args)
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def timed_comm(input, output, device, args):
+    sync_all()
+    for i in range(args.warmups):
+        issue_comm_op(args.overlap_op, input, output, args)
+    sync_all()
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        issue_comm_op(args.overlap_op, input, output, args)
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def overlapped_step(input, output, A, B, C, device, args, compute_stream):
+    if device.type == "cuda":
+        # NCCL runs the collective on its own stream, GEMMs go on a second compute stream
+        work = issue_comm_op(args.overlap_op, input, output, args, async_op=True)
+        with torch.cuda.stream(compute_stream):
+            run_gemms(A, B, C, args)
+        work.wait()
+    else:
+        # torch.mm releases the GIL, so a host thread computes while this thread communicates
+        worker = threading.Thread(target=run_gemms, args=(A, B, C, args))
+        worker.start()
+        issue_comm_op(args.overlap_op, input, output, args)
+        worker.join()
+
+
+def timed_overlap(input, output, A, B, C, device, args):
+    compute_stream = torch.cuda.Stream(device) if device.type == "cuda" else None
+
+    sync_all()
+    for i in range(args.warmups):
+        overlapped_step(input, output, A, B, C, device, args, compute_stream)
+    sync_all()
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        overlapped_step(input, output, A, B, C, device, args, compute_stream)
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def timed_overlap_payload(input, output, A, B, C, device, args):
+    comm_time = timed_comm(input, output, device, args)
+    compute_time = timed_compute(A, B, C, device, args)
+    overlap_time = timed_overlap(input, output, A, B, C, device, args)
+
+    # 1.0 means the shorter of the two is fully hidden, 0.0 means the two ran back to back
+    ideal_time = max(comm_time, compute_time)
+    hideable_time = min(comm_time, compute_time)
+    efficiency = (comm_time + compute_time - overlap_time) / hideable_time if hideable_time > 0 else 0.0
+
+    size = input.element_size() * input.nelement()
+    if not args.raw:
+        size = bytes_to_human_readable(size)
+
+    print_rank_0(
+        f"{size:<20} {comm_time * 1e3:<15.3f} {compute_time * 1e3:<15.3f} {overlap_time * 1e3:<18.3f} "
+        f"{ideal_time * 1e3:<15.3f} {efficiency:<15.3f}"
+    )
+    return comm_time, compute_time, overlap_time, efficiency
+
+
+def run_overlap(args):
+    print_overlap_header(args)
+
+    device = get_device(args)
+    A, B, C = setup_gemm(args, device)
+
+    if args.scan:
+        for payload in get_scan_range(args):
+            payload_views = get_payload_views(args, elements_per_gpu=payload, op=args.overlap_op)
+            if payload_views is None:
+                break
+            input, output = payload_views
+            timed_overlap_payload(input, output, A, B, C, device, args)
+    else:
+        elements_per_gpu = 2 ** int(args.elements_per_gpu)
+        input, output = setup_single_payload(args, elements_per_gpu=elements_per_gpu, op=args.overlap_op)
+        timed_overlap_payload(input, output, A, B, C, device, args)
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_overlap(args)
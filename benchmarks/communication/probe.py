@@ -0,0 +1,240 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.comm_model import load_model, predict
+from communication.utils import (
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_bw,
+    get_device,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    setup_single_payload,
+    sync_all,
+)
+
+
+class RingBuffer:
+    """
+    The last capacity (timestamp, busbw) samples of one probe series, without any allocation after construction
+    """
+
+    def __init__(self, capacity):
+        self.timestamps = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.count = 0
+
+    def append(self, timestamp, value):
+        index = self.count % len(self.values)
+        self.timestamps[index] = timestamp
+        self.values[index] = value
+        self.count += 1
+
+    def latest(self, n=None):
+        """
+        The last n (default: all stored) values, oldest first
+        """
+        stored = min(self.count, len(self.values))
+        n = stored if n is None else min(n, stored)
+        indices = (self.count - n + np.arange(n)) % len(self.values)
+        return self.values[indices]
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timed_probe(comm_op, input, output, device, args):
+    sync_all()
+    for i in range(args.warmups):
+        issue_comm_op(comm_op, input, output, args)
+    synchronize(device)
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        issue_comm_op(comm_op, input, output, args)
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def probe_sweep(payloads, device, args):
+    """
+    One cheap pass over every (op, size), returns {(op, bytes): busbw in bytes/s}
+    """
+    samples = {}
+    for (comm_op, size), (input, output) in payloads.items():
+        duration = timed_probe(comm_op, input, output, device, args)
+        # Prometheus wants base units, keep bytes/s regardless of --bw-unit
+        _, busbw = get_bw(comm_op, size, duration, args)
+        samples[(comm_op, size)] = busbw / 8 if args.bw_unit == "Gbps" else busbw
+    return samples
+
+
+def load_baseline(args, world_size, payloads):
+    """
+    Expected busbw of every series from an alpha-beta model (comm_model.py), if one is given
+    """
+    if args.probe_baseline is None:
+        return {}
+    model = load_model(args.probe_baseline)
+    baseline = {}
+    for comm_op, size in payloads:
+        if comm_op in model["ops"]:
+            duration = predict(model, comm_op, world_size, size)
+            _, busbw = get_bw(comm_op, size, duration, args)
+            baseline[(comm_op, size)] = busbw / 8 if args.bw_unit == "Gbps" else busbw
+    return baseline
+
+
+def check_alerts(history, baseline, args):
+    """
+    Series whose recent busbw dropped more than --alert-frac below their baseline
+    """
+    alerts = {}
+    for series, buffer in history.items():
+        if buffer.count < args.alert_window:
+            alerts[series] = False
+            continue
+        if series not in baseline:
+            # no model for this series, the first sweeps are the baseline
+            baseline[series] = float(np.median(buffer.latest()))
+        recent = float(np.mean(buffer.latest(args.alert_window)))
+        alerts[series] = recent < (1 - args.alert_frac) * baseline[series]
+    return alerts
+
+
+def format_metrics(history, baseline, alerts, sweeps, last_sweep):
+    """
+    Prometheus text exposition format
+    """
+    lines = [
+        "# HELP comm_probe_sweeps_total Probe sweeps completed.",
+        "# TYPE comm_probe_sweeps_total counter",
+        f"comm_probe_sweeps_total {sweeps}",
+        "# HELP comm_probe_last_sweep_timestamp_seconds Unix time of the last probe sweep.",
+        "# TYPE comm_probe_last_sweep_timestamp_seconds gauge",
+        f"comm_probe_last_sweep_timestamp_seconds {last_sweep:.3f}",
+    ]
+    gauges = [
+        ("busbw_bytes_per_second", "Bus bandwidth of the last sweep.", lambda values: values[-1]),
+        ("busbw_mean_bytes_per_second", "Mean bus bandwidth over the ring buffer.", np.mean),
+        ("busbw_min_bytes_per_second", "Minimum bus bandwidth over the ring buffer.", np.min),
+        ("busbw_p10_bytes_per_second", "10th percentile bus bandwidth over the ring buffer.", lambda values: np.percentile(values, 10)),
+    ]
+    for name, description, stat in gauges:
+        lines += [f"# HELP comm_probe_{name} {description}", f"# TYPE comm_probe_{name} gauge"]
+        for (comm_op, size), buffer in history.items():
+            if buffer.count > 0:
+                lines.append(f'comm_probe_{name}{{op="{comm_op}",bytes="{size}"}} {float(stat(buffer.latest())):.6g}')
+    lines += ["# HELP comm_probe_baseline_bytes_per_second Expected bus bandwidth.", "# TYPE comm_probe_baseline_bytes_per_second gauge"]
+    for (comm_op, size), value in baseline.items():
+        lines.append(f'comm_probe_baseline_bytes_per_second{{op="{comm_op}",bytes="{size}"}} {value:.6g}')
+    lines += ["# HELP comm_probe_alert 1 if the bus bandwidth dropped below the baseline.", "# TYPE comm_probe_alert gauge"]
+    for (comm_op, size), alert in alerts.items():
+        lines.append(f'comm_probe_alert{{op="{comm_op}",bytes="{size}"}} {int(alert)}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(text, path):
+    # node_exporter's textfile collector may read at any time, never let it see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def serve_metrics(port, state):
+    """
+    Serve state["text"] on http://127.0.0.1:port/metrics from a daemon thread
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = state["text"].encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_probe(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    device = get_device(args)
+    # a handful of small buffers, allocated once for the lifetime of the probe
+    payloads = {}
+    for comm_op in args.probe_ops:
+        for exponent in args.probe_sizes:
+            input, output = setup_single_payload(args, elements_per_gpu=2**exponent, op=comm_op)
+            payloads[(comm_op, input.element_size() * input.nelement())] = (input, output)
+
+    is_reporter = dist.get_rank() == 0
+    history = {series: RingBuffer(args.probe_history) for series in payloads}
+    baseline = load_baseline(args, dist.get_world_size(), payloads)
+    state = {"text": ""}
+    server = None
+    if is_reporter and args.metrics_port is not None:
+        server = serve_metrics(args.metrics_port, state)
+    print_rank_0(
+        f"Probing {', '.join(args.probe_ops)} at {', '.join(bytes_to_human_readable(size) for _, size in payloads)} "
+        f"every {args.probe_interval} s on {dist.get_world_size()} devices"
+    )
+
+    sweeps = 0
+    try:
+        while args.probe_sweeps is None or sweeps < args.probe_sweeps:
+            started = time.time()
+            samples = probe_sweep(payloads, device, args)
+            sweeps += 1
+            if is_reporter:
+                for series, busbw in samples.items():
+                    history[series].append(started, busbw)
+                alerts = check_alerts(history, baseline, args)
+                for (comm_op, size), alert in alerts.items():
+                    if alert:
+                        recent = np.mean(history[(comm_op, size)].latest(args.alert_window))
+                        threshold = (1 - args.alert_frac) * baseline[(comm_op, size)]
+                        print(
+                            f"ALERT: {comm_op} {bytes_to_human_readable(size)} busbw {bytes_to_human_readable(recent)}/s "
+                            f"is below {bytes_to_human_readable(threshold)}/s",
+                            flush=True,
+                        )
+                state["text"] = format_metrics(history, baseline, alerts, sweeps, started)
+                if args.metrics_file is not None:
+                    write_metrics_file(state["text"], args.metrics_file)
+            # every rank sleeps the same, the barrier of the next sweep lines them up again
+            time.sleep(max(0.0, args.probe_interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        pass
+    if server is not None:
+        server.shutdown()
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_probe(args)
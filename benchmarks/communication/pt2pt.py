@@ -1,26 +1,36 @@
 import os
+import socket
 import sys
+import time
 
+import numpy as np
 import torch
 
 COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
 sys.path.append(COMMS_BENCH_DIR)
 
 from communication.utils import (
+    adaptive_scan,
     benchmark_parser,
     bytes_to_human_readable,
+    create_trial_events,
     get_bw,
+    get_device,
     get_metric_strings,
+    get_payload_views,
     get_scan_range,
     init_processes,
+    issue_comm_op,
     print_header,
     print_rank_0,
+    record_result,
     setup_single_payload,
     sync_all,
+    trial_durations,
 )
 
 
-def timed_pt2pt(input, start_event, end_event, args):
+def timed_pt2pt(input, trial_events, args):
     if args.dist == 'torch':
         import torch.distributed as dist
     elif args.dist == 'deepspeed':
@@ -42,7 +52,7 @@ def timed_pt2pt(input, start_event, end_event, args):
     sync_all()
 
     # time the actual comm op trials times and average it
-    start_event.record()
+    trial_events[0].record()
     for i in range(args.trials):
         if dist.get_rank() == 0:
             if args.async_op:
@@ -54,10 +64,10 @@ def timed_pt2pt(input, start_event, end_event, args):
                 dist.irecv(input, src=0)
             else:
                 dist.recv(input, src=0)
-
-    end_event.record()
+        trial_events[i + 1].record()
     sync_all()
-    duration = start_event.elapsed_time(end_event) / 1000
+    samples = trial_durations(trial_events)
+    duration = sum(samples)
 
     # maintain and clean performance data
     avg_duration = duration / args.trials
@@ -66,33 +76,263 @@ def timed_pt2pt(input, start_event, end_event, args):
     tput_str, busbw_str, duration_str = get_metric_strings(args, tput, busbw, avg_duration)
     desc = f'{input.nelement()}x{input.element_size()}'
 
+    result = record_result(args, 'pt2pt', size, avg_duration, samples=samples)
+
     if not args.raw:
         size = bytes_to_human_readable(size)
 
     print_rank_0(f"{size:<20} {desc:25s} {duration_str:20s} {tput_str:20s} {busbw_str:20s}")
+    return result
+
+
+def measure_pt2pt(elements_per_gpu, trial_events, args):
+    payload_views = get_payload_views(args, elements_per_gpu=elements_per_gpu, op="pt2pt")
+    if payload_views is None:
+        return None
+    input, _ = payload_views
+    return timed_pt2pt(input, trial_events, args)
 
 
 def run_pt2pt(args):
 
     print_header(args, 'pt2pt')
-    start_event = torch.cuda.Event(enable_timing=True)
-    end_event = torch.cuda.Event(enable_timing=True)
+    trial_events = create_trial_events(args)
 
-    if args.scan:
+    if args.scan and args.adaptive_scan:
+        adaptive_scan('pt2pt', lambda elements_per_gpu: measure_pt2pt(elements_per_gpu, trial_events, args), args)
+    elif args.scan:
         payloads = get_scan_range(args)
         for payload in payloads:
-            input, _ = setup_single_payload(
-                args, elements_per_gpu=payload, op="pt2pt"
-            )
-            timed_pt2pt(input, start_event, end_event, args)
+            payload_views = get_payload_views(args, elements_per_gpu=payload, op="pt2pt")
+            if payload_views is None:
+                break
+            input, _ = payload_views
+            timed_pt2pt(input, trial_events, args)
     else:
         elements_per_gpu = 2 ** int(args.elements_per_gpu)
         input, _ = setup_single_payload(args, elements_per_gpu=elements_per_gpu, op="pt2pt")
-        timed_pt2pt(input, start_event, end_event, args)
+        timed_pt2pt(input, trial_events, args)
+
+
+def round_robin_pairs(world_size):
+    """
+    Circle-method tournament: every round is a set of disjoint pairs and every pair meets exactly once
+    """
+    ranks = list(range(world_size))
+    if world_size % 2 == 1:
+        ranks.append(None)  # bye
+    n = len(ranks)
+    rounds = []
+    for _ in range(n - 1):
+        pairs = []
+        for i in range(n // 2):
+            a, b = ranks[i], ranks[n - 1 - i]
+            if a is not None and b is not None:
+                pairs.append((min(a, b), max(a, b)))
+        rounds.append(pairs)
+        ranks = [ranks[0], ranks[-1]] + ranks[1:-1]
+    return rounds
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timed_send_recv(input, peer, sender, device, args):
+    import torch.distributed as dist
+
+    for i in range(args.warmups):
+        if sender:
+            dist.send(input, peer)
+        else:
+            dist.recv(input, src=peer)
+    synchronize(device)
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        if sender:
+            dist.send(input, peer)
+        else:
+            dist.recv(input, src=peer)
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def timed_bidirectional(input, output, peer, device, args):
+    import torch.distributed as dist
+
+    def exchange():
+        handles = [dist.isend(input, peer), dist.irecv(output, src=peer)]
+        for handle in handles:
+            handle.wait()
+
+    for i in range(args.warmups):
+        exchange()
+    synchronize(device)
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        exchange()
+    synchronize(device)
+    return (time.perf_counter() - start) / args.trials
+
+
+def timed_ping_pong(message, peer, initiator, device, args):
+    import torch.distributed as dist
+
+    def ping_pong():
+        if initiator:
+            dist.send(message, peer)
+            dist.recv(message, src=peer)
+        else:
+            dist.recv(message, src=peer)
+            dist.send(message, peer)
+
+    for i in range(args.warmups):
+        ping_pong()
+    synchronize(device)
+
+    start = time.perf_counter()
+    for i in range(args.trials):
+        ping_pong()
+    synchronize(device)
+    # one-way latency is half a round trip
+    return (time.perf_counter() - start) / args.trials / 2
+
+
+def print_pair_matrix(title, matrix, hosts, fmt):
+    world_size = matrix.shape[0]
+    corner = "src \\ dst"
+    lines = [f"\n{title}", f"{corner:>10s} " + " ".join(f"{dst:>9d}" for dst in range(world_size))]
+    for src in range(world_size):
+        row = " ".join(
+            f"{'-':>9s}" if src == dst else f"{matrix[src, dst]:>9{fmt}}" for dst in range(world_size)
+        )
+        lines.append(f"{src:>10d} {row}   {hosts[src]}")
+    print_rank_0("\n".join(lines))
+
+
+def find_pair_outliers(uni_bw, bidir_bw, latency, hosts, args):
+    # NVLink and network pairs have very different baselines, so compare intra- and inter-node pairs separately
+    world_size = uni_bw.shape[0]
+    outliers = []
+    for intra_node in (True, False):
+        pairs = [
+            (src, dst)
+            for src in range(world_size)
+            for dst in range(world_size)
+            if src != dst and (hosts[src] == hosts[dst]) == intra_node
+        ]
+        if len(pairs) == 0:
+            continue
+        link = "intra-node" if intra_node else "inter-node"
+        for name, matrix, low_is_bad in (
+            ("unidirectional bw", uni_bw, True),
+            ("bidirectional bw", bidir_bw, True),
+            ("latency", latency, False),
+        ):
+            median = np.median([matrix[pair] for pair in pairs])
+            for src, dst in pairs:
+                value = matrix[src, dst]
+                if low_is_bad:
+                    bad = value < (1 - args.pair_outlier_frac) * median
+                else:
+                    bad = value > (1 + args.pair_outlier_frac) * median
+                if bad:
+                    outliers.append((src, dst, link, name, value, median))
+    return outliers
+
+
+def run_pt2pt_all_pairs(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    world_size = dist.get_world_size()
+    rank = dist.get_rank()
+    device = get_device(args)
+
+    elements_per_gpu = 2 ** int(args.elements_per_gpu)
+    input, output = setup_single_payload(args, elements_per_gpu=elements_per_gpu, op="all_to_all")
+    message = torch.ones(1, dtype=input.dtype, device=device)
+    size = input.element_size() * input.nelement()
+
+    # Row `src` of each matrix is filled in by the rank that measured it
+    uni_time = torch.zeros(world_size, dtype=torch.float64)  # indexed by src, measured by the receiver
+    bidir_time = torch.zeros(world_size, dtype=torch.float64)
+    latency = torch.zeros(world_size, dtype=torch.float64)
+
+    rounds = round_robin_pairs(world_size)
+    print_rank_0(
+        f"\n---- All-pairs pt2pt of {bytes_to_human_readable(size)} on {world_size} devices: "
+        f"{len(rounds)} rounds, {args.trials} trials per pair ----------------------"
+    )
+    for pairs in rounds:
+        peer = None
+        for a, b in pairs:
+            if rank == a:
+                peer = b
+            elif rank == b:
+                peer = a
+        low = peer is not None and rank < peer
+
+        # lower rank sends first, then the direction is reversed
+        for phase_sender in (True, False):
+            sync_all()
+            if peer is not None:
+                sender = low == phase_sender
+                duration = timed_send_recv(input, peer, sender, device, args)
+                if not sender:
+                    uni_time[peer] = duration
+        sync_all()
+        if peer is not None:
+            bidir_time[peer] = timed_bidirectional(input, output, peer, device, args)
+        sync_all()
+        if peer is not None:
+            latency[peer] = timed_ping_pong(message, peer, low, device, args)
+
+    # Single collective to bring every rank's measurements to everyone
+    local = torch.stack([uni_time, bidir_time, latency]).to(device)
+    gathered = torch.zeros(world_size * local.numel(), dtype=local.dtype, device=device)
+    issue_comm_op("all_gather", local.view(-1), gathered, args)
+    gathered = gathered.view(world_size, 3, world_size).cpu().numpy()
+    hosts = [None] * world_size
+    dist.all_gather_object(hosts, socket.gethostname())
+
+    # gathered[measurer, metric, peer]; uni_time rows were recorded by the receiver
+    uni_bw = np.zeros((world_size, world_size))
+    bidir_bw = np.zeros((world_size, world_size))
+    latency_us = np.zeros((world_size, world_size))
+    scale = 8 if args.bw_unit == "Gbps" else 1
+    for receiver in range(world_size):
+        for src in range(world_size):
+            if src == receiver:
+                continue
+            uni_bw[src, receiver] = scale * size / gathered[receiver, 0, src] / 1e9
+            bidir_bw[src, receiver] = scale * 2 * size / gathered[receiver, 1, src] / 1e9
+            latency_us[src, receiver] = gathered[receiver, 2, src] * 1e6
+
+    print_pair_matrix(f"Unidirectional bandwidth ({args.bw_unit})", uni_bw, hosts, ".2f")
+    print_pair_matrix(f"Bidirectional bandwidth ({args.bw_unit})", bidir_bw, hosts, ".2f")
+    print_pair_matrix("Latency (us)", latency_us, hosts, ".2f")
+
+    outliers = find_pair_outliers(uni_bw, bidir_bw, latency_us, hosts, args)
+    print_rank_0(f"\nOutlier pairs (>{args.pair_outlier_frac:.0%} from the median): {len(outliers)}")
+    for src, dst, link, name, value, median in outliers:
+        print_rank_0(
+            f"  {src:>4d} ({hosts[src]}) -> {dst:>4d} ({hosts[dst]}) {link:10s} {name:18s} {value:10.2f} (median {median:.2f})"
+        )
+    sync_all()
+    return uni_bw, bidir_bw, latency_us, outliers
 
 
 if __name__ == "__main__":
     args = benchmark_parser().parse_args()
     rank = args.local_rank
     init_processes(local_rank=rank, args=args)
-    run_pt2pt(args)
+    if args.all_pairs:
+        run_pt2pt_all_pairs(args)
+    else:
+        run_pt2pt(args)
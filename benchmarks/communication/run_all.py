@@ -1,4 +1,5 @@
 import os
+import statistics
 import sys
 
 COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
@@ -7,9 +8,87 @@ sys.path.append(COMMS_BENCH_DIR)
 from communication.all_gather import run_all_gather
 from communication.all_reduce import run_all_reduce
 from communication.all_to_all import run_all_to_all
+from communication.async_window import run_async_window
 from communication.broadcast import run_broadcast
-from communication.pt2pt import run_pt2pt
-from communication.utils import benchmark_parser, init_processes
+from communication.bucketing import run_bucketing
+from communication.compression import run_compression
+from communication.comm_model import fit_model, print_model, save_model
+from communication.launcher import spawn_local
+from communication.hierarchical import run_hierarchical
+from communication.overlap import run_overlap
+from communication.pt2pt import run_pt2pt, run_pt2pt_all_pairs
+from communication.straggler import run_straggler
+from communication.trace_replay import run_trace_replay
+from communication.utils import RESULTS, benchmark_parser, bytes_to_human_readable, get_bw, init_processes
+
+
+def write_comm_model(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    # Every rank measured, but rank 0's numbers are the ones that were printed
+    if dist.get_rank() == 0 and len(RESULTS) > 0:
+        model = fit_model(RESULTS)
+        save_model(model, args.fit_model)
+        print_model(model)
+        print(f"Alpha-beta model written to {args.fit_model}")
+
+
+def print_result_matrix(results, dtypes, args):
+    """
+    One table of bus bandwidth per (op, message size) and dtype for every measurement of the launch
+    """
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    busbw = {}
+    for result in results:
+        busbw[(result["op"], result["bytes"], result["dtype"])] = get_bw(result["op"], result["bytes"], result["duration"], args)[1]
+    rows = sorted({(op, size) for op, size, _ in busbw})
+
+    header = f"\n---- BusBW ({args.bw_unit}) by dtype on {dist.get_world_size()} devices ----------------------\n"
+    header += f"{'Op':15s} {'Payload / GPU':20s} " + " ".join(f"{dtype:12s}" for dtype in dtypes) + "\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    if dist.get_rank() == 0:
+        print(header)
+        for op, size in rows:
+            size_str = str(size) if args.raw else bytes_to_human_readable(size)
+            cells = [busbw.get((op, size, dtype)) for dtype in dtypes]
+            cells = " ".join(f"{'-' if cell is None else f'{cell / 1e9:.3f}':12s}" for cell in cells)
+            print(f"{op:15s} {size_str:20s} {cells}")
+
+
+def print_rank_summary(results, args):
+    """
+    Merged view of the measurements of every local rank: the spread of each (op, dtype, message size) over the ranks
+    and the bus bandwidth of the slowest rank, which is what the collective achieves
+    """
+    by_key = {}
+    for rank, rank_results in sorted(results.items()):
+        for result in rank_results:
+            key = (result["op"], result["dtype"], result["bytes"])
+            by_key.setdefault(key, []).append((result["duration"], rank, result["world_size"]))
+
+    print(f"\n---- Merged results of {len(results)} local ranks ({args.bw_unit}) ----------------------")
+    print(f"{'Op':15s} {'Dtype':10s} {'Payload / GPU':15s} {'Ranks':6s} {'Min':14s} {'Median':14s} {'Max':14s} {'Slowest':8s} {'BusBW':10s}")
+    print("-" * 115)
+    for (op, dtype, size), measurements in by_key.items():
+        durations = sorted(duration for duration, _, _ in measurements)
+        slowest, slowest_rank, world_size = max(measurements)
+        busbw = "-"
+        if op in ("all_reduce", "all_gather", "all_to_all", "broadcast", "pt2pt"):
+            busbw = f"{get_bw(op, size, slowest, args, world_size)[1] / 1e9:.3f}"
+        size_str = str(size) if args.raw else bytes_to_human_readable(size)
+        ranks = len({rank for _, rank, _ in measurements})
+        spread = [f"{duration * 1e6:.3f} us" for duration in (durations[0], statistics.median(durations), slowest)]
+        print(
+            f"{op:15s} {dtype:10s} {size_str:15s} {ranks:<6d} {spread[0]:14s} {spread[1]:14s} {spread[2]:14s} "
+            f"{slowest_rank:<8d} {busbw:10s}"
+        )
 
 
 # For importing
@@ -28,10 +107,40 @@ def main(args, rank):
         ops_to_run.append('pt2pt')
     if args.all_to_all:
         ops_to_run.append('all_to_all')
+    if args.overlap:
+        ops_to_run.append('overlap')
+    if args.bucketing:
+        ops_to_run.append('bucketing')
+    if args.async_window:
+        ops_to_run.append('async_window')
+    if args.compression:
+        ops_to_run.append('compression')
+    if args.hierarchical:
+        ops_to_run.append('hierarchical')
+    if args.straggler:
+        ops_to_run.append('straggler')
+    if args.trace_replay:
+        ops_to_run.append('trace_replay')
+
+    if args.ops is not None:
+        ops_to_run = args.ops
 
     if len(ops_to_run) == 0:
         ops_to_run = ['all_reduce', 'all_gather', 'all_to_all', 'broadcast', 'pt2pt']
 
+    # The process group and the payload pool are shared by every dtype
+    dtypes = args.dtypes if args.dtypes is not None else [args.dtype]
+    for dtype in dtypes:
+        args.dtype = dtype
+        run_ops(ops_to_run, args, rank)
+
+    if len(dtypes) > 1:
+        print_result_matrix(RESULTS, dtypes, args)
+    if args.fit_model is not None:
+        write_comm_model(args)
+
+
+def run_ops(ops_to_run, args, rank):
     for comm_op in ops_to_run:
         if comm_op == 'all_reduce':
             run_all_reduce(args)
@@ -40,13 +149,34 @@ def main(args, rank):
         if comm_op == 'all_to_all':
             run_all_to_all(args)
         if comm_op == 'pt2pt':
-            run_pt2pt(args)
+            if args.all_pairs:
+                run_pt2pt_all_pairs(args)
+            else:
+                run_pt2pt(args)
         if comm_op == 'broadcast':
-            run_broadcast(args)
+            run_broadcast(local_rank=rank, args=args)
+        if comm_op == 'overlap':
+            run_overlap(args)
+        if comm_op == 'bucketing':
+            run_bucketing(args)
+        if comm_op == 'async_window':
+            run_async_window(args)
+        if comm_op == 'compression':
+            run_compression(args)
+        if comm_op == 'hierarchical':
+            run_hierarchical(args)
+        if comm_op == 'straggler':
+            run_straggler(args)
+        if comm_op == 'trace_replay':
+            run_trace_replay(args)
 
 
 # For directly calling benchmark
 if __name__ == "__main__":
     args = benchmark_parser().parse_args()
-    rank = args.local_rank
-    main(args, rank)
+    if args.local_world_size is not None:
+        results = spawn_local(main, args, args.local_world_size)
+        print_rank_summary(results, args)
+    else:
+        rank = args.local_rank
+        main(args, rank)
@@ -0,0 +1,187 @@
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.utils import (
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_device,
+    init_processes,
+    issue_comm_op,
+    setup_single_payload,
+    sync_all,
+)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timed_participation(input, output, device, args):
+    """
+    Per-trial barrier wait and collective completion time of this rank alone
+    """
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    sync_all()
+    for i in range(args.warmups):
+        issue_comm_op(args.straggler_op, input, output, args)
+    sync_all()
+
+    waits = np.zeros(args.trials)
+    completions = np.zeros(args.trials)
+    for i in range(args.trials):
+        # the earlier a rank shows up, the longer it waits for the last one
+        arrival = time.perf_counter()
+        dist.barrier()
+        synchronize(device)
+        start = time.perf_counter()
+        issue_comm_op(args.straggler_op, input, output, args)
+        synchronize(device)
+        end = time.perf_counter()
+        waits[i] = start - arrival
+        completions[i] = end - start
+    return waits, completions
+
+
+def robust_zscores(values):
+    """
+    Modified z-score (median/MAD), which unlike mean/std is not masked by the outlier itself on small jobs
+    """
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return np.zeros_like(values)
+    return 0.6745 * (values - median) / mad
+
+
+def summarize_participation(reports, args):
+    """
+    Per-rank arrival lag and completion statistics from every rank's (waits, completions)
+    """
+    waits = np.stack([report["waits"] for report in reports])  # [rank, trial]
+    completions = np.stack([report["completions"] for report in reports])
+    # lag behind the earliest arrival: the rank that waited the least arrived last
+    lags = waits.max(axis=0, keepdims=True) - waits
+
+    rows = []
+    for report, rank_lags, rank_completions in zip(reports, lags, completions):
+        rows.append(
+            {
+                "rank": report["rank"],
+                "host": report["host"],
+                "lag": float(np.mean(rank_lags)),
+                "lag_p99": float(np.percentile(rank_lags, 99)),
+                "completion": float(np.mean(rank_completions)),
+            }
+        )
+    lag_z = robust_zscores([row["lag"] for row in rows])
+    completion_z = robust_zscores([row["completion"] for row in rows])
+    for row, lz, cz in zip(rows, lag_z, completion_z):
+        row["lag_z"] = float(lz)
+        row["completion_z"] = float(cz)
+        row["straggler"] = bool(lz > args.zscore_threshold or cz > args.zscore_threshold)
+    return rows
+
+
+def summarize_hosts(rows, args):
+    hosts = {}
+    for row in rows:
+        hosts.setdefault(row["host"], []).append(row)
+    host_rows = []
+    for host, host_ranks in hosts.items():
+        host_rows.append(
+            {
+                "host": host,
+                "ranks": [row["rank"] for row in host_ranks],
+                "lag": float(np.mean([row["lag"] for row in host_ranks])),
+                "completion": float(np.mean([row["completion"] for row in host_ranks])),
+                "flagged_ranks": sum(row["straggler"] for row in host_ranks),
+            }
+        )
+    lag_z = robust_zscores([row["lag"] for row in host_rows])
+    completion_z = robust_zscores([row["completion"] for row in host_rows])
+    for row, lz, cz in zip(host_rows, lag_z, completion_z):
+        row["lag_z"] = float(lz)
+        row["completion_z"] = float(cz)
+        row["straggler"] = bool(row["flagged_ranks"] > 0 or lz > args.zscore_threshold or cz > args.zscore_threshold)
+    return host_rows
+
+
+def print_straggler_report(rows, host_rows, size, args):
+    header = f"\n---- Per-rank participation in {args.straggler_op} of {bytes_to_human_readable(size)} for {args.trials} trials ----------------------\n"
+    header += f"{'Rank':8s} {'Host':24s} {'Lag (us)':12s} {'Lag p99 (us)':14s} {'Completion (ms)':16s} {'Lag z':8s} {'Compl. z':8s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print(header)
+    for row in rows:
+        flag = "  <-- straggler" if row["straggler"] else ""
+        print(
+            f"{row['rank']:<8d} {row['host'][:24]:24s} {row['lag'] * 1e6:<12.1f} {row['lag_p99'] * 1e6:<14.1f} "
+            f"{row['completion'] * 1e3:<16.3f} {row['lag_z']:<8.2f} {row['completion_z']:<8.2f}{flag}"
+        )
+
+    header = f"\n{'Host':24s} {'Ranks':8s} {'Lag (us)':12s} {'Completion (ms)':16s} {'Lag z':8s} {'Compl. z':8s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print(header)
+    for row in host_rows:
+        flag = "  <-- straggler" if row["straggler"] else ""
+        print(
+            f"{row['host'][:24]:24s} {len(row['ranks']):<8d} {row['lag'] * 1e6:<12.1f} "
+            f"{row['completion'] * 1e3:<16.3f} {row['lag_z']:<8.2f} {row['completion_z']:<8.2f}{flag}"
+        )
+    if len(host_rows) <= 2:
+        # the median of one or two values sits at or halfway between them, so no host z-score can exceed 0.6745
+        print(f"NOTE: host z-scores can't flag stragglers among {len(host_rows)} host(s), "
+              f"only hosts with flagged ranks are marked")
+
+
+def write_exclude_list(host_rows, path):
+    # Same comma separated format as `sbatch --exclude`
+    excluded = [row["host"] for row in host_rows if row["straggler"]]
+    with open(path, "w") as f:
+        f.write(",".join(excluded) + "\n")
+    print(f"Exclusion list of {len(excluded)} hosts written to {path}")
+
+
+def run_straggler(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    device = get_device(args)
+    elements_per_gpu = 2 ** int(args.elements_per_gpu)
+    input, output = setup_single_payload(args, elements_per_gpu=elements_per_gpu, op=args.straggler_op)
+    waits, completions = timed_participation(input, output, device, args)
+
+    # One final collective brings every rank's timings to rank 0
+    report = {"rank": dist.get_rank(), "host": socket.gethostname(), "waits": waits, "completions": completions}
+    reports = [None] * dist.get_world_size()
+    dist.all_gather_object(reports, report)
+
+    if dist.get_rank() == 0:
+        rows = summarize_participation(reports, args)
+        host_rows = summarize_hosts(rows, args)
+        print_straggler_report(rows, host_rows, input.element_size() * input.nelement(), args)
+        if args.exclude_file is not None:
+            write_exclude_list(host_rows, args.exclude_file)
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_straggler(args)
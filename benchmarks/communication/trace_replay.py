@@ -0,0 +1,331 @@
+import json
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+
+import torch
+
+COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
+sys.path.append(COMMS_BENCH_DIR)
+
+from communication.bucketing import shapes_from_spec
+from communication.utils import (
+    _element_size,
+    benchmark_parser,
+    bytes_to_human_readable,
+    get_device,
+    init_processes,
+    issue_comm_op,
+    print_rank_0,
+    sync_all,
+)
+
+
+def model_config_from_args(args, world_size):
+    tp_size = args.model_tp_size
+    pp_size = args.model_pp_size
+    return {
+        "hidden_size": args.model_hidden_size,
+        "num_layers": args.model_num_layers,
+        "vocab_size": args.model_vocab_size,
+        "seq_length": args.model_seq_length,
+        "micro_batch_size": args.model_micro_batch_size,
+        "num_microbatches": args.model_num_microbatches,
+        "tp_size": tp_size,
+        "pp_size": pp_size,
+        "dp_size": world_size // (tp_size * pp_size),
+        "zero_stage": args.zero_stage,
+        "bucket_size": int(args.dp_bucket_size),
+    }
+
+
+def _event(op, group, numel, phase, microbatch, layer=None, peer=None, async_op=False):
+    return {
+        "op": op,
+        "group": group,
+        "numel": int(numel),
+        "phase": phase,
+        "microbatch": microbatch,
+        "layer": layer,
+        "peer": peer,
+        "async": async_op,
+    }
+
+
+def _stage_layers(num_layers, pp_size, stage):
+    per_stage = [num_layers // pp_size + (1 if s < num_layers % pp_size else 0) for s in range(pp_size)]
+    first = sum(per_stage[:stage])
+    return list(range(first, first + per_stage[stage]))
+
+
+def generate_comm_trace(config):
+    """
+    Ordered communication of one training step for every pipeline stage, as {stage: [event, ...]}.
+
+    Follows the megatron/mpu layout: per layer, two forward and two backward tensor parallel all-reduces
+    (mappings._reduce of the row-parallel outputs and of the column-parallel input gradients),
+    vocab-parallel embedding and cross entropy reductions, pipeline send/recv of activations and their
+    gradients (all-forward-all-backward schedule) and data parallel gradient buckets according to the
+    ZeRO stage.
+    """
+    h = config["hidden_size"]
+    tp, pp, dp = config["tp_size"], config["pp_size"], config["dp_size"]
+    zero_stage = config["zero_stage"]
+    tokens = config["seq_length"] * config["micro_batch_size"]
+    activation = tokens * h
+    num_microbatches = config["num_microbatches"]
+
+    single_layer = shapes_from_spec(h, 1, config["vocab_size"], tp)
+    layer_numel = sum(math.prod(shape) for name, shape in single_layer if name.startswith("layers."))
+    embedding_numel = math.prod(single_layer[0][1])
+
+    def pad(numel):
+        # reduce_scatter/all_gather shards have to divide evenly across data parallel ranks
+        return dp * math.ceil(numel / dp)
+
+    trace = {}
+    for stage in range(pp):
+        layers = _stage_layers(config["num_layers"], pp, stage)
+        events = []
+        # ZeRO-2/3 reduce gradients every micro step, DDP and ZeRO-1 only after the last one
+        reducing_microbatches = range(num_microbatches) if zero_stage >= 2 else [num_microbatches - 1]
+        reduce_op = "all_reduce" if zero_stage == 0 else "reduce_scatter"
+
+        for microbatch in range(num_microbatches):
+            if stage > 0:
+                events.append(_event("recv", "pp", activation, "fwd", microbatch, peer=stage - 1))
+            if stage == 0 and tp > 1:
+                events.append(_event("all_reduce", "tp", activation, "fwd", microbatch, layer="embedding"))
+            for layer in layers:
+                if zero_stage == 3 and dp > 1:
+                    events.append(_event("all_gather", "dp", pad(layer_numel), "fwd", microbatch, layer=layer))
+                if tp > 1:
+                    events.append(_event("all_reduce", "tp", activation, "fwd", microbatch, layer=layer))
+                    events.append(_event("all_reduce", "tp", activation, "fwd", microbatch, layer=layer))
+            if stage == pp - 1 and tp > 1:
+                # vocab parallel cross entropy: logits max, predicted logits and sum of exps
+                for _ in range(3):
+                    events.append(_event("all_reduce", "tp", tokens, "fwd", microbatch, layer="cross_entropy"))
+            if stage < pp - 1:
+                events.append(_event("send", "pp", activation, "fwd", microbatch, peer=stage + 1))
+
+        for microbatch in range(num_microbatches):
+            reduce_now = dp > 1 and microbatch in reducing_microbatches
+            if stage < pp - 1:
+                events.append(_event("recv", "pp", activation, "bwd", microbatch, peer=stage + 1))
+
+            bucket_numel = 0
+            grad_sources = [(layer, layer_numel) for layer in reversed(layers)]
+            if stage == 0:
+                grad_sources.append(("embedding", embedding_numel))
+            for layer, numel in grad_sources:
+                if layer != "embedding":
+                    if zero_stage == 3 and dp > 1:
+                        events.append(_event("all_gather", "dp", pad(numel), "bwd", microbatch, layer=layer))
+                    if tp > 1:
+                        events.append(_event("all_reduce", "tp", activation, "bwd", microbatch, layer=layer))
+                        events.append(_event("all_reduce", "tp", activation, "bwd", microbatch, layer=layer))
+                if not reduce_now:
+                    continue
+                if zero_stage == 3:
+                    events.append(_event("reduce_scatter", "dp", pad(numel), "bwd", microbatch, layer=layer, async_op=True))
+                    continue
+                bucket_numel += numel
+                if bucket_numel >= config["bucket_size"]:
+                    events.append(_event(reduce_op, "dp", pad(bucket_numel), "bwd", microbatch, layer=layer, async_op=True))
+                    bucket_numel = 0
+            if reduce_now and bucket_numel > 0:
+                events.append(_event(reduce_op, "dp", pad(bucket_numel), "bwd", microbatch, layer="bucket", async_op=True))
+            if stage > 0:
+                events.append(_event("send", "pp", activation, "bwd", microbatch, peer=stage - 1))
+            if reduce_now:
+                events.append(_event("wait", "dp", 0, "bwd", microbatch))
+
+        if zero_stage in (1, 2) and dp > 1:
+            # updated parameter shards are gathered back after the optimizer step
+            stage_numel = len(layers) * layer_numel + (embedding_numel if stage == 0 else 0)
+            for start in range(0, stage_numel, config["bucket_size"]):
+                numel = min(config["bucket_size"], stage_numel - start)
+                events.append(_event("all_gather", "dp", pad(numel), "step", num_microbatches - 1, layer="params"))
+        trace[stage] = events
+    return trace
+
+
+def build_parallel_groups(config):
+    """
+    Megatron rank layout: tensor parallel ranks are adjacent, then data parallel, then pipeline stages
+    """
+    import torch.distributed as dist
+
+    tp, pp, dp = config["tp_size"], config["pp_size"], config["dp_size"]
+    rank = dist.get_rank()
+    groups = {}
+    # every rank has to create every group, in the same order
+    for stage in range(pp):
+        for dp_rank in range(dp):
+            ranks = [stage * dp * tp + dp_rank * tp + tp_rank for tp_rank in range(tp)]
+            group = dist.new_group(ranks)
+            if rank in ranks:
+                groups["tp"] = group
+        for tp_rank in range(tp):
+            ranks = [stage * dp * tp + dp_rank * tp + tp_rank for dp_rank in range(dp)]
+            group = dist.new_group(ranks)
+            if rank in ranks:
+                groups["dp"] = group
+    stage = rank // (dp * tp)
+    return groups, stage
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def replay_step(events, buffers, groups, config, device, args):
+    """
+    Execute one stage's events back to back and return the time spent per parallel group
+    """
+    import torch.distributed as dist
+
+    input, output, grads = buffers
+    stage_stride = config["dp_size"] * config["tp_size"]
+    group_times = defaultdict(float)
+    handles = []
+    grad_offset = 0
+    shard_offset = 0
+    for event in events:
+        numel = event["numel"]
+        start = time.perf_counter()
+        if event["op"] == "wait":
+            for handle in handles:
+                if handle is not None:
+                    handle.wait()
+            synchronize(device)
+            handles = []
+            grad_offset = 0
+            shard_offset = 0
+            group_times["dp"] += time.perf_counter() - start
+            continue
+        if event["op"] in ("send", "recv"):
+            peer = dist.get_rank() + (event["peer"] - dist.get_rank() // stage_stride) * stage_stride
+            if event["op"] == "send":
+                dist.send(input[:numel], peer)
+            else:
+                dist.recv(input[:numel], src=peer)
+        elif event["async"]:
+            # in-flight gradient buckets need their own memory, carved out of one contiguous buffer
+            bucket = grads[grad_offset:grad_offset + numel]
+            grad_offset += numel
+            shard = output[shard_offset:shard_offset + numel // config["dp_size"]]
+            shard_offset += numel // config["dp_size"]
+            handles.append(issue_comm_op(event["op"], bucket, shard, args, async_op=True, group=groups["dp"]))
+            continue
+        else:
+            group = groups[event["group"]]
+            world = dist.get_world_size(group=group)
+            if event["op"] == "all_gather":
+                issue_comm_op("all_gather", input[: numel // world], output[:numel], args, group=group)
+            elif event["op"] == "reduce_scatter":
+                issue_comm_op("reduce_scatter", input[:numel], output[: numel // world], args, group=group)
+            else:
+                issue_comm_op(event["op"], input[:numel], None, args, group=group)
+        synchronize(device)
+        group_times[event["group"]] += time.perf_counter() - start
+    return group_times
+
+
+def summarize_trace(trace, element_size):
+    lines = []
+    for stage, events in trace.items():
+        totals = defaultdict(lambda: [0, 0])
+        for event in events:
+            if event["op"] == "wait":
+                continue
+            totals[(event["group"], event["op"])][0] += 1
+            totals[(event["group"], event["op"])][1] += event["numel"] * element_size
+        for (group, op), (count, num_bytes) in sorted(totals.items()):
+            lines.append(f"{stage:<8d} {group:8s} {op:16s} {count:<10d} {bytes_to_human_readable(num_bytes):15s}")
+    return lines
+
+
+def run_trace_replay(args):
+    if args.dist == 'torch':
+        import torch.distributed as dist
+    elif args.dist == 'deepspeed':
+        import deepspeed.comm as dist
+
+    world_size = dist.get_world_size()
+    config = model_config_from_args(args, world_size)
+    if config["tp_size"] * config["pp_size"] * config["dp_size"] != world_size:
+        print_rank_0(
+            f"world size {world_size} is not a multiple of tp={config['tp_size']} x pp={config['pp_size']}, skipping trace replay"
+        )
+        return
+
+    trace = generate_comm_trace(config)
+    dtype = getattr(torch, args.dtype)
+    element_size = _element_size(dtype)
+    if args.trace_file is not None and dist.get_rank() == 0:
+        with open(args.trace_file, "w") as f:
+            json.dump({"config": config, "trace": trace}, f, indent=1)
+
+    header = f"\n---- Communication trace of one step: h={config['hidden_size']} layers={config['num_layers']} tp={config['tp_size']} pp={config['pp_size']} dp={config['dp_size']} zero={config['zero_stage']} ----------------------\n"
+    header += f"{'Stage':8s} {'Group':8s} {'Op':16s} {'Count':10s} {'Bytes':15s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+    print_rank_0("\n".join(summarize_trace(trace, element_size)))
+
+    groups, stage = build_parallel_groups(config)
+    events = trace[stage]
+    device = get_device(args)
+    max_numel = max([event["numel"] for event in events if not event["async"]] + [1])
+    grad_numel = max(
+        [sum(event["numel"] for event in events if event["async"] and event["microbatch"] == microbatch)
+         for microbatch in range(config["num_microbatches"])] + [1]
+    )
+    buffers = (
+        torch.ones(max_numel, dtype=dtype, device=device),
+        torch.zeros(max(max_numel, grad_numel), dtype=dtype, device=device),
+        torch.ones(grad_numel, dtype=dtype, device=device),
+    )
+
+    sync_all()
+    for i in range(args.warmups):
+        replay_step(events, buffers, groups, config, device, args)
+    sync_all()
+
+    totals = defaultdict(float)
+    start = time.perf_counter()
+    for i in range(args.trials):
+        for group, duration in replay_step(events, buffers, groups, config, device, args).items():
+            totals[group] += duration
+    synchronize(device)
+    step_time = (time.perf_counter() - start) / args.trials
+
+    report = {"rank": dist.get_rank(), "stage": stage, "step": step_time}
+    report.update({group: duration / args.trials for group, duration in totals.items()})
+    reports = [None] * world_size
+    dist.all_gather_object(reports, report)
+
+    header = f"\n{'Stage':8s} {'Step (ms)':12s} {'TP (ms)':12s} {'PP (ms)':12s} {'DP (ms)':12s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+    for stage in range(config["pp_size"]):
+        # the slowest rank of a stage determines its communication time
+        stage_reports = [report for report in reports if report["stage"] == stage]
+        slowest = max(stage_reports, key=lambda report: report["step"])
+        print_rank_0(
+            f"{stage:<8d} {slowest['step'] * 1e3:<12.3f} {slowest.get('tp', 0.0) * 1e3:<12.3f} "
+            f"{slowest.get('pp', 0.0) * 1e3:<12.3f} {slowest.get('dp', 0.0) * 1e3:<12.3f}"
+        )
+    print_rank_0(f"Communication time per step: {max(report['step'] for report in reports) * 1e3:.3f} ms")
+    sync_all()
+
+
+if __name__ == "__main__":
+    args = benchmark_parser().parse_args()
+    rank = args.local_rank
+    init_processes(local_rank=rank, args=args)
+    run_trace_replay(args)
@@ -1,8 +1,11 @@
 import argparse
+import json
 import math
 import os
 import sys
+import time
 
+import numpy as np
 import torch
 
 COMMS_BENCH_DIR = os.path.join(os.path.dirname(__file__), "../")
@@ -11,6 +14,15 @@ from .constants import *
 
 global dist
 
+# (output factor, input, output) byte buffers shared by every payload of a scan, see get_payload_pool
+_PAYLOAD_POOL = None
+
+# Every measurement taken by this process, see record_result
+RESULTS = []
+
+# (intra-node group, inter-node group) of this rank, see get_node_groups
+_NODE_GROUPS = None
+
 
 def env2int(env_list, default=-1):
     for e in env_list:
@@ -73,10 +85,22 @@ def init_torch_distributed(backend):
     )
     if "WORLD_SIZE" not in os.environ:
         os.environ["WORLD_SIZE"] = str(world_size)
+    local_world_size = env2int(
+        [
+            "LOCAL_WORLD_SIZE",
+            "MPI_LOCALNRANKS",
+            "OMPI_COMM_WORLD_LOCAL_SIZE",
+            "MV2_COMM_WORLD_LOCAL_SIZE",
+            "SLURM_NTASKS_PER_NODE",
+        ]
+    )
+    if "LOCAL_WORLD_SIZE" not in os.environ and local_world_size > 0:
+        os.environ["LOCAL_WORLD_SIZE"] = str(local_world_size)
 
     torch.distributed.init_process_group(backend)
     local_rank = int(os.environ["LOCAL_RANK"])
-    torch.cuda.set_device(local_rank)
+    if backend != "gloo" and torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
 
 
 def init_deepspeed_comm(backend):
@@ -121,8 +145,9 @@ def print_header(args, comm_op):
     print_rank_0(header)
 
 
-def get_bw(comm_op, size, duration, args):
-    n = dist.get_world_size()
+def get_bw(comm_op, size, duration, args, world_size=None):
+    # world_size lets callers outside the process group, e.g. the parent of spawn_local, compute bandwidths
+    n = world_size if world_size is not None else dist.get_world_size()
     tput = 0
     busbw = 0
     if comm_op == "all_to_all":
@@ -149,6 +174,34 @@ def get_bw(comm_op, size, duration, args):
     return tput, busbw
 
 
+def record_result(args, comm_op, size, duration, samples=None):
+    """
+    Keep a structured copy of one measurement and append it to --results-file on rank 0
+    """
+    from results_db import get_fingerprint
+
+    world_size = 2 if comm_op == "pt2pt" else dist.get_world_size()
+    result = {
+        "suite": "communication",
+        "op": comm_op,
+        "world_size": world_size,
+        "bytes": int(size),
+        "dtype": args.dtype,
+        "backend": args.backend,
+        "trials": args.trials,
+        "duration": duration,
+        "fingerprint": get_fingerprint(),
+    }
+    if samples is not None:
+        # per-trial durations, what results_db.py compare tests regressions on
+        result["samples"] = samples
+    RESULTS.append(result)
+    if args.results_file is not None and dist.get_rank() == 0:
+        with open(args.results_file, "a") as f:
+            f.write(json.dumps(result) + "\n")
+    return result
+
+
 def get_metric_strings(args, tput, busbw, duration):
     duration_ms = duration * 1e3
     duration_us = duration * 1e6
@@ -165,15 +218,121 @@ def get_metric_strings(args, tput, busbw, duration):
 
 
 def sync_all():
-    torch.cuda.synchronize()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
     dist.barrier()
 
 
+def get_device(args):
+    # gloo benchmarks run on host memory, everything else on the local GPU
+    if args.backend == "gloo" or not torch.cuda.is_available():
+        return torch.device("cpu")
+    return torch.device("cuda", int(os.environ["LOCAL_RANK"]))
+
+
+class HostEvent:
+    """
+    Host clock stand-in for torch.cuda.Event(enable_timing=True) on CPU backends
+    """
+
+    def __init__(self):
+        self.timestamp = None
+
+    def record(self):
+        self.timestamp = time.perf_counter()
+
+    def elapsed_time(self, end_event):
+        # milliseconds, like torch.cuda.Event
+        return (end_event.timestamp - self.timestamp) * 1e3
+
+
+def create_trial_events(args):
+    """
+    One timing event before the first trial and one after every trial, so that each trial is a sample of its own
+    """
+    if get_device(args).type == "cuda":
+        return [torch.cuda.Event(enable_timing=True) for _ in range(args.trials + 1)]
+    return [HostEvent() for _ in range(args.trials + 1)]
+
+
+def trial_durations(trial_events):
+    # seconds between consecutive events
+    return [start.elapsed_time(end) / 1000 for start, end in zip(trial_events[:-1], trial_events[1:])]
+
+
+def issue_comm_op(comm_op, input, output, args, async_op=False, group=None):
+    """
+    Launch a single collective by name and return its work handle (None when blocking)
+    """
+    if comm_op == "all_reduce":
+        return dist.all_reduce(input, group=group, async_op=async_op)
+    elif comm_op == "all_gather":
+        if args.dist == "deepspeed":
+            return dist.allgather_fn(output, input, group=group, async_op=async_op)
+        if args.backend == "gloo":
+            # gloo has no all_gather_into_tensor, gather into views of the flat output instead
+            world_size = dist.get_world_size(group=group)
+            return dist.all_gather(
+                list(output.chunk(world_size)), input, group=group, async_op=async_op
+            )
+        return dist.all_gather_into_tensor(output, input, group=group, async_op=async_op)
+    elif comm_op == "reduce_scatter":
+        if args.dist == "deepspeed":
+            return dist.reduce_scatter_fn(output, input, group=group, async_op=async_op)
+        return dist.reduce_scatter_tensor(output, input, group=group, async_op=async_op)
+    elif comm_op == "all_to_all":
+        return dist.all_to_all_single(output, input, group=group, async_op=async_op)
+    elif comm_op == "broadcast":
+        return dist.broadcast(input, 0, group=group, async_op=async_op)
+    else:
+        print_rank_0(f"comm_op {comm_op} cannot be issued")
+        exit(0)
+
+
+def get_ranks_per_node(args):
+    if args.ranks_per_node is not None:
+        return args.ranks_per_node
+    if "LOCAL_WORLD_SIZE" in os.environ:
+        return int(os.environ["LOCAL_WORLD_SIZE"])
+    # The launcher didn't say, the highest local rank + 1 is the node size
+    local_size = torch.tensor([int(os.environ["LOCAL_RANK"]) + 1], device=get_device(args))
+    dist.all_reduce(local_size, op=dist.ReduceOp.MAX)
+    return int(local_size.item())
+
+
+def get_node_groups(args):
+    """
+    Intra-node and inter-node process groups of this rank, assuming ranks are numbered node by node
+    """
+    global _NODE_GROUPS
+    if _NODE_GROUPS is None:
+        world_size = dist.get_world_size()
+        rank = dist.get_rank()
+        ranks_per_node = get_ranks_per_node(args)
+        if world_size % ranks_per_node != 0:
+            print_rank_0(f"WARNING: world size {world_size} is not a multiple of {ranks_per_node} ranks per node")
+            exit(0)
+        num_nodes = world_size // ranks_per_node
+
+        # Every rank has to create every group, in the same order
+        intra_group, inter_group = None, None
+        for node in range(num_nodes):
+            ranks = list(range(node * ranks_per_node, (node + 1) * ranks_per_node))
+            group = dist.new_group(ranks)
+            if rank in ranks:
+                intra_group = group
+        for local_rank in range(ranks_per_node):
+            ranks = list(range(local_rank, world_size, ranks_per_node))
+            group = dist.new_group(ranks)
+            if rank in ranks:
+                inter_group = group
+        _NODE_GROUPS = (intra_group, inter_group)
+    return _NODE_GROUPS
+
+
 def max_numel(comm_op, dtype, mem_factor, local_rank, args):
     dtype_size = _element_size(dtype)
-    max_memory_per_gpu = (
-        torch.cuda.get_device_properties(local_rank).total_memory * mem_factor
-    )
+    max_memory_per_gpu = get_device_memory(get_device(args)) * mem_factor
     if comm_op == "all_reduce" or comm_op == "pt2pt" or comm_op == "broadcast":
         elements_per_gpu = int(max_memory_per_gpu // dtype_size)
     elif comm_op == "all_gather":
@@ -218,6 +377,94 @@ def get_scan_range(args):
     return payloads
 
 
+def _next_refinement(points, comm_op, args):
+    """
+    Elements to measure next: the geometric midpoint of the widest-changing interval that can still be split
+    """
+    # all_to_all payloads have to split evenly across ranks
+    align = dist.get_world_size() if comm_op == "all_to_all" else 1
+    best = None
+    for (lo, lo_bw), (hi, hi_bw) in zip(points[:-1], points[1:]):
+        change = abs(hi_bw - lo_bw) / max(hi_bw, lo_bw)
+        if change <= args.refine_threshold or hi / lo <= 1 + args.min_refine_gap:
+            continue
+        midpoint = align * round(math.sqrt(lo * hi) / align)
+        if lo < midpoint < hi and (best is None or change > best[0]):
+            best = (change, midpoint)
+    return -1 if best is None else best[1]
+
+
+def find_breakpoints(points, args):
+    """
+    Adjacent scan points closer than --min-refine-gap between which the bus bandwidth still jumps by more than
+    --refine-threshold. Wider jumps are only intervals the budget ran out on.
+    """
+    breakpoints = []
+    for (lo, lo_bw), (hi, hi_bw) in zip(points[:-1], points[1:]):
+        change = (hi_bw - lo_bw) / max(hi_bw, lo_bw)
+        if abs(change) > args.refine_threshold and hi / lo <= 1 + args.min_refine_gap:
+            breakpoints.append({"below": lo, "above": hi, "busbw_below": lo_bw, "busbw_above": hi_bw, "change": change})
+    return breakpoints
+
+
+def adaptive_scan(comm_op, measure, args):
+    """
+    Scan the --scan-start..--scan-end powers of two, then bisect (geometrically) wherever bus bandwidth changes sharply
+    until nothing is left to refine or --scan-budget seconds are spent.
+
+    measure(elements_per_gpu) runs one timed payload and returns its record_result() dict, or None if it didn't fit.
+    Rank 0 picks every next size and broadcasts it so that all ranks stay in the same collective.
+    """
+    start = time.time()
+    # elements -> (bytes, busbw)
+    measured = {}
+
+    def measure_point(elements):
+        result = measure(elements)
+        if result is not None:
+            # the median trial is robust to the odd slow trial, which would otherwise look like a cliff
+            duration = float(np.median(result["samples"])) if result.get("samples") else result["duration"]
+            measured[elements] = (result["bytes"], get_bw(comm_op, result["bytes"], duration, args)[1])
+        return result
+
+    for elements in get_scan_range(args):
+        if measure_point(elements) is None:
+            break
+
+    decision = torch.zeros(1, dtype=torch.int64, device=get_device(args))
+    while True:
+        if dist.get_rank() == 0:
+            points = [(elements, busbw) for elements, (_, busbw) in sorted(measured.items())]
+            out_of_budget = time.time() - start > args.scan_budget
+            decision[0] = -1 if out_of_budget or len(points) < 2 else _next_refinement(points, comm_op, args)
+        dist.broadcast(decision, 0)
+        if decision.item() < 0:
+            break
+        measure_point(int(decision.item()))
+
+    points = [(num_bytes, busbw) for _, (num_bytes, busbw) in sorted(measured.items())]
+    breakpoints = find_breakpoints(points, args)
+    print_adaptive_scan(comm_op, points, breakpoints, time.time() - start, args)
+    return points, breakpoints
+
+
+def print_adaptive_scan(comm_op, points, breakpoints, elapsed, args):
+    busbw = f"BusBW ({args.bw_unit})"
+    header = f"\n---- Adaptive scan of {comm_op}: {len(points)} sizes in {elapsed:.1f} s ----------------------\n"
+    header += f"{'Payload / GPU':20s} {'Bytes':15s} {busbw:20s}\n"
+    header += "----------------------------------------------------------------------------------------------------"
+    print_rank_0(header)
+    edges = {breakpoint["below"] for breakpoint in breakpoints}
+    for num_bytes, bw in points:
+        marker = "  <-- breakpoint above" if num_bytes in edges else ""
+        print_rank_0(f"{bytes_to_human_readable(num_bytes):20s} {num_bytes:<15d} {bw / 1e9:<20.3f}{marker}")
+    for breakpoint in breakpoints:
+        print_rank_0(
+            f"Breakpoint between {breakpoint['below']} and {breakpoint['above']} bytes: "
+            f"{breakpoint['busbw_below'] / 1e9:.3f} -> {breakpoint['busbw_above'] / 1e9:.3f} ({100 * breakpoint['change']:+.0f}%)"
+        )
+
+
 def bytes_to_human_readable(num_bytes: int) -> str:
     # Define the units and the corresponding sizes
     units = ["B", "KB", "MB", "GB", "TB", "PB", "EB"]
@@ -235,20 +482,21 @@ def bytes_to_human_readable(num_bytes: int) -> str:
 def setup_single_payload(args, elements_per_gpu, op):
     sync_all()
     world_size = dist.get_world_size()
-    local_rank = args.local_rank 
-    
+    device = get_device(args)
+
     try:
         input = (
             torch.ones(elements_per_gpu, dtype=getattr(torch, args.dtype))
-            .cuda(local_rank)
+            .to(device)
             .view(-1)
         )
 
-        torch.cuda.empty_cache()
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
         if op == "all_gather":
             output = torch.zeros(
                 elements_per_gpu * world_size, dtype=getattr(torch, args.dtype)
-            ).cuda(local_rank)
+            ).to(device)
         elif op == "all_to_all":
             output = torch.zeros_like(input)
         else:
@@ -267,6 +515,76 @@ def setup_single_payload(args, elements_per_gpu, op):
     sync_all()
     return input, output
 
+def get_device_memory(device):
+    if device.type == "cuda":
+        return torch.cuda.get_device_properties(device).total_memory
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def output_factor(op, world_size):
+    """
+    Size of op's output buffer in inputs: all_gather gathers world_size of them, all_to_all exchanges one,
+    every other op works in place
+    """
+    if op == "all_gather":
+        return world_size
+    if op == "all_to_all":
+        return 1
+    return 0
+
+
+def get_payload_pool(args, op):
+    """
+    Allocate the scan's input and output byte buffers once, sized for op's largest payload within --mem-factor.
+    Ops with the same output needs share the pool, others replace it.
+    """
+    global _PAYLOAD_POOL
+    factor = output_factor(op, dist.get_world_size())
+    if _PAYLOAD_POOL is None or _PAYLOAD_POOL[0] != factor:
+        device = get_device(args)
+        # free the previous op's pool before sizing the new one against the same budget
+        _PAYLOAD_POOL = None
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+        # one pool serves every dtype of a --dtypes run, size it for the widest
+        dtypes = args.dtypes if args.dtypes is not None else [args.dtype]
+        element_size = max(_element_size(getattr(torch, dtype)) for dtype in dtypes)
+        max_bytes = 2**args.scan_end * element_size
+        budget = get_device_memory(device) * args.mem_factor
+        input_bytes = int(min(max_bytes, budget // (factor + 1)))
+        sync_all()
+        input = torch.empty(input_bytes, dtype=torch.uint8, device=device)
+        output = torch.empty(input_bytes * factor, dtype=torch.uint8, device=device) if factor > 0 else None
+        sync_all()
+        _PAYLOAD_POOL = (factor, input, output)
+    return _PAYLOAD_POOL[1:]
+
+
+def get_payload_views(args, elements_per_gpu, op):
+    """
+    Zero-copy input/output views of the payload pool, the pooled replacement for setup_single_payload
+    """
+    input_pool, output_pool = get_payload_pool(args, op)
+    world_size = dist.get_world_size()
+    dtype = getattr(torch, args.dtype)
+    num_bytes = elements_per_gpu * _element_size(dtype)
+    if num_bytes > input_pool.numel():
+        print_rank_0(
+            f"WARNING: {bytes_to_human_readable(num_bytes)} payload exceeds the {bytes_to_human_readable(input_pool.numel())} buffer pool. Try to increase the --mem-factor argument!"
+        )
+        return None
+
+    input = input_pool[:num_bytes].view(dtype)
+    input.fill_(1)
+    if op == "all_gather":
+        output = output_pool[: num_bytes * world_size].view(dtype)
+    elif op == "all_to_all":
+        output = output_pool[:num_bytes].view(dtype)
+    else:
+        output = None
+    return input, output
+
+
 # Copied from torch. Need to add the func here for old torch compatibility.
 def _element_size(dtype):
     """
@@ -311,7 +629,7 @@ def benchmark_parser():
         "--backend",
         type=str,
         default=DEFAULT_BACKEND,
-        choices=["nccl", "ccl", "mpi"],
+        choices=["nccl", "ccl", "mpi", "gloo"],
         help="Communication library to use",
     )
     parser.add_argument(
@@ -334,9 +652,312 @@ def benchmark_parser():
     parser.add_argument("--all-to-all", action="store_true", help="Run all_to_all")
     parser.add_argument("--pt2pt", action="store_true", help="Run pt2pt")
     parser.add_argument("--broadcast", action="store_true", help="Run broadcast")
+    parser.add_argument(
+        "--all-pairs",
+        action="store_true",
+        help="Run pt2pt between every pair of ranks and print bandwidth/latency matrices",
+    )
+    parser.add_argument(
+        "--pair-outlier-frac",
+        type=float,
+        default=0.2,
+        help="Flag pairs whose bandwidth (latency) is this fraction below (above) the median of comparable pairs",
+    )
+    parser.add_argument(
+        "--overlap",
+        action="store_true",
+        help="Run the compute/communication overlap benchmark",
+    )
+    parser.add_argument(
+        "--overlap-op",
+        type=str,
+        default="all_reduce",
+        choices=["all_reduce", "all_gather"],
+        help="Collective to overlap with GEMMs in the overlap benchmark",
+    )
+    parser.add_argument(
+        "--overlap-gemm",
+        nargs=3,
+        type=int,
+        default=[2048, 2048, 2048],
+        metavar=("M", "N", "K"),
+        help="GEMM shape (m, n) x (n, k) run concurrently with the collective, as in sizing/mm_flops.py",
+    )
+    parser.add_argument(
+        "--overlap-gemms",
+        type=int,
+        default=4,
+        help="Number of GEMMs issued per collective in the overlap benchmark",
+    )
+    parser.add_argument(
+        "--async-window",
+        action="store_true",
+        help="Run async collectives with a bounded number of in-flight ops and report throughput per window depth",
+    )
+    parser.add_argument(
+        "--window-op",
+        type=str,
+        default="all_reduce",
+        choices=["all_reduce", "all_gather", "all_to_all", "broadcast"],
+        help="Collective pipelined by the in-flight window benchmark",
+    )
+    parser.add_argument(
+        "--window-depths",
+        nargs="+",
+        type=int,
+        default=[1, 2, 4, 8, 16],
+        help="Numbers of outstanding async ops to benchmark",
+    )
+    parser.add_argument(
+        "--compression",
+        action="store_true",
+        help="Run the gradient compression benchmark",
+    )
+    parser.add_argument(
+        "--compress-op",
+        type=str,
+        default="all_reduce",
+        choices=["all_reduce", "all_gather"],
+        help="Collective wrapped with encode/decode stages by the compression benchmark",
+    )
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        type=str,
+        default=["fp32", "fp16", "bf16", "int8", "topk"],
+        choices=["fp32", "fp16", "bf16", "int8", "topk"],
+        help="Gradient compression schemes to benchmark, fp32 is the uncompressed baseline",
+    )
+    parser.add_argument(
+        "--quant-block-size",
+        type=int,
+        default=256,
+        help="Elements sharing one absmax scale in int8 block quantization",
+    )
+    parser.add_argument(
+        "--topk-ratio",
+        type=float,
+        default=0.01,
+        help="Fraction of gradient elements kept by top-k sparsification",
+    )
+    parser.add_argument(
+        "--hierarchical",
+        action="store_true",
+        help="Compare two-level (intra-node then inter-node) all_reduce and all_gather with the flat collectives",
+    )
+    parser.add_argument(
+        "--ranks-per-node",
+        type=int,
+        default=None,
+        help="Ranks per node for the hierarchical collectives (default: the launcher's local world size)",
+    )
+    parser.add_argument(
+        "--probe-ops",
+        nargs="+",
+        type=str,
+        default=["all_reduce"],
+        choices=["all_reduce", "all_gather", "all_to_all", "broadcast"],
+        help="Collectives swept by the fabric health probe",
+    )
+    parser.add_argument(
+        "--probe-sizes",
+        nargs="+",
+        type=int,
+        default=[10, 16, 20],
+        help="Probe message sizes in elements as powers of 2",
+    )
+    parser.add_argument(
+        "--probe-interval",
+        type=float,
+        default=60,
+        help="Seconds between the starts of two probe sweeps",
+    )
+    parser.add_argument(
+        "--probe-sweeps",
+        type=int,
+        default=None,
+        help="Stop the probe after this many sweeps (default: run until interrupted)",
+    )
+    parser.add_argument(
+        "--probe-history",
+        type=int,
+        default=1440,
+        help="Samples per probe series kept in the ring buffer for rolling statistics",
+    )
+    parser.add_argument(
+        "--probe-baseline",
+        type=str,
+        default=None,
+        help="comm_model.py JSON to alert against (default: the median of the first --alert-window sweeps)",
+    )
+    parser.add_argument(
+        "--alert-frac",
+        type=float,
+        default=0.2,
+        help="Alert when the probe busbw is this fraction below its baseline",
+    )
+    parser.add_argument(
+        "--alert-window",
+        type=int,
+        default=3,
+        help="Number of consecutive probe sweeps averaged before comparing against the baseline",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Atomically rewrite this Prometheus text file (e.g. for node_exporter's textfile collector) after every sweep",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve the probe metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--straggler",
+        action="store_true",
+        help="Time every rank's participation in a collective and flag stragglers",
+    )
+    parser.add_argument(
+        "--straggler-op",
+        type=str,
+        default="all_reduce",
+        choices=["all_reduce", "all_gather", "all_to_all", "broadcast"],
+        help="Collective used by the straggler detection benchmark",
+    )
+    parser.add_argument(
+        "--zscore-threshold",
+        type=float,
+        default=3.5,
+        help="Robust z-score above which a rank or host is flagged as a straggler",
+    )
+    parser.add_argument(
+        "--exclude-file",
+        type=str,
+        default=None,
+        help="Write flagged hosts to this file as a comma separated list for `sbatch --exclude`",
+    )
+    parser.add_argument(
+        "--bucketing",
+        action="store_true",
+        help="Run the gradient bucket coalescing benchmark",
+    )
+    parser.add_argument(
+        "--param-shapes",
+        type=str,
+        default=None,
+        help="JSON file of parameter shapes ({name: shape} or [shape, ...]) for the bucketing benchmark",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="module:function returning the torch.nn.Module (e.g. a megatron GPT2ModelPipe) whose named_parameters() give the bucketing benchmark's shapes, built on the meta device",
+    )
+    parser.add_argument(
+        "--bucket-sizes",
+        nargs="+",
+        type=float,
+        default=DEFAULT_BUCKET_SIZES,
+        help="Bucket sizes in elements to flatten gradients into (e.g. 5e8 like allreduce_bucket_size)",
+    )
+    parser.add_argument(
+        "--model-hidden-size",
+        type=int,
+        default=1024,
+        help="Hidden size of the model used to derive parameter shapes",
+    )
+    parser.add_argument(
+        "--model-num-layers",
+        type=int,
+        default=24,
+        help="Number of transformer layers of the model used to derive parameter shapes",
+    )
+    parser.add_argument(
+        "--model-vocab-size",
+        type=int,
+        default=50304,
+        help="Padded vocab size of the model used to derive parameter shapes",
+    )
+    parser.add_argument(
+        "--model-tp-size",
+        type=int,
+        default=1,
+        help="Tensor parallel size of the model used to derive parameter shapes",
+    )
+    parser.add_argument(
+        "--model-pp-size",
+        type=int,
+        default=1,
+        help="Pipeline parallel size of the model replayed by trace_replay.py",
+    )
+    parser.add_argument(
+        "--model-seq-length",
+        type=int,
+        default=2048,
+        help="Sequence length of the model replayed by trace_replay.py",
+    )
+    parser.add_argument(
+        "--model-micro-batch-size",
+        type=int,
+        default=1,
+        help="Micro batch size of the model replayed by trace_replay.py",
+    )
+    parser.add_argument(
+        "--model-num-microbatches",
+        type=int,
+        default=4,
+        help="Gradient accumulation steps (pipeline microbatches) per replayed step",
+    )
+    parser.add_argument(
+        "--zero-stage",
+        type=int,
+        default=0,
+        choices=[0, 1, 2, 3],
+        help="ZeRO stage of the model replayed by trace_replay.py",
+    )
+    parser.add_argument(
+        "--dp-bucket-size",
+        type=float,
+        default=5e8,
+        help="Data parallel gradient bucket size in elements for trace_replay.py",
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        default=None,
+        help="Write the generated communication trace to this JSON file",
+    )
+    parser.add_argument(
+        "--trace-replay",
+        action="store_true",
+        help="Replay the communication trace of a model config",
+    )
     parser.add_argument(
         "--dtype", type=str, default=DEFAULT_TYPE, help="PyTorch tensor dtype"
     )
+    parser.add_argument(
+        "--local-world-size",
+        type=int,
+        default=None,
+        help="Spawn this many local ranks from run_all.py instead of relying on torchrun/MPI/Slurm",
+    )
+    parser.add_argument(
+        "--dtypes",
+        nargs="+",
+        type=str,
+        default=None,
+        help="Run every selected op once per PyTorch dtype in a single launch and print a dtype matrix",
+    )
+    parser.add_argument(
+        "--ops",
+        nargs="+",
+        type=str,
+        default=None,
+        choices=RUN_ALL_OPS,
+        help="Ops run by run_all.py, in order (alternative to the per-op flags)",
+    )
     parser.add_argument(
         "--mem-factor",
         type=float,
@@ -361,6 +982,41 @@ def benchmark_parser():
         default=31,
         help="End number of elements as power of 2 when running scan (31 -> 2 ** 31 ~ 2GB)",
     )
+    parser.add_argument(
+        "--adaptive-scan",
+        action="store_true",
+        help="With --scan, refine the power of 2 grid wherever bus bandwidth changes sharply",
+    )
+    parser.add_argument(
+        "--refine-threshold",
+        type=float,
+        default=0.15,
+        help="Relative bus bandwidth change between neighbouring sizes that triggers refinement (and marks a breakpoint)",
+    )
+    parser.add_argument(
+        "--min-refine-gap",
+        type=float,
+        default=0.01,
+        help="Stop refining intervals whose sizes differ by less than this fraction",
+    )
+    parser.add_argument(
+        "--scan-budget",
+        type=float,
+        default=300,
+        help="Seconds an adaptive scan may spend on one op, including the initial grid",
+    )
+    parser.add_argument(
+        "--results-file",
+        type=str,
+        default=None,
+        help="Append every measurement as a JSON line to this file (rank 0 only)",
+    )
+    parser.add_argument(
+        "--fit-model",
+        type=str,
+        default=None,
+        help="After run_all.py finishes, fit an alpha-beta network model to the results and write it to this JSON file",
+    )
     parser.add_argument(
         "--debug", action="store_true", help="Enables all_to_all debug prints"
     )
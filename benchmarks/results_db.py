@@ -0,0 +1,285 @@
+import argparse
+import hashlib
+import json
+import math
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Hardware and software of this process, see get_fingerprint
+_FINGERPRINT = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id TEXT PRIMARY KEY,
+    details TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    label TEXT NOT NULL,
+    source TEXT NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    suite TEXT NOT NULL,
+    op TEXT NOT NULL,
+    size TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    world_size INTEGER NOT NULL,
+    backend TEXT NOT NULL,
+    fingerprint TEXT NOT NULL REFERENCES fingerprints(id),
+    duration REAL NOT NULL,
+    samples TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_key ON results (suite, op, size, dtype, world_size, backend);
+"""
+
+
+def _driver_version():
+    try:
+        output = subprocess.check_output(
+            ["nvidia-smi", "--query-gpu=driver_version", "--format=csv,noheader"], timeout=10
+        )
+        return output.decode().splitlines()[0].strip()
+    except (OSError, subprocess.SubprocessError, IndexError):
+        return ""
+
+
+def get_fingerprint():
+    """
+    Hardware and software versions that results are only comparable within, computed once per process
+    """
+    global _FINGERPRINT
+    if _FINGERPRINT is None:
+        import torch
+
+        fingerprint = {
+            "device": platform.processor() or platform.machine(),
+            "driver": "",
+            "torch": torch.__version__,
+            "cuda": torch.version.cuda or torch.version.hip or "",
+            "nccl": "",
+        }
+        if torch.cuda.is_available():
+            fingerprint["device"] = torch.cuda.get_device_name()
+            fingerprint["driver"] = _driver_version()
+            if torch.distributed.is_nccl_available():
+                fingerprint["nccl"] = ".".join(str(v) for v in torch.cuda.nccl.version())
+        _FINGERPRINT = fingerprint
+    return _FINGERPRINT
+
+
+def fingerprint_id(fingerprint):
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def result_key(record):
+    """
+    What a measurement is of: (suite, op, size, dtype, world_size, backend)
+    """
+    # communication results are sized in bytes, sizing results by their GEMM shape
+    size = record["bytes"] if "bytes" in record else record["shape"]
+    return (
+        record.get("suite", "communication"),
+        record["op"],
+        str(size),
+        record.get("dtype", ""),
+        int(record.get("world_size", 1)),
+        record.get("backend", ""),
+    )
+
+
+def record_samples(record):
+    # older results files only have the mean duration, which then is a single sample
+    return record.get("samples") or [record["duration"]]
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        with open(path, "r") as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    # reused cache entries are copies of earlier measurements, comparing them against those would hide regressions
+    return [record for record in records if not record.get("cached")]
+
+
+def ingest(conn, records, label, source):
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO runs (label, source, ingested) VALUES (?, ?, ?)", (label, source, time.time())
+        ).lastrowid
+        for record in records:
+            fingerprint = record.get("fingerprint", {})
+            fid = fingerprint_id(fingerprint)
+            conn.execute(
+                "INSERT OR IGNORE INTO fingerprints (id, details) VALUES (?, ?)", (fid, json.dumps(fingerprint, sort_keys=True))
+            )
+            conn.execute(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, *result_key(record), fid, record["duration"], json.dumps(record_samples(record))),
+            )
+    return run_id
+
+
+def mann_whitney_u(baseline, candidate):
+    """
+    U statistic of candidate vs baseline and the one-sided p-value of candidate being larger (slower).
+
+    Normal approximation with tie and continuity correction, fine for the >= 10 trials the benchmarks run.
+    """
+    baseline = np.asarray(baseline, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    n1, n2 = len(baseline), len(candidate)
+    n = n1 + n2
+    combined = np.concatenate([baseline, candidate])
+
+    # average ranks (1-based) of tied values
+    _, inverse, counts = np.unique(combined, return_inverse=True, return_counts=True)
+    upper_ranks = np.cumsum(counts)
+    ranks = (upper_ranks - (counts - 1) / 2.0)[inverse]
+
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2.0
+    mean = n1 * n2 / 2.0
+    tie_term = np.sum(counts**3 - counts) / (n * (n - 1)) if n > 1 else 0.0
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_term)
+    if variance <= 0:
+        return float(u), 1.0
+    z = (u - mean - 0.5) / math.sqrt(variance)
+    return float(u), 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def baseline_samples(conn, key, label, fid=None):
+    query = (
+        "SELECT results.samples, results.fingerprint FROM results JOIN runs ON results.run_id = runs.id "
+        "WHERE runs.label = ? AND suite = ? AND op = ? AND size = ? AND dtype = ? AND world_size = ? AND backend = ?"
+    )
+    params = [label, *key]
+    if fid is not None:
+        query += " AND results.fingerprint = ?"
+        params.append(fid)
+    samples, fids = [], set()
+    for row_samples, row_fid in conn.execute(query, params):
+        samples += json.loads(row_samples)
+        fids.add(row_fid)
+    return samples, fids
+
+
+def fingerprint_changes(conn, baseline_fids, candidate_fingerprint):
+    changes = set()
+    for fid in baseline_fids:
+        (details,) = conn.execute("SELECT details FROM fingerprints WHERE id = ?", (fid,)).fetchone()
+        details = json.loads(details)
+        for field in sorted(set(details) | set(candidate_fingerprint)):
+            if details.get(field) != candidate_fingerprint.get(field):
+                changes.add(f"{field}: {details.get(field)} -> {candidate_fingerprint.get(field)}")
+    return sorted(changes)
+
+
+def compare(conn, records, label, threshold, alpha, same_fingerprint=False):
+    """
+    One row per candidate measurement, flagged when it is significantly and materially slower than the baseline
+    """
+    rows = []
+    changes = set()
+    for record in records:
+        key = result_key(record)
+        fingerprint = record.get("fingerprint", {})
+        fid = fingerprint_id(fingerprint) if same_fingerprint else None
+        baseline, baseline_fids = baseline_samples(conn, key, label, fid)
+        candidate = record_samples(record)
+        row = {"key": key, "candidate": float(np.median(candidate)), "baseline": None, "change": None, "p": None, "status": "no baseline"}
+        if len(baseline) > 0:
+            changes.update(fingerprint_changes(conn, baseline_fids, fingerprint))
+            _, p = mann_whitney_u(baseline, candidate)
+            row["baseline"] = float(np.median(baseline))
+            row["change"] = row["candidate"] / row["baseline"] - 1
+            row["p"] = p
+            row["status"] = "REGRESSION" if (p < alpha and row["change"] > threshold) else "ok"
+        rows.append(row)
+    return rows, sorted(changes)
+
+
+def print_comparison(rows, changes):
+    if len(changes) > 0:
+        print("Fingerprint changes since the baseline:")
+        for change in changes:
+            print(f"  {change}")
+    header = f"\n{'Suite':14s} {'Op':12s} {'Size':22s} {'Dtype':10s} {'World':6s} {'Baseline (us)':14s} {'Candidate (us)':15s} {'Change':9s} {'p-value':9s} {'Status':12s}\n"
+    header += "-" * 130
+    print(header)
+    for row in rows:
+        suite, op, size, dtype, world_size, _ = row["key"]
+        baseline = "-" if row["baseline"] is None else f"{row['baseline'] * 1e6:.3f}"
+        change = "-" if row["change"] is None else f"{100 * row['change']:+.1f}%"
+        p = "-" if row["p"] is None else f"{row['p']:.2g}"
+        print(
+            f"{suite:14s} {op:12s} {size:22s} {dtype:10s} {world_size:<6d} {baseline:14s} {row['candidate'] * 1e6:<15.3f} "
+            f"{change:9s} {p:9s} {row['status']:12s}"
+        )
+
+
+def list_runs(conn):
+    query = (
+        "SELECT runs.id, runs.label, runs.source, runs.ingested, COUNT(results.run_id) FROM runs "
+        "LEFT JOIN results ON results.run_id = runs.id GROUP BY runs.id ORDER BY runs.id"
+    )
+    print(f"{'Run':6s} {'Label':20s} {'Ingested':20s} {'Results':8s} Source")
+    for run_id, label, source, ingested, count in conn.execute(query):
+        print(f"{run_id:<6d} {label:20s} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ingested)):20s} {count:<8d} {source}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store benchmark results and detect regressions against a baseline")
+    parser.add_argument("--db", type=str, default="results.db", help="SQLite database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Store JSON lines written with --results-file / --results_file")
+    ingest_parser.add_argument("results", nargs="+")
+    ingest_parser.add_argument("--label", type=str, default="baseline", help="Label of the stored run, e.g. baseline")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare results against a stored baseline, exit 1 on regressions")
+    compare_parser.add_argument("results", nargs="+")
+    compare_parser.add_argument("--baseline-label", type=str, default="baseline")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.05, help="Relative slowdown of the median that counts as a regression"
+    )
+    compare_parser.add_argument("--alpha", type=float, default=0.01, help="Significance level of the Mann-Whitney U test")
+    compare_parser.add_argument(
+        "--same-fingerprint",
+        action="store_true",
+        help="Only compare against baselines from identical hardware and software (default: any, e.g. across an NCCL upgrade)",
+    )
+
+    subparsers.add_parser("list", help="List stored runs")
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+    if args.command == "ingest":
+        records = load_records(args.results)
+        run_id = ingest(conn, records, args.label, ",".join(args.results))
+        print(f"Stored {len(records)} results as run {run_id} ({args.label}) in {args.db}")
+    elif args.command == "compare":
+        rows, changes = compare(
+            conn, load_records(args.results), args.baseline_label, args.threshold, args.alpha, args.same_fingerprint
+        )
+        print_comparison(rows, changes)
+        regressions = sum(row["status"] == "REGRESSION" for row in rows)
+        print(f"\n{regressions} regressions in {len(rows)} results")
+        sys.exit(1 if regressions > 0 else 0)
+    else:
+        list_runs(conn)
+
+
+if __name__ == "__main__":
+    main()
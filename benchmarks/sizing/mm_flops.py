@@ -5,7 +5,9 @@ import numpy as np
 import argparse
 import os
 
-from utils import Tee, benchmark_mm, print_benchmark_header
+from utils import (DEFAULT_CACHE_FILE, GemmBuffers, Tee, benchmark_mm, default_dtypes, fp8_shape_supported, mm_operand_shapes,
+                   print_benchmark_header, print_dtype_header, print_dtype_matrix, set_adaptive_timing, set_benchmark_device,
+                   set_benchmark_dtype, set_result_cache, write_results)
 
 file_dir = os.path.abspath(os.path.dirname(__file__))
 
@@ -25,10 +27,20 @@ if __name__ == '__main__':
 
     parser.add_argument("--num_iterations", type=int, default=200, help='The number of iterations used to benchmark each GEMM')
     parser.add_argument("--num_warmup_iterations", type=int, default=50, help='The number of warmup iterations')
+    parser.add_argument("--ci_target", type=float, default=None, help="Adaptive mode: iterate until the 95%% confidence interval half-width is within this fraction of the mean time (replaces --num_iterations)")
+    parser.add_argument("--max_time", type=float, default=60.0, help="Adaptive mode: seconds after which a benchmark stops iterating regardless of --ci_target")
+    parser.add_argument("--min_iterations", type=int, default=10, help="Adaptive mode: iterations timed before the first confidence interval check")
     parser.add_argument("--cuda_device", type=int, default=0, help="The cuda device to run the benchmark on")
+    parser.add_argument("--device", type=str, default="cuda", choices=["cuda", "cpu"], help="Run on the cuda device or on the host CPU")
+    parser.add_argument("--dtype", type=str, nargs="+", default=None, choices=["fp32", "tf32", "fp16", "bf16", "fp8"], help="Operand dtypes, one table each (default: fp16 on cuda, fp32 on cpu)")
+    parser.add_argument("--num_threads", type=int, default=None, help="CPU threads used by --device cpu (default: torch's default)")
     parser.add_argument("--output_file", type=str, default=f"{file_dir}/results/mm.out")
     parser.add_argument("--notes", type=str, default="", help="benchmark-specific notes to add to the output_file's header")
     parser.add_argument("--verbose", default=True, action=argparse.BooleanOptionalAction, help='log to stdout besides output_file?')
+    parser.add_argument("--results_file", type=str, default=None, help="Append every measurement with its per-iteration samples as JSON lines (see benchmarks/results_db.py)")
+    parser.add_argument("--cache_file", type=str, default=DEFAULT_CACHE_FILE, help="SQLite cache of measured GEMMs, reused on the same device, driver and software")
+    parser.add_argument("--cache_ttl", type=float, default=168, help="Hours after which a cached GEMM is measured again")
+    parser.add_argument("--force", action="store_true", help="Measure every GEMM even if it is cached, and update the cache")
     args = parser.parse_args()
 
     m = args.m
@@ -45,16 +57,37 @@ if __name__ == '__main__':
         start,stop,step = args.k_range
         k = np.arange(start,stop,step)
     
-    # set cuda device
-    torch.cuda.set_device(f"cuda:{args.cuda_device}")
+    # set cuda device, or the host and its thread count
+    set_benchmark_device(args.device, args.cuda_device, num_threads=args.num_threads)
+    dtypes = args.dtype or default_dtypes()
+
+    set_adaptive_timing(args.ci_target, args.max_time, args.min_iterations)
 
     sys.stdout = Tee(args.output_file, args.verbose)
     print_benchmark_header(args.notes)
+    set_result_cache(args.cache_file, args.cache_ttl * 3600, args.force)
+
+    sizes = [(int(M), int(N), int(K)) for M in m for N in n for K in k]
+    dtype_sizes = {dtype: sizes for dtype in dtypes}
+    if "fp8" in dtypes:
+        dtype_sizes["fp8"] = [size for size in sizes if fp8_shape_supported(*size)]
+        skipped = [size for size in sizes if not fp8_shape_supported(*size)]
+        if len(skipped) > 0:
+            print(f"NOTE: torch._scaled_mm needs dimensions divisible by 16, skipping {len(skipped)} fp8 shapes: "
+                  f"{', '.join('x'.join(str(dim) for dim in size) for size in skipped)}")
+    for dtype in dtypes:
+        if len(dtype_sizes[dtype]) == 0 or not set_benchmark_dtype(dtype):
+            continue
+        print_dtype_header(dtype)
+        # operands of the largest shape are generated on the device once, every shape runs on views of them
+        buffers = GemmBuffers.for_shapes([mm_operand_shapes(*size) for size in dtype_sizes[dtype]])
 
-    # loop through all sizes to benchmark
-    for M in m:
-        for N in n:
-            for K in k:
-                benchmark_mm(M, N, K, args.num_iterations, args.num_warmup_iterations)
+        # loop through all sizes to benchmark
+        for M, N, K in dtype_sizes[dtype]:
+            benchmark_mm(M, N, K, args.num_iterations, args.num_warmup_iterations, buffers=buffers)
+        # free this dtype's operands before the next dtype allocates its own
+        del buffers
+    print_dtype_matrix(dtypes)
 
-     
+    if args.results_file is not None:
+        write_results(args.results_file)
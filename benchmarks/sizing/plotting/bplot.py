@@ -33,7 +33,8 @@ if __name__ == '__main__':
         else:
             range_cols.append(col)
 
-    range_cols = list(set(range_cols) - set([throughput_col]))
+    # several dtypes are plotted as one line each
+    range_cols = list(set(range_cols) - set([throughput_col, "dtype"]))
     # XXX: at the moment assuming that only one dimension is a range, the other are fixed
     if len(range_cols) != 1:
         raise ValueError("Currently supporting plotting for benchmarks with one dimension using range")
@@ -42,7 +43,12 @@ if __name__ == '__main__':
     dim_notes = ", ".join(fixed_dim)
 
     plt.figure(dpi=500)
-    plt.plot(df[range_cols[0]], df[throughput_col])
+    if "dtype" in df and df["dtype"].nunique() > 1:
+        for dtype, group in df.groupby("dtype", sort=False):
+            plt.plot(group[range_cols[0]], group[throughput_col], label=dtype)
+        plt.legend()
+    else:
+        plt.plot(df[range_cols[0]], df[throughput_col])
     plt.xlabel(f"{range_cols[0]} ({dim_notes})")
     plt.ylabel("Throughput \n (TFLOP/s)")
     plt.title("Throughput of GEMMs of Various Sizes")
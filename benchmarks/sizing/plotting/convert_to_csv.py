@@ -25,6 +25,13 @@ def read_transformer_logfile(logfile_name):
                     values[value_labels[i-1]] = int(match.group(i))
                 all_values.append(values)
 
+            # blocks benchmarked in several dtypes get one row per (configuration, dtype)
+            match = re.match(r'\*\* dtype: (\w+)', line)
+            if match is not None and len(all_values) > 0:
+                if "dtype" in all_values[-1]:
+                    all_values.append({label: all_values[-1][label] for label in value_labels})
+                all_values[-1]["dtype"] = match.group(1)
+
             match = re.match(r'Throughput \(in TFLOP/s\) for qkv_transform \((.*)\): (\d+\.\d+)', line)
             if match is not None:
                 throughput = float(match.group(2))
@@ -145,29 +152,38 @@ def read_transformer_logfile(logfile_name):
                     all_values[-1]["actual_throughput"] = throughput
     return all_values
 
+def read_dtype(line, dtype):
+    # results follow the "** dtype: <name>" line of their dtype, logs without one are fp16
+    match = re.match(r'\*\* dtype: (\w+)', line)
+    return match.group(1) if match is not None else dtype
+
 def read_mm_logfile(logfile_name):
     throughputs = []
+    dtype = "fp16"
     with open(logfile_name, 'r') as f:
         for line in f:
             line = line.strip()
+            dtype = read_dtype(line, dtype)
             match = re.match(r'Throughput \(in TFLOP/s\) for (\d+)x(\d+)x(\d+): (\d+\.\d+)', line)
             if match is not None:
                 m, n, k = int(match.group(1)), int(match.group(2)), int(match.group(3))
                 throughput = float(match.group(4))
-                throughputs.append({'m': m, 'n': n, 'k': k,
+                throughputs.append({'m': m, 'n': n, 'k': k, 'dtype': dtype,
                                     'throughput': throughput})
     return throughputs
 
 def read_bmm_logfile(logfile_name):
     throughputs = []
+    dtype = "fp16"
     with open(logfile_name, 'r') as f:
         for line in f:
             line = line.strip()
+            dtype = read_dtype(line, dtype)
             match = re.match(r'Throughput \(in TFLOP/s\) for bmm \((\d+)x(\d+)x(\d+)x(\d+)\): (\d+\.\d+)', line)
             if match is not None:
                 b, m, n, k = int(match.group(1)), int(match.group(2)), int(match.group(3)), int(match.group(4))
                 throughput = float(match.group(5))
-                throughputs.append({'b': b, 'm': m, 'n': n, 'k': k,
+                throughputs.append({'b': b, 'm': m, 'n': n, 'k': k, 'dtype': dtype,
                                     'throughput': throughput})
     return throughputs
 
@@ -0,0 +1,85 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from results_db import fingerprint_id
+
+# A week, after which a cached measurement is taken again
+DEFAULT_TTL = 7 * 24 * 3600
+# Outside the source tree, so the binary database is never committed
+DEFAULT_CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "sizing-benchmarks", "cache.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    op TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    device TEXT NOT NULL,
+    details TEXT NOT NULL,
+    measured REAL NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (op, shape, dtype, fingerprint)
+);
+"""
+
+
+class ResultCache:
+    """
+    Sizing results on disk, keyed by (op, shape, dtype) and the fingerprint of the hardware and software they were
+    measured with. Entries older than ttl seconds are ignored.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.ttl = ttl
+
+    def _oldest(self):
+        return 0.0 if self.ttl is None else time.time() - self.ttl
+
+    def get(self, op, shape, dtype, fingerprint):
+        row = self.conn.execute(
+            "SELECT record FROM cache WHERE op = ? AND shape = ? AND dtype = ? AND fingerprint = ? AND measured >= ?",
+            (op, shape, dtype, fingerprint_id(fingerprint), self._oldest()),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, record, fingerprint):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["op"], record["shape"], record["dtype"], fingerprint_id(fingerprint), fingerprint["device"],
+                 json.dumps(fingerprint, sort_keys=True), time.time(), json.dumps(record)),
+            )
+
+    def invalidate(self, fingerprint):
+        """
+        Drop the results of this device measured with other drivers or software versions, returns how many
+        """
+        with self.conn:
+            return self.conn.execute(
+                "DELETE FROM cache WHERE device = ? AND fingerprint != ?", (fingerprint["device"], fingerprint_id(fingerprint))
+            ).rowcount
+
+    def devices(self):
+        return [device for (device,) in self.conn.execute("SELECT DISTINCT device FROM cache ORDER BY device")]
+
+    def records(self, dtype=None, device=None):
+        """
+        Every unexpired record, optionally of one dtype (--results_file name) and device
+        """
+        query = "SELECT record FROM cache WHERE measured >= ?"
+        params = [self._oldest()]
+        if dtype is not None:
+            query += " AND dtype = ?"
+            params.append(dtype)
+        if device is not None:
+            query += " AND device = ?"
+            params.append(device)
+        return [json.loads(record) for (record,) in self.conn.execute(query, params)]
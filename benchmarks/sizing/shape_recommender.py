@@ -0,0 +1,309 @@
+import argparse
+import math
+import os
+
+import numpy as np
+
+from result_cache import DEFAULT_CACHE_FILE, DEFAULT_TTL, ResultCache
+from wave_analysis import (
+    DEFAULT_TILES,
+    DTYPE_NAMES,
+    GPU_SMS,
+    best_efficiency,
+    gemm_dims,
+    load_measured,
+    measurement,
+    parse_tiles,
+    recommend_vocab_padding,
+    resolve_sms,
+    transformer_gemms,
+)
+
+
+def parse_count(value):
+    """
+    Parameter counts like 6.7e9, 1.3B or 350M
+    """
+    suffixes = {"K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+    value = value.strip().upper()
+    if value[-1] in suffixes:
+        return float(value[:-1]) * suffixes[value[-1]]
+    return float(value)
+
+
+def num_parameters(hidden_size, num_layers, vocab_size):
+    # 12h^2 + 13h per layer (QKV, projection, MLP, biases and layer norms) plus the tied embedding
+    return num_layers * (12 * hidden_size**2 + 13 * hidden_size) + vocab_size * hidden_size
+
+
+def candidate_shapes(args):
+    """
+    Every (hidden_size, num_attention_heads, num_layers, microbatch_size) meeting the constraints
+    """
+    t = args.tensor_mp_size
+    if args.hidden_size_range:
+        hidden_sizes = range(*args.hidden_size_range)
+    else:
+        # params ~ 12 * layers * h^2 with layers = h / aspect ratio bounds h
+        low = (args.params * args.min_aspect_ratio / 12) ** (1 / 3)
+        high = (args.params * args.max_aspect_ratio / 12) ** (1 / 3)
+        step = args.hidden_size_multiple
+        hidden_sizes = range(max(step, math.ceil(low / step) * step), int(high) + 1, step)
+
+    candidates = []
+    for hidden_size in hidden_sizes:
+        if hidden_size % t != 0:
+            continue
+        num_layers = round((args.params - args.vocab_size * hidden_size) / (12 * hidden_size**2 + 13 * hidden_size))
+        num_layers = max(args.layers_multiple, round(num_layers / args.layers_multiple) * args.layers_multiple)
+        params = num_parameters(hidden_size, num_layers, args.vocab_size)
+        if abs(params / args.params - 1) > args.param_tolerance:
+            continue
+        if not args.min_aspect_ratio <= hidden_size / num_layers <= args.max_aspect_ratio:
+            continue
+        for head_dim in range(args.head_dim_multiple, args.max_head_dim + 1, args.head_dim_multiple):
+            if head_dim < args.min_head_dim or hidden_size % head_dim != 0:
+                continue
+            num_attention_heads = hidden_size // head_dim
+            if num_attention_heads % t != 0:
+                continue
+            for microbatch_size in args.microbatch_size:
+                candidates.append((hidden_size, num_attention_heads, num_layers, microbatch_size))
+    return candidates
+
+
+def cached_measurements(path, ttl, device=None, sms=None):
+    """
+    (op, dtype, shape, TFLOP/s) of the unexpired results in the benchmarks' --cache_file, of the given device or else
+    of the only device in it with this many SMs
+    """
+    if not os.path.exists(path):
+        return []
+    cache = ResultCache(path, ttl)
+    if device is not None:
+        return [measurement(record) for record in cache.records(device=device)]
+    records = cache.records()
+    # results of CPUs or other GPUs would calibrate the peak of the modelled GPU on the wrong timings
+    matching = [record for record in records if record.get("fingerprint", {}).get("sms") == sms]
+    if len(matching) < len(records):
+        print(f"Ignoring {len(records) - len(matching)} cached results not measured on a GPU with {sms} SMs, "
+              f"use them with --cache_device")
+    devices = sorted({record["fingerprint"]["device"] for record in matching})
+    if len(devices) > 1:
+        raise SystemExit(f"{path} has results of several devices with {sms} SMs, pick one with --cache_device: "
+                         f"{'; '.join(devices)}")
+    return [measurement(record) for record in matching]
+
+
+def measured_durations(measured, dtype):
+    """
+    Fastest measured seconds of every (batch, rows, cols, shared) GEMM of dtype
+    """
+    durations = {}
+    for op, measured_dtype, shape, tflops in measured:
+        if measured_dtype != DTYPE_NAMES[dtype]:
+            continue
+        dims = gemm_dims(op, shape)
+        duration = 2 * math.prod(dims) / (tflops * 1e12)
+        durations[dims] = min(duration, durations.get(dims, math.inf))
+    return durations
+
+
+def calibrate_peak(durations, sms, tiles, tile_k):
+    """
+    Median measured / predicted throughput, which turns predicted efficiency into TFLOP/s for unmeasured shapes
+    """
+    if len(durations) == 0:
+        return None
+    dims = np.array(list(durations))
+    efficiency, _ = best_efficiency(*dims.T, sms, tiles, tile_k)
+    tflops = 2 * np.prod(dims, axis=1) / np.array(list(durations.values())) / 1e12
+    return float(np.median(tflops / efficiency))
+
+
+def score_candidates(candidates, durations, peak, args, sms, tiles):
+    """
+    Forward GEMM time of one microbatch through every layer and the logit block of each candidate, measured where
+    a result exists and predicted by the wave model otherwise
+    """
+    scored = []
+    vocab_paddings = {}
+    for hidden_size, num_attention_heads, num_layers, microbatch_size in candidates:
+        key = (hidden_size, microbatch_size)
+        if key not in vocab_paddings:
+            vocab_paddings[key], _, _ = recommend_vocab_padding(
+                args.vocab_size, hidden_size, microbatch_size, args.seq_length, sms, tiles, args.tensor_mp_size,
+                args.tile_k)
+        vocab_size = vocab_paddings[key]
+        gemms = transformer_gemms(hidden_size, num_attention_heads, vocab_size, microbatch_size, args.seq_length,
+                                  args.tensor_mp_size)
+        elapsed_time, flops, num_measured = 0.0, 0.0, 0
+        for label, *dims in gemms:
+            dims = tuple(int(dim) for dim in dims)
+            repeat = 1 if label == "logit_block" else num_layers
+            gemm_flops = 2 * math.prod(dims)
+            if dims in durations:
+                gemm_time = durations[dims]
+                num_measured += 1
+            else:
+                efficiency, _ = best_efficiency(*dims, sms, tiles, args.tile_k)
+                # without any measurement the time is in units of the time at peak
+                gemm_time = gemm_flops / ((peak or 1.0) * 1e12 * float(efficiency))
+            elapsed_time += repeat * gemm_time
+            flops += repeat * gemm_flops
+        scored.append({
+            "hidden_size": hidden_size,
+            "num_attention_heads": num_attention_heads,
+            "head_dim": hidden_size // num_attention_heads,
+            "num_layers": num_layers,
+            "vocab_size": vocab_size,
+            "microbatch_size": microbatch_size,
+            "params": num_parameters(hidden_size, num_layers, vocab_size),
+            "tflops": flops / elapsed_time / 1e12,
+            "tokens_per_second": microbatch_size * args.seq_length / elapsed_time,
+            "gemms": gemms,
+            "measured": num_measured,
+        })
+    scored.sort(key=lambda candidate: -candidate["tokens_per_second"])
+    return scored
+
+
+def setup_benchmarks(args):
+    """
+    Prepare --benchmark runs, which read and add to the cache, returns the cache's name of the benchmarked device
+    """
+    # utils imports megatron and torch, only benchmarking runs need them
+    import utils
+
+    utils.set_benchmark_device(args.device, args.cuda_device)
+    utils.set_result_cache(args.cache_file, args.cache_ttl * 3600)
+    if not utils.set_benchmark_dtype(args.dtype):
+        raise SystemExit(f"Can't benchmark {args.dtype} on {args.device}")
+    return utils.cache_fingerprint()["device"]
+
+
+def benchmark_missing(top, durations, args):
+    """
+    Measure the GEMMs of the top candidates that have no result yet into the cache and --results_file
+    """
+    import utils
+
+    missing = {}
+    for candidate in top:
+        for label, *dims in candidate["gemms"]:
+            dims = tuple(int(dim) for dim in dims)
+            if dims not in durations:
+                missing[dims] = label
+    if args.dtype == "fp8":
+        # fp8 BMMs run in bf16, only the 2D GEMMs go through torch._scaled_mm
+        unsupported = [dims for dims in missing if dims[0] == 1 and not utils.fp8_shape_supported(*dims[1:])]
+        if len(unsupported) > 0:
+            print(f"NOTE: torch._scaled_mm needs dimensions divisible by 16, skipping {len(unsupported)} fp8 GEMMs")
+        for dims in unsupported:
+            del missing[dims]
+    print(f"Benchmarking {len(missing)} GEMMs of the top {len(top)} candidates that have no results yet")
+    for (batch, rows, cols, shared), label in missing.items():
+        if batch == 1:
+            utils.benchmark_mm(rows, shared, cols, args.num_iterations, args.num_warmup_iterations)
+        else:
+            utils.benchmark_bmm(batch, rows, shared, cols, label, args.num_iterations, args.num_warmup_iterations)
+    if args.results_file is not None:
+        utils.write_results(args.results_file)
+    utils.RESULTS.clear()
+
+
+def print_candidates(top, measured_peak, args):
+    unit = "TFLOP/s" if measured_peak or args.peak_tflops else "x peak"
+    # the candidates are ranked by tokens/s, without a peak only relative to the best one
+    tokens_header = "Tokens/s" if unit == "TFLOP/s" else "Rel. tokens/s"
+    print(f"{'Rank':>4s} {'Hidden':>7s} {'Heads':>6s} {'Head dim':>9s} {'Layers':>7s} {'Params':>9s} {'Vocab':>7s} "
+          f"{'Microbatch':>11s} {'Predicted ' + unit:>18s} {tokens_header:>13s} {'Measured':>9s}")
+    for rank, candidate in enumerate(top, start=1):
+        if unit == "TFLOP/s":
+            tokens = f"{candidate['tokens_per_second']:.1f}"
+        else:
+            tokens = f"{candidate['tokens_per_second'] / top[0]['tokens_per_second']:.3f}"
+        print(f"{rank:>4d} {candidate['hidden_size']:>7d} {candidate['num_attention_heads']:>6d} "
+              f"{candidate['head_dim']:>9d} {candidate['num_layers']:>7d} {candidate['params'] / 1e9:>8.2f}B "
+              f"{candidate['vocab_size']:>7d} {candidate['microbatch_size']:>11d} {candidate['tflops']:>18.3f} "
+              f"{tokens:>13s} {candidate['measured']:>6d}/{len(candidate['gemms'])}")
+
+
+def recommend(args):
+    sms = resolve_sms(args)
+    tiles = parse_tiles(args.tiles)
+    candidates = candidate_shapes(args)
+    if len(candidates) == 0:
+        raise SystemExit("No shape meets the constraints, widen --param_tolerance, the head dim or aspect ratio limits")
+
+    if args.benchmark:
+        # results of the benchmarked device only, measured and predicted times must be comparable
+        args.cache_device = setup_benchmarks(args)
+    durations = measured_durations(load_measured(args.results) + cached_measurements(
+        args.cache_file, args.cache_ttl * 3600, args.cache_device, sms), args.dtype)
+    measured_peak = calibrate_peak(durations, sms, tiles, args.tile_k)
+    peak = args.peak_tflops or measured_peak
+    scored = score_candidates(candidates, durations, peak, args, sms, tiles)
+
+    # measuring the top candidates can reorder them, repeat until the top ones are all measured
+    for _ in range(args.benchmark_rounds if args.benchmark else 0):
+        top = scored[:args.top]
+        if all(candidate["measured"] == len(candidate["gemms"]) for candidate in top):
+            break
+        benchmark_missing(top, durations, args)
+        durations = measured_durations(load_measured(args.results) + cached_measurements(
+            args.cache_file, args.cache_ttl * 3600, args.cache_device, sms), args.dtype)
+        measured_peak = calibrate_peak(durations, sms, tiles, args.tile_k)
+        peak = args.peak_tflops or measured_peak
+        scored = score_candidates(candidates, durations, peak, args, sms, tiles)
+
+    print(f"{len(candidates)} candidate shapes for {args.params / 1e9:.2f}B parameters, "
+          f"{len(durations)} measured {args.dtype} GEMMs, {sms} SMs")
+    if peak is not None:
+        print(f"Unmeasured GEMMs predicted from the wave model at a peak of {peak:.1f} TFLOP/s")
+    print()
+    print_candidates(scored[:args.top], measured_peak, args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rank transformer shapes of a target size by predicted GEMM throughput")
+    parser.add_argument("--params", type=parse_count, required=True, help="Target parameter count, e.g. 6.7e9 or 7B")
+    parser.add_argument("--vocab_size", type=int, default=50257, help="Vocabulary size before padding")
+    parser.add_argument("--seq_length", type=int, default=2048)
+    parser.add_argument("--microbatch_size", nargs="+", type=int, default=[1, 2, 4, 8], help="Microbatch sizes to consider")
+    parser.add_argument("--tensor_mp_size", type=int, default=1, help="Heads, hidden size and vocab must split over this many ranks")
+    parser.add_argument("--layers_multiple", type=int, default=1, help="Number of layers must be a multiple of this, e.g. the pipeline size")
+    parser.add_argument("--hidden_size_range", nargs="+", type=int, default=None,
+                        help="Hidden sizes to consider, [start,stop,step] (default: from the aspect ratio limits)")
+    parser.add_argument("--hidden_size_multiple", type=int, default=128, help="Step of the default hidden sizes")
+    parser.add_argument("--min_head_dim", type=int, default=64)
+    parser.add_argument("--max_head_dim", type=int, default=256)
+    parser.add_argument("--head_dim_multiple", type=int, default=32)
+    parser.add_argument("--min_aspect_ratio", type=float, default=32, help="Minimum hidden size / number of layers")
+    parser.add_argument("--max_aspect_ratio", type=float, default=256, help="Maximum hidden size / number of layers")
+    parser.add_argument("--param_tolerance", type=float, default=0.05, help="Allowed relative deviation from --params")
+    parser.add_argument("--top", type=int, default=10, help="Number of shapes to print")
+    parser.add_argument("--dtype", type=str, default="bf16", choices=list(DTYPE_NAMES))
+    parser.add_argument("--results", nargs="+", type=str, default=[],
+                        help="Measured GEMMs, --results_file JSON lines (.jsonl) or logs of the sizing benchmarks")
+    parser.add_argument("--peak_tflops", type=float, default=None, help="Peak TFLOP/s (default: calibrated on --results)")
+    parser.add_argument("--sms", type=int, default=None, help="Number of SMs/CUs (default: --gpu, or the local GPU)")
+    parser.add_argument("--gpu", type=str, default=None, choices=list(GPU_SMS), help="Take the SM count of this GPU")
+    parser.add_argument("--tiles", nargs="+", type=str, default=DEFAULT_TILES, help="Candidate output tiles, ROWSxCOLS[:RELATIVE_THROUGHPUT]")
+    parser.add_argument("--tile_k", type=int, default=32, help="Step of the kernels' main loop over the shared dimension")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Measure the GEMMs of the top candidates that --results has no results for, then re-rank")
+    parser.add_argument("--benchmark_rounds", type=int, default=3, help="Maximum benchmark and re-rank rounds of --benchmark")
+    parser.add_argument("--cache_file", type=str, default=DEFAULT_CACHE_FILE,
+                        help="Measured GEMMs cached by the sizing benchmarks, --benchmark adds to it")
+    parser.add_argument("--cache_ttl", type=float, default=DEFAULT_TTL / 3600, help="Hours after which cached GEMMs are ignored")
+    parser.add_argument("--cache_device", type=str, default=None,
+                        help="Use the cached results of this device (default: the benchmarked one, or the only one in --cache_file "
+                             "with the SM count of --gpu/--sms)")
+    parser.add_argument("--results_file", type=str, default=None, help="Also append the results of --benchmark to this file")
+    parser.add_argument("--device", type=str, default="cuda", choices=["cuda", "cpu"], help="Device --benchmark runs on")
+    parser.add_argument("--cuda_device", type=int, default=0, help="The cuda device --benchmark runs on")
+    parser.add_argument("--num_iterations", type=int, default=200, help='The number of iterations used to benchmark each GEMM')
+    parser.add_argument("--num_warmup_iterations", type=int, default=50, help='The number of warmup iterations')
+    args = parser.parse_args()
+    recommend(args)
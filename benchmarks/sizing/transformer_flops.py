@@ -19,6 +19,25 @@ from megatron.model.word_embeddings import Embedding
 
 file_dir = os.path.abspath(os.path.dirname(__file__))
 
+def fp8_gemm_dims(args, configuration):
+    """
+    Dimensions of the GEMMs that the selected blocks run through torch._scaled_mm in an fp8 run, BMMs stay in bf16
+    """
+    (microbatch_size, hidden_size, (tensor_mp_size, _, _), _, vocab_size, seq_length, _) = configuration
+    gemms = {
+        'qkv_transform': (hidden_size, 3 * hidden_size // tensor_mp_size),
+        'attention_linear_projection': (hidden_size // tensor_mp_size, hidden_size),
+        'mlp_h_to_4h': (hidden_size, 4 * hidden_size // tensor_mp_size),
+        'mlp_4h_to_h': (4 * hidden_size // tensor_mp_size, hidden_size),
+        'logit_block': (vocab_size, hidden_size),
+    }
+    dims = set()
+    for block, block_dims in gemms.items():
+        if block in args.blocks or 'all' in args.blocks:
+            # the linears run on the activations flattened to (microbatch * sequence) rows
+            dims.update(block_dims + (microbatch_size * seq_length,))
+    return dims
+
 # benchmarks the individual components of the transformer.  Will only be used if --layers is specified and will only benchmark the layers specified
 def benchmark_transformer_from_mm_and_bmm(args, configuration, seq_length, global_batch_size, num_iterations, num_warmup_iterations):
 
@@ -232,12 +251,20 @@ if __name__ == '__main__':
                           attention_over_value, attention_linear_projection, mlp_h_to_4h, mlp_4h_to_h, logit_block, layer_norm, dropout, add_bias_dropout, softmax, gelu]')
 
     parser.add_argument("--use_flash", action="store_true", help="Use flash  attention")
+    parser.add_argument("--dtype", type=str, nargs="+", default=None, choices=["fp32", "tf32", "fp16", "bf16", "fp8"], help="With --blocks, the dtypes to benchmark every block in, one table each (default: fp16)")
     parser.add_argument("--num_iterations", type=int, default=200, help='The number of iterations used to benchmark each BMM')
     parser.add_argument("--num_warmup_iterations", type=int, default=50, help='The number of warmup iterations')
+    parser.add_argument("--ci_target", type=float, default=None, help="Adaptive mode: iterate until the 95%% confidence interval half-width is within this fraction of the mean time (replaces --num_iterations)")
+    parser.add_argument("--max_time", type=float, default=60.0, help="Adaptive mode: seconds after which a benchmark stops iterating regardless of --ci_target")
+    parser.add_argument("--min_iterations", type=int, default=10, help="Adaptive mode: iterations timed before the first confidence interval check")
     parser.add_argument("--cuda_device", type=int, default=0, help="The cuda device to run the benchmark on")
     parser.add_argument("--notes", type=str, default="", help="benchmark-specific notes to add to the output_file's header")
     parser.add_argument("--output_file", type=str, default=f"{file_dir}/results/mm.out")
     parser.add_argument("--verbose", default=True, action=argparse.BooleanOptionalAction, help='log to stdout besides output_file?')
+    parser.add_argument("--results_file", type=str, default=None, help="Append every measurement with its per-iteration samples as JSON lines (see benchmarks/results_db.py)")
+    parser.add_argument("--cache_file", type=str, default=DEFAULT_CACHE_FILE, help="SQLite cache of measured GEMMs, reused on the same device, driver and software")
+    parser.add_argument("--cache_ttl", type=float, default=168, help="Hours after which a cached GEMM is measured again")
+    parser.add_argument("--force", action="store_true", help="Measure every GEMM even if it is cached, and update the cache")
     args = parser.parse_args()
 
     h = args.hidden_size
@@ -270,10 +297,13 @@ if __name__ == '__main__':
         start,stop,step = args.global_batch_size_range
         global_batch_size = np.arange(start,stop,step)
 
-    torch.cuda.set_device(f"cuda:{args.cuda_device}")
+    set_benchmark_device("cuda", args.cuda_device)
+
+    set_adaptive_timing(args.ci_target, args.max_time, args.min_iterations)
 
     sys.stdout = Tee(args.output_file, args.verbose)
     print_benchmark_header(args.notes)
+    set_result_cache(args.cache_file, args.cache_ttl * 3600, args.force)
 
     configurations = []
     for train_batch_size in global_batch_size:
@@ -303,5 +333,17 @@ if __name__ == '__main__':
             if args.blocks is None:
                 benchmark_transformer(args,configuration, seq_length, train_batch_size, args.num_iterations, args.num_warmup_iterations)
             else:
-                benchmark_transformer_from_mm_and_bmm(args,configuration, seq_length, train_batch_size, args.num_iterations, args.num_warmup_iterations)
+                for dtype in args.dtype or default_dtypes():
+                    if dtype == "fp8" and not fp8_shape_supported(*fp8_gemm_dims(args, configuration)):
+                        print("NOTE: torch._scaled_mm needs dimensions divisible by 16, skipping fp8 for this configuration")
+                        continue
+                    if set_benchmark_dtype(dtype):
+                        print_dtype_header(dtype)
+                        benchmark_transformer_from_mm_and_bmm(args,configuration, seq_length, train_batch_size, args.num_iterations, args.num_warmup_iterations)
             print("=" * 120)
+
+    if args.blocks is not None:
+        print_dtype_matrix(args.dtype or default_dtypes())
+
+    if args.results_file is not None:
+        write_results(args.results_file)
@@ -1,3 +1,5 @@
+import json
+import math
 import platform
 import sys
 import shlex
@@ -13,6 +15,95 @@ from megatron.model.activations import bias_gelu_impl
 from megatron.model.gpt2_model import gpt2_attention_mask_func as attention_mask_func
 from megatron.model.word_embeddings import Embedding
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from results_db import get_fingerprint
+from result_cache import DEFAULT_CACHE_FILE, DEFAULT_TTL, ResultCache
+
+# Every GEMM measured by this process, see record_result
+RESULTS = []
+# On-disk results reused instead of measuring again, see set_result_cache
+CACHE = None
+FORCE = False
+
+# --dtype choices: the GEMM operand dtype, tf32 is fp32 storage with TF32 tensor core math
+DTYPES = {
+    "fp32": torch.float32,
+    "tf32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "fp8": getattr(torch, "float8_e4m3fn", None),
+}
+# dtype of the recorded results, i.e. part of the result key
+DTYPE_NAMES = {"fp32": "float32", "tf32": "tf32", "fp16": "float16", "bf16": "bfloat16", "fp8": "float8_e4m3fn"}
+
+# Device and dtype of every benchmark, see set_benchmark_device and set_benchmark_dtype
+DEVICE = torch.device("cuda")
+DTYPE_NAME = "fp16"
+DTYPE = torch.float16
+# dtype of GEMM outputs and of the fused ops, which only differs from DTYPE for fp8
+OUTPUT_DTYPE = torch.float16
+# per-tensor scale of the fp8 operands, see fp8_mm
+FP8_SCALE = None
+
+def default_dtypes():
+    return ["fp16"] if DEVICE.type == "cuda" else ["fp32"]
+
+def set_benchmark_device(device="cuda", cuda_device=0, dtype=None, num_threads=None):
+    """
+    Select where the benchmarks run: the given CUDA device, or the host with num_threads intra-op threads.
+    dtype defaults to fp16 on GPUs and fp32 on CPUs, where fp16 GEMMs are not a realistic target.
+    """
+    global DEVICE
+    if device == "cuda":
+        torch.cuda.set_device(f"cuda:{cuda_device}")
+        DEVICE = torch.device(f"cuda:{cuda_device}")
+    else:
+        DEVICE = torch.device("cpu")
+    set_benchmark_dtype(dtype or default_dtypes()[0])
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+def fp8_supported():
+    # torch._scaled_mm needs FP8 tensor cores: Ada, Hopper or newer (or ROCm MI300)
+    return (DEVICE.type == "cuda" and DTYPES["fp8"] is not None and hasattr(torch, "_scaled_mm")
+            and (torch.version.hip is not None or torch.cuda.get_device_capability(DEVICE) >= (8, 9)))
+
+def set_benchmark_dtype(name):
+    """
+    Switch every following benchmark to the --dtype name, returns False if this device can't run it
+    """
+    global DTYPE_NAME, DTYPE, OUTPUT_DTYPE, FP8_SCALE
+    if name in ("tf32", "fp8") and DEVICE.type != "cuda":
+        print(f"WARNING: {name} needs a CUDA device, skipping it")
+        return False
+    if name == "fp8" and not fp8_supported():
+        print("WARNING: fp8 needs torch._scaled_mm and FP8 tensor cores, skipping it")
+        return False
+    if DEVICE.type == "cuda":
+        torch.backends.cuda.matmul.allow_tf32 = name == "tf32"
+    DTYPE_NAME = name
+    DTYPE = DTYPES[name]
+    OUTPUT_DTYPE = torch.bfloat16 if name == "fp8" else DTYPE
+    if name == "fp8":
+        FP8_SCALE = torch.ones((), dtype=torch.float32, device=DEVICE)
+    return True
+
+def print_dtype_header(name):
+    # convert_to_csv.py attributes the following results to this dtype
+    print(f"** dtype: {name}")
+    print("-" * 80)
+
+def device_description():
+    if DEVICE.type == "cuda":
+        return str(torch.cuda.get_device_properties(DEVICE))
+    return (f"cpu: {platform.processor() or platform.machine()}, threads={torch.get_num_threads()}, "
+            f"capability={torch.backends.cpu.get_cpu_capability()}")
+
+def component_versions():
+    if DEVICE.type == "cuda":
+        return f"torch={torch.__version__}, cuda={torch.version.cuda}, nccl={torch.cuda.nccl.version()}"
+    return f"torch={torch.__version__}, mkldnn={torch.backends.mkldnn.is_available()}, openmp={torch.backends.openmp.is_available()}"
+
 def print_benchmark_header(notes="None"):
     
     print(f"""
@@ -23,10 +114,10 @@ Benchmark started on {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}
 
 ** Platform:
 {" ".join(platform.uname())}
-{torch.cuda.get_device_properties(torch.device('cuda'))}
+{device_description()}
 
 ** Critical component versions:
-torch={torch.__version__}, cuda={torch.version.cuda}, nccl={torch.cuda.nccl.version()}
+{component_versions()}
 
 ** Additional notes: 
 {notes}
@@ -35,6 +126,97 @@ torch={torch.__version__}, cuda={torch.version.cuda}, nccl={torch.cuda.nccl.vers
 
 """)
 
+class HostEvent:
+    """
+    Wall-clock stand-in for torch.cuda.Event on CPU runs, elapsed_time is in milliseconds as well
+    """
+    def record(self):
+        self.time = time.perf_counter()
+
+    def elapsed_time(self, end):
+        return (end.time - self.time) * 1000
+
+def create_events():
+    if DEVICE.type == "cuda":
+        return torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+    return HostEvent(), HostEvent()
+
+def synchronize():
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+
+# Adaptive iteration count, see set_adaptive_timing. None times exactly num_iterations
+CI_TARGET = None
+MAX_TIME = 60.0
+MIN_ITERATIONS = 10
+
+def set_adaptive_timing(ci_target=None, max_time=60.0, min_iterations=10):
+    """
+    Instead of a fixed number of iterations, time every benchmark until the half-width of the 95% confidence
+    interval of its mean is within ci_target of the mean, or until max_time seconds have passed
+    """
+    global CI_TARGET, MAX_TIME, MIN_ITERATIONS
+    CI_TARGET = ci_target
+    MAX_TIME = max_time
+    MIN_ITERATIONS = min_iterations
+
+def time_iterations(fn, num_iterations, num_warmup_iterations):
+    """
+    Milliseconds of every timed call of fn, after num_warmup_iterations untimed ones
+    """
+    start, end = create_events()
+
+    def timed():
+        with torch.no_grad():
+            start.record()
+            fn()
+            end.record()
+        synchronize()
+        return start.elapsed_time(end)
+
+    for i in range(num_warmup_iterations):
+        timed()
+    if CI_TARGET is None:
+        return np.array([timed() for i in range(num_iterations)])
+
+    # running sums keep the stopping test O(1) per iteration for microsecond kernels
+    times = []
+    total, total_sq = 0.0, 0.0
+    deadline = time.perf_counter() + MAX_TIME
+    while True:
+        t = timed()
+        times.append(t)
+        total += t
+        total_sq += t * t
+        n = len(times)
+        if n >= MIN_ITERATIONS:
+            mean = total / n
+            std = math.sqrt(max(total_sq / n - mean * mean, 0.0) * n / (n - 1))
+            # normal approximation, n is at least MIN_ITERATIONS
+            if 1.96 * std / math.sqrt(n) <= CI_TARGET * mean or time.perf_counter() > deadline:
+                break
+    return np.array(times)
+
+def timing_stats(times):
+    times = np.asarray(times)
+    mean = float(np.mean(times))
+    std = float(np.std(times, ddof=1)) if len(times) > 1 else 0.0
+    return {
+        "min": float(np.amin(times)),
+        "median": float(np.median(times)),
+        "mean": mean,
+        "p90": float(np.percentile(times, 90)),
+        "p99": float(np.percentile(times, 99)),
+        "std": std,
+        "cv": std / mean if mean > 0 else 0.0,
+    }
+
+def print_timing_stats(label, times):
+    stats = timing_stats(times)
+    print(f"Timing stats (in ms) for {label}: n={len(times)} min={stats['min']:.4f} median={stats['median']:.4f} "
+          f"mean={stats['mean']:.4f} p90={stats['p90']:.4f} p99={stats['p99']:.4f} std={stats['std']:.4f} "
+          f"cv={100 * stats['cv']:.2f}%")
+
 class Tee(object):
     def __init__(self, filename, verbose):
         Path(filename).resolve().parent.mkdir(parents=True, exist_ok=True)
@@ -57,171 +239,282 @@ class Tee(object):
 def display(shape):
     return "x".join([str(dim) for dim in shape])
 
+def cache_fingerprint():
+    fingerprint = dict(get_fingerprint())
+    if DEVICE.type == "cpu":
+        # get_fingerprint names the GPU if there is one, and CPU results also depend on the thread count
+        fingerprint["device"] = f"{platform.processor() or platform.machine()}, threads={torch.get_num_threads()}"
+    else:
+        # lets shape_recommender.py match cached results to the SM count it models
+        fingerprint["sms"] = torch.cuda.get_device_properties(DEVICE).multi_processor_count
+    return fingerprint
+
+def set_result_cache(path, ttl=DEFAULT_TTL, force=False):
+    """
+    Reuse GEMM results measured on this device, driver and software within the last ttl seconds,
+    force measures every GEMM again and overwrites its cached result
+    """
+    global CACHE, FORCE
+    CACHE = ResultCache(path, ttl)
+    FORCE = force
+    fingerprint = cache_fingerprint()
+    dropped = CACHE.invalidate(fingerprint)
+    if dropped > 0:
+        print(f"Dropped {dropped} cached results of {fingerprint['device']} measured with other versions")
+
+def cached_times(op, shape, dtype_name=None):
+    """
+    Per-iteration milliseconds of the cached result of this GEMM, or None if it has to be measured
+    """
+    if CACHE is None or FORCE:
+        return None
+    result = CACHE.get(op, display(shape), DTYPE_NAMES[dtype_name or DTYPE_NAME], cache_fingerprint())
+    if result is None:
+        return None
+    # kept for the dtype tables, but not written to --results_file: it is not a new measurement
+    result["cached"] = True
+    RESULTS.append(result)
+    print(f"Cached result for {op} {display(shape)}, --force to measure again")
+    return np.array(result["samples"]) * 1000
+
+def record_result(op, shape, times, dtype_name=None):
+    # times are the per-iteration milliseconds of the timed (non-warmup) iterations
+    result = {
+        "suite": "sizing",
+        "op": op,
+        "shape": display(shape),
+        "dtype": DTYPE_NAMES[dtype_name or DTYPE_NAME],
+        "duration": float(np.amin(times)) / 1000,
+        "samples": [float(t) / 1000 for t in times],
+        "fingerprint": cache_fingerprint(),
+    }
+    RESULTS.append(result)
+    if CACHE is not None:
+        CACHE.put(result, result["fingerprint"])
+    return result
+
+def print_dtype_matrix(dtype_names):
+    """
+    TFLOP/s of every recorded (op, shape) per dtype, and the speedup of each dtype over the first one
+    """
+    keys = {DTYPE_NAMES[name]: name for name in dtype_names}
+    columns = [name for name in dtype_names if any(DTYPE_NAMES[name] == r["dtype"] for r in RESULTS)]
+    if len(columns) < 2:
+        return
+    throughputs = {}
+    for result in RESULTS:
+        if result["dtype"] in keys:
+            flops = 2 * math.prod(int(dim) for dim in result["shape"].split("x"))
+            throughputs.setdefault((result["op"], result["shape"]), {})[keys[result["dtype"]]] = flops / result["duration"] / 1e12
+    base = columns[0]
+    header = f"{'Op':28s} {'Shape':24s} " + " ".join(f"{name:>10s}" for name in columns)
+    header += " " + " ".join(f"{name + '/' + base:>12s}" for name in columns[1:])
+    print(f"\nThroughput (in TFLOP/s) per dtype")
+    print(header)
+    print("-" * len(header))
+    for (op, shape), row in throughputs.items():
+        line = f"{op:28s} {shape:24s} " + " ".join(f"{row[name]:>10.3f}" if name in row else f"{'-':>10s}" for name in columns)
+        speedups = [f"{row[name] / row[base]:>12.2f}" if name in row and base in row else f"{'-':>12s}" for name in columns[1:]]
+        print(line + " " + " ".join(speedups))
+
+def write_results(path):
+    # JSON lines for results_db.py, appended like the communication suite's --results-file
+    with open(path, "a") as f:
+        for result in RESULTS:
+            if not result.get("cached"):
+                f.write(json.dumps(result) + "\n")
+
+def mm_operand_shapes(m, n, k):
+    return (m, n), (n, k), (m, k)
+
+def mm_b_operand_shapes(m, n, k, b=None):
+    # torch.nn.functional.linear multiplies by the transpose of a (k, n) weight
+    if b is None:
+        return (m, n), (k, n), (m, k)
+    return (b, m, n), (k, n), (b, m, k)
+
+def bmm_operand_shapes(b, m, n, k):
+    return (b, m, n), (b, n, k), (b, m, k)
+
+def is_fp8(dtype):
+    return dtype is not None and dtype.is_floating_point and torch.finfo(dtype).bits == 8
+
+def random_tensor(numel, dtype, device):
+    # randn has no fp8 kernels, draw in bf16 and cast
+    if is_fp8(dtype):
+        return torch.randn(numel, dtype=torch.bfloat16, device=device).to(dtype)
+    return torch.randn(numel, dtype=dtype, device=device)
+
+def batched_dtype():
+    # torch._scaled_mm is 2D only, batched matmuls of an fp8 run stay in the output dtype like in FP8 training
+    return OUTPUT_DTYPE
+
+class GemmBuffers:
+    """
+    Operand storage for every GEMM of a sweep, generated once on the device. Each shape runs on contiguous
+    views of the first elements, so there is no allocation or host-to-device copy between shapes.
+    """
+    def __init__(self, a_numel, b_numel, c_numel, dtype=None, device=None):
+        dtype = dtype or DTYPE
+        device = device or DEVICE
+        self.a = random_tensor(a_numel, dtype, device)
+        self.b = random_tensor(b_numel, dtype, device)
+        self.c = torch.empty(c_numel, dtype=torch.bfloat16 if is_fp8(dtype) else dtype, device=device)
+
+    @classmethod
+    def for_shapes(cls, operand_shapes, dtype=None, device=None):
+        """
+        Sized for the largest A, B and C of operand_shapes, a list of (A shape, B shape, C shape)
+        """
+        a_numel, b_numel, c_numel = (max(math.prod(shapes[i]) for shapes in operand_shapes) for i in range(3))
+        return cls(int(a_numel), int(b_numel), int(c_numel), dtype=dtype, device=device)
+
+    def views(self, a_shape, b_shape, c_shape):
+        return tuple(
+            buffer[:math.prod(shape)].view(*(int(dim) for dim in shape))
+            for buffer, shape in ((self.a, a_shape), (self.b, b_shape), (self.c, c_shape))
+        )
+
+def fp8_shape_supported(*dims):
+    # torch._scaled_mm only takes matrices whose dimensions are all multiples of 16
+    return all(int(dim) % 16 == 0 for dim in dims)
+
+def fp8_mm(A, B, C):
+    """
+    C = A @ B with unit scales, A row-major and B column-major as torch._scaled_mm requires
+    """
+    return torch._scaled_mm(A, B, scale_a=FP8_SCALE, scale_b=FP8_SCALE, out_dtype=C.dtype, out=C)
+
 # Benchmark of a basic GEMM
-def benchmark_mm(m, n, k, num_iterations, num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    A = torch.randn(m, n).half().to("cuda")
-    B = torch.randn(n, k).half().to("cuda")
-    C = torch.empty(m, k).half().to("cuda")
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
+def benchmark_mm(m, n, k, num_iterations, num_warmup_iterations, buffers=None):
+    shapes = mm_operand_shapes(m, n, k)
+    if buffers is None:
+        buffers = GemmBuffers.for_shapes([shapes])
+    A, B, C = buffers.views(*shapes)
+    if DTYPE_NAME == "fp8":
+        # same storage, read as the transpose of a (k, n) matrix to make B column-major
+        B = buffers.views((m, n), (k, n), (m, k))[1].t()
+    def run():
+        if DTYPE_NAME == "fp8":
+            fp8_mm(A, B, C)
+        else:
             torch.mm(A, B, out=C)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    times = cached_times("mm", (m, n, k))
+    if times is None:
+        times = time_iterations(run, num_iterations, num_warmup_iterations)
+        record_result("mm", (m, n, k), times)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {m}x{n}x{k}: {elapsed_time:.3f}")
+    print_timing_stats(f"{m}x{n}x{k}", times)
     print(f"Throughput (in TFLOP/s) for {m}x{n}x{k}: {(2 * m * n * k) / (elapsed_time * 10**12):.3f}")
     print("-" * 80)
     return elapsed_time
 
 # Benchmark of a GEMM with a single batched operator
-def benchmark_mm_b(m, n, k, label, b, num_iterations,num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    B = torch.randn((k, n)).half().to("cuda")
+def benchmark_mm_b(m, n, k, label, b, num_iterations,num_warmup_iterations, buffers=None):
+    shapes = mm_b_operand_shapes(m, n, k, b)
+    if buffers is None:
+        buffers = GemmBuffers.for_shapes([shapes])
+    A, B, C = buffers.views(*shapes)
     if b is None:
-        A = torch.randn((m, n)).half().to("cuda")
-        C = torch.empty((m, k)).half().to("cuda")
         b = 1
-    else:
-        A = torch.randn((b, m, n)).half().to("cuda")
-        C = torch.empty((b, m, k)).half().to("cuda")
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
+    def run():
+        if DTYPE_NAME == "fp8":
+            # linear's (k, n) weight transposed is already column-major
+            fp8_mm(A.view(-1, n), B.t(), C.view(-1, k))
+        else:
             torch.nn.functional.linear(A, B, out=C)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    times = cached_times(label, (b, m, n, k))
+    if times is None:
+        times = time_iterations(run, num_iterations, num_warmup_iterations)
+        record_result(label, (b, m, n, k), times)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({m}x{n}x{k}, b={b}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({m}x{n}x{k}, b={b})", times)
     print(f"Throughput (in TFLOP/s) for {label} ({m}x{n}x{k}, b={b}): "
           f"{(2 * b * m * n * k) / (elapsed_time * 10**12):.3f}")
     return elapsed_time
 
-def benchmark_bmm(b, m, n, k, label,num_iterations, num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    A = torch.randn((b, m, n)).half().to("cuda")
-    B = torch.randn((b, n, k)).half().to("cuda")
-    C = torch.empty((b, m, k)).half().to("cuda")
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
-            torch.bmm(A, B, out=C)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+def benchmark_bmm(b, m, n, k, label,num_iterations, num_warmup_iterations, buffers=None):
+    shapes = bmm_operand_shapes(b, m, n, k)
+    if buffers is None:
+        buffers = GemmBuffers.for_shapes([shapes], dtype=batched_dtype())
+    A, B, C = buffers.views(*shapes)
+    def run():
+        torch.bmm(A, B, out=C)
+    # fp8 BMMs run in bf16
+    dtype_name = "bf16" if DTYPE_NAME == "fp8" else None
+    times = cached_times(label, (b, m, n, k), dtype_name)
+    if times is None:
+        times = time_iterations(run, num_iterations, num_warmup_iterations)
+        record_result(label, (b, m, n, k), times, dtype_name=dtype_name)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({b}x{m}x{n}x{k}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({b}x{m}x{n}x{k})", times)
     print(f"Throughput (in TFLOP/s) for {label} ({b}x{m}x{n}x{k}): "
           f"{(2 * b * m * n * k) / (elapsed_time * 10**12):.3f}")
     return elapsed_time
 
 def benchmark_dropout(A_dim, label, num_iterations, num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    A = torch.randn(A_dim).half().to("cuda")
-    dropout = torch.nn.Dropout(0.5).to("cuda")
+    A = torch.randn(A_dim).to(DEVICE, OUTPUT_DTYPE)
+    dropout = torch.nn.Dropout(0.5).to(DEVICE)
 
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
-            dropout(A)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    def run():
+        dropout(A)
+    times = time_iterations(run, num_iterations, num_warmup_iterations)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({display(A_dim)}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({display(A_dim)})", times)
     return elapsed_time
 
 def benchmark_softmax(scores_shape, seq_length, label, num_iterations,num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    scores = torch.randn(scores_shape).half().to("cuda")
+    scores = torch.randn(scores_shape).to(DEVICE, OUTPUT_DTYPE)
     attention_mask = torch.tril(torch.ones(
-        (1, seq_length, seq_length), device="cuda")).view(
+        (1, seq_length, seq_length), device=DEVICE)).view(
         1, 1, seq_length, seq_length)
     attention_mask = attention_mask < 0.5
     softmax = FusedScaleMaskSoftmax(
-        True, False,
+        OUTPUT_DTYPE == torch.float16, OUTPUT_DTYPE == torch.bfloat16,
         SoftmaxFusionTypes.none, #attentionmasktype.padding=1,True
         attention_mask_func, True, 1)
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
-            softmax(scores, attention_mask)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    def run():
+        softmax(scores, attention_mask)
+    times = time_iterations(run, num_iterations, num_warmup_iterations)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({display(scores_shape)}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({display(scores_shape)})", times)
     return elapsed_time
 
 def benchmark_fused_gelu(A_dim, b_dim, label, num_iterations, num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    A = torch.randn(A_dim).half().to("cuda")
-    b = torch.randn(b_dim).half().to("cuda")
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
-            bias_gelu_impl(A, b)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    A = torch.randn(A_dim).to(DEVICE, OUTPUT_DTYPE)
+    b = torch.randn(b_dim).to(DEVICE, OUTPUT_DTYPE)
+    def run():
+        bias_gelu_impl(A, b)
+    times = time_iterations(run, num_iterations, num_warmup_iterations)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({display(A_dim)}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({display(A_dim)})", times)
     return elapsed_time
 
 def benchmark_layer_norm(A_dim, normalized_shape, label, num_iterations, num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    A = torch.randn(A_dim).half().to("cuda")
-    layer_norm = LayerNorm(normalized_shape).half().to("cuda")
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
-            layer_norm(A)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    A = torch.randn(A_dim).to(DEVICE, OUTPUT_DTYPE)
+    layer_norm = LayerNorm(normalized_shape).to(DEVICE, OUTPUT_DTYPE)
+    def run():
+        layer_norm(A)
+    times = time_iterations(run, num_iterations, num_warmup_iterations)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({display(A_dim)}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({display(A_dim)})", times)
     return elapsed_time
 
 def benchmark_add_bias_dropout(shape, label, num_iterations, num_warmup_iterations):
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    A = torch.randn(shape).half().to("cuda")
-    bias = torch.randn(shape).half().to("cuda")
-    residue = torch.randn(shape).half().to("cuda")
-    times = np.zeros(num_iterations+num_warmup_iterations)
-    for i in range(num_warmup_iterations + num_iterations):
-        with torch.no_grad():
-            start.record()
-            bias_dropout_add_fused_train(A, bias, residue, 0.0)
-            end.record()
-        torch.cuda.synchronize()
-        times[i] = start.elapsed_time(end)
-    times = times[num_warmup_iterations:]
+    A = torch.randn(shape).to(DEVICE, OUTPUT_DTYPE)
+    bias = torch.randn(shape).to(DEVICE, OUTPUT_DTYPE)
+    residue = torch.randn(shape).to(DEVICE, OUTPUT_DTYPE)
+    def run():
+        bias_dropout_add_fused_train(A, bias, residue, 0.0)
+    times = time_iterations(run, num_iterations, num_warmup_iterations)
     elapsed_time = np.amin(times)/1000 
     print(f"Elapsed time for {label} ({display(shape)}): {elapsed_time :.4f}")
+    print_timing_stats(f"{label} ({display(shape)})", times)
     return elapsed_time
@@ -0,0 +1,351 @@
+import argparse
+import json
+import math
+import re
+
+import numpy as np
+
+# Streaming multiprocessors (compute units on AMD) of common accelerators, --sms overrides
+GPU_SMS = {
+    "V100": 80,
+    "A10": 72,
+    "A100": 108,
+    "L40S": 142,
+    "H100-PCIe": 114,
+    "H100-SXM": 132,
+    "MI250X": 110,
+    "MI300X": 304,
+}
+
+# Output tiles (rows x cols) typical of cuBLAS/hipBLASLt kernels and their throughput relative to the largest one:
+# smaller tiles reuse each loaded element less and stay further from peak. The library picks the best tile per shape.
+DEFAULT_TILES = [
+    "256x128:1.0", "128x256:1.0", "128x128:0.92", "256x64:0.88", "64x256:0.88", "128x64:0.78", "64x128:0.78", "64x64:0.6"
+]
+
+
+# --dtype names and their names in --results_file, as in utils.py (which needs megatron to import)
+DTYPE_NAMES = {"fp32": "float32", "tf32": "tf32", "fp16": "float16", "bf16": "bfloat16", "fp8": "float8_e4m3fn"}
+
+
+def parse_tiles(tiles):
+    """
+    (rows, cols, relative throughput) of every "ROWSxCOLS[:THROUGHPUT]" tile
+    """
+    parsed = []
+    for tile in tiles:
+        dims, _, throughput = tile.partition(":")
+        rows, cols = dims.split("x")
+        parsed.append([int(rows), int(cols), float(throughput or 1.0)])
+    return np.array(parsed)
+
+
+def tile_name(tile):
+    return f"{int(tile[0])}x{int(tile[1])}"
+
+
+def gemm_efficiency(batch, rows, cols, shared, sms, tiles, tile_k=32):
+    """
+    Predicted fraction of peak of batch GEMMs producing rows x cols outputs over a shared dimension, for every tile.
+
+    Tile quantization: the padded tiles compute rows x cols useful elements out of ceil(rows/tm) * tm x ceil(cols/tn) * tn,
+    and the main loop steps through the shared dimension tile_k at a time.
+    Wave quantization: the tiles run in waves of sms, the last wave only partially occupies the GPU.
+    Both are scaled by the tile's relative throughput. The shape arguments broadcast against each other, the result has one extra trailing axis over tiles.
+    """
+    batch, rows, cols, shared = (np.asarray(dim, dtype=np.float64)[..., None] for dim in (batch, rows, cols, shared))
+    tile_rows, tile_cols, throughput = tiles[:, 0], tiles[:, 1], tiles[:, 2]
+    row_tiles = np.ceil(rows / tile_rows)
+    col_tiles = np.ceil(cols / tile_cols)
+    tile_efficiency = (rows * cols) / (row_tiles * tile_rows * col_tiles * tile_cols)
+    tile_efficiency = tile_efficiency * shared / (np.ceil(shared / tile_k) * tile_k)
+    num_tiles = batch * row_tiles * col_tiles
+    wave_efficiency = num_tiles / (np.ceil(num_tiles / sms) * sms)
+    return throughput * tile_efficiency * wave_efficiency
+
+
+def best_efficiency(batch, rows, cols, shared, sms, tiles, tile_k=32):
+    """
+    Efficiency of the best tile for every shape, and that tile's index
+    """
+    efficiency = gemm_efficiency(batch, rows, cols, shared, sms, tiles, tile_k)
+    return efficiency.max(axis=-1), efficiency.argmax(axis=-1)
+
+
+# transformer_flops.py labels of torch.nn.functional.linear, its b x (m, n) input is a single (b * m, n) GEMM
+LINEAR_OPS = {"qkv_transform", "attention_linear_projection", "mlp_h_to_4h", "mlp_4h_to_h", "logit_block"}
+
+
+def gemm_dims(op, shape):
+    """
+    (batch, rows, cols, shared) of a recorded shape: mm is (m, n) x (n, k), bmm b x (m, n) x (n, k)
+    """
+    if len(shape) == 3:
+        m, n, k = shape
+        return 1, m, k, n
+    b, m, n, k = shape
+    if op in LINEAR_OPS:
+        return 1, b * m, k, n
+    return b, m, k, n
+
+
+def transformer_gemms(hidden_size, num_attention_heads, vocab_size, microbatch_size, seq_length, tensor_mp_size=1):
+    """
+    (label, batch, rows, cols, shared) of the GEMMs transformer_flops.py times, hidden_size may be an array
+    """
+    h, a, t = hidden_size, num_attention_heads, tensor_mp_size
+    b, s = microbatch_size, seq_length
+    return [
+        ("qkv_transform", 1, s * b, 3 * h // t, h),
+        ("attention_score", b * a // t, s, s, h // a),
+        ("attention_over_value", b * a // t, s, h // a, s),
+        ("attention_linear_projection", 1, s * b, h, h // t),
+        ("mlp_h_to_4h", 1, s * b, 4 * h // t, h),
+        ("mlp_4h_to_h", 1, s * b, h, 4 * h // t),
+        ("logit_block", 1, s * b, h, vocab_size),
+    ]
+
+
+def model_efficiency(hidden_sizes, num_attention_heads, vocab_size, microbatch_size, seq_length, sms, tiles,
+                     tensor_mp_size=1, tile_k=32):
+    """
+    FLOP-weighted predicted efficiency of the transformer GEMMs for every hidden size, vectorized over hidden_sizes
+    """
+    h = np.asarray(hidden_sizes)
+    total_flops = np.zeros(h.shape)
+    total_time = np.zeros(h.shape)
+    for _, *dims in transformer_gemms(h, num_attention_heads, vocab_size, microbatch_size, seq_length, tensor_mp_size):
+        efficiency, _ = best_efficiency(*dims, sms, tiles, tile_k)
+        flops = 2.0 * np.prod(np.broadcast_arrays(*dims), axis=0)
+        total_flops = total_flops + flops
+        # time at peak is proportional to flops / efficiency
+        total_time = total_time + flops / efficiency
+    return total_flops / total_time
+
+
+def recommend_hidden_sizes(hidden_size, num_attention_heads, vocab_size, microbatch_size, seq_length, sms, tiles,
+                           tensor_mp_size=1, tile_k=32, search=0.1, multiple=64, top=5):
+    """
+    Hidden sizes within +-search of hidden_size that split evenly into the heads and tensor parallel ranks,
+    ranked by predicted efficiency, ties broken by closeness to hidden_size
+    """
+    step = math.lcm(multiple, num_attention_heads * tensor_mp_size)
+    low = max(step, math.ceil(hidden_size * (1 - search) / step) * step)
+    candidates = np.arange(low, max(low, int(hidden_size * (1 + search)) // step * step) + 1, step)
+    efficiency = model_efficiency(candidates, num_attention_heads, vocab_size, microbatch_size, seq_length, sms, tiles,
+                                  tensor_mp_size, tile_k)
+    order = np.lexsort((np.abs(candidates - hidden_size), -np.round(efficiency, 4)))[:top]
+    return [(int(candidates[i]), float(efficiency[i])) for i in order]
+
+
+def recommend_vocab_padding(vocab_size, hidden_size, microbatch_size, seq_length, sms, tiles, tensor_mp_size=1,
+                            tile_k=32, max_padding=None, multiple=64, tolerance=0.01):
+    """
+    Smallest padded vocabulary (a multiple of multiple x tensor_mp_size) whose output layer is within tolerance of the
+    best efficiency reachable with up to max_padding (default: vocab_size / 64) extra entries.
+
+    Unlike logit_block in transformer_flops.py, the forward output layer has the vocab shard as an output dimension,
+    (s * b, h) x (h, v / t), which is where padding changes the tiling.
+    """
+    step = multiple * tensor_mp_size
+    start = (vocab_size + step - 1) // step * step
+    if max_padding is None:
+        max_padding = vocab_size // 64
+    candidates = np.arange(start, max(start, vocab_size + max_padding) + 1, step)
+    tokens = microbatch_size * seq_length
+    efficiency, _ = best_efficiency(1, tokens, candidates // tensor_mp_size, hidden_size, sms, tiles, tile_k)
+    good = np.nonzero(efficiency >= (1 - tolerance) * efficiency.max())[0][0]
+    unpadded, _ = best_efficiency(1, tokens, vocab_size // tensor_mp_size, hidden_size, sms, tiles, tile_k)
+    return int(candidates[good]), float(efficiency[good]), float(unpadded)
+
+
+# Throughput lines of mm_flops.py, bmm_flops.py and transformer_flops.py logs
+MM_PATTERN = re.compile(r"Throughput \(in TFLOP/s\) for (\d+)x(\d+)x(\d+): ([\d.]+)")
+MM_B_PATTERN = re.compile(r"Throughput \(in TFLOP/s\) for (\w+) \((\d+)x(\d+)x(\d+), b=(\d+)\): ([\d.]+)")
+BMM_PATTERN = re.compile(r"Throughput \(in TFLOP/s\) for (\w+) \((\d+)x(\d+)x(\d+)x(\d+)\): ([\d.]+)")
+DTYPE_PATTERN = re.compile(r"\*\* dtype: (\w+)")
+
+
+def measurement(record):
+    """
+    (op, dtype, shape, TFLOP/s) of a sizing result, as written to --results_file
+    """
+    shape = tuple(int(dim) for dim in record["shape"].split("x"))
+    tflops = 2 * math.prod(shape) / record["duration"] / 1e12
+    return record["op"], record.get("dtype", ""), shape, tflops
+
+
+def load_results_file(path):
+    """
+    (op, dtype, shape, TFLOP/s) of every GEMM in the --results_file JSON lines of the sizing benchmarks
+    """
+    measured = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("suite") == "sizing":
+                measured.append(measurement(record))
+    return measured
+
+
+def load_log(path):
+    """
+    (op, dtype, shape, TFLOP/s) of every GEMM throughput line in a sizing benchmark log (the .out of a Slurm job)
+    """
+    measured = []
+    dtype = ""
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            match = DTYPE_PATTERN.search(line)
+            if match:
+                dtype = DTYPE_NAMES.get(match.group(1), match.group(1))
+            elif match := MM_PATTERN.search(line):
+                m, n, k, tflops = match.groups()
+                measured.append(("mm", dtype, (int(m), int(n), int(k)), float(tflops)))
+            elif match := MM_B_PATTERN.search(line):
+                op, m, n, k, b, tflops = match.groups()
+                measured.append((op, dtype, (int(b), int(m), int(n), int(k)), float(tflops)))
+            elif match := BMM_PATTERN.search(line):
+                op, b, m, n, k, tflops = match.groups()
+                measured.append((op, dtype, (int(b), int(m), int(n), int(k)), float(tflops)))
+    return measured
+
+
+def load_measured(paths):
+    measured = []
+    for path in paths:
+        measured += load_results_file(path) if path.endswith(".jsonl") else load_log(path)
+    return measured
+
+
+def resolve_sms(args):
+    if args.sms is not None:
+        return args.sms
+    if args.gpu is not None:
+        return GPU_SMS[args.gpu]
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return torch.cuda.get_device_properties(0).multi_processor_count
+    except ImportError:
+        pass
+    raise SystemExit("No GPU to query, pass --sms or --gpu")
+
+
+def print_grid(args, sms, tiles):
+    m = np.arange(*args.m_range) if args.m_range else np.asarray(args.m)
+    k = np.arange(*args.k_range) if args.k_range else np.asarray(args.k)
+    efficiency, tile = best_efficiency(args.b, m[:, None], k[None, :], args.n, sms, tiles, args.tile_k)
+    print(f"{'m':>8s} {'n':>8s} {'k':>8s} {'Tile':>9s} {'Predicted efficiency':>22s}")
+    for i, rows in enumerate(m):
+        for j, cols in enumerate(k):
+            print(f"{rows:>8d} {args.n:>8d} {cols:>8d} {tile_name(tiles[tile[i, j]]):>9s} {efficiency[i, j]:>22.3f}")
+
+
+def print_overlay(args, sms, tiles):
+    measured = load_measured(args.results)
+    if len(measured) == 0:
+        raise SystemExit("No GEMM throughput found, pass --results_file JSON lines or logs of mm_flops.py / bmm_flops.py")
+    dims = np.array([gemm_dims(op, shape) for op, _, shape, _ in measured])
+    tflops = np.array([value for *_, value in measured])
+    dtypes = np.array([dtype for _, dtype, _, _ in measured])
+    efficiency, tile = best_efficiency(*dims.T, sms, tiles, args.tile_k)
+
+    # every dtype has its own peak, without a datasheet value calibrate it on the best measured / predicted ratio
+    peaks = {}
+    for dtype in np.unique(dtypes):
+        selected = dtypes == dtype
+        peaks[dtype] = args.peak_tflops or float(np.max(tflops[selected] / efficiency[selected]))
+    predicted = efficiency * np.array([peaks[dtype] for dtype in dtypes])
+
+    print(f"{'Op':28s} {'Dtype':14s} {'Shape':24s} {'Tile':>9s} {'Measured TFLOP/s':>17s} {'Predicted eff.':>15s} "
+          f"{'Predicted TFLOP/s':>18s}")
+    for (op, dtype, shape, value), eff, best, prediction in zip(measured, efficiency, tile, predicted):
+        print(f"{op:28s} {dtype:14s} {'x'.join(map(str, shape)):24s} {tile_name(tiles[best]):>9s} {value:>17.3f} {eff:>15.3f} "
+              f"{prediction:>18.3f}")
+    print()
+    for dtype, peak in peaks.items():
+        selected = dtypes == dtype
+        line = f"{dtype or 'default dtype'}: peak {peak:.1f} TFLOP/s"
+        if selected.sum() > 1 and np.std(efficiency[selected]) > 0:
+            line += f", correlation of measured and predicted throughput {np.corrcoef(tflops[selected], efficiency[selected])[0, 1]:.3f}"
+        print(line)
+
+    if args.plot is not None:
+        import matplotlib.pyplot as plt
+        # plot against whichever output dimension the sweep varied
+        x = dims[:, 1] if len(np.unique(dims[:, 1])) > 1 else dims[:, 2]
+        plt.figure(dpi=200)
+        for dtype in peaks:
+            selected = np.nonzero(dtypes == dtype)[0]
+            selected = selected[np.argsort(x[selected])]
+            plt.plot(x[selected], tflops[selected], label=f"{dtype} measured".strip())
+            plt.plot(x[selected], predicted[selected], linestyle="--", label=f"{dtype} predicted".strip())
+        plt.xlabel("GEMM output dimension")
+        plt.ylabel("Throughput \n (TFLOP/s)")
+        plt.legend()
+        plt.savefig(args.plot, bbox_inches="tight")
+        print(f"Plot saved to {args.plot}")
+
+
+def print_recommendations(args, sms, tiles):
+    t = args.tensor_mp_size
+    current = model_efficiency([args.hidden_size], args.num_attention_heads, args.vocab_size, args.microbatch_size,
+                               args.seq_length, sms, tiles, t, args.tile_k)[0]
+    print(f"hidden_size={args.hidden_size}: predicted GEMM efficiency {current:.3f}")
+    print("Nearest good hidden sizes:")
+    for hidden_size, efficiency in recommend_hidden_sizes(args.hidden_size, args.num_attention_heads, args.vocab_size,
+                                                          args.microbatch_size, args.seq_length, sms, tiles, t,
+                                                          args.tile_k, search=args.search):
+        print(f"  {hidden_size:>8d} efficiency {efficiency:.3f} ({hidden_size - args.hidden_size:+d})")
+    padded, efficiency, unpadded = recommend_vocab_padding(args.vocab_size, args.hidden_size, args.microbatch_size,
+                                                           args.seq_length, sms, tiles, t, args.tile_k)
+    print(f"Vocab padding: {args.vocab_size} -> {padded} (+{padded - args.vocab_size}), "
+          f"output layer efficiency {unpadded:.3f} -> {efficiency:.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Predict tile and wave quantization of GEMM shapes, no GPU needed")
+    parser.add_argument("--sms", type=int, default=None, help="Number of SMs/CUs (default: --gpu, or the local GPU)")
+    parser.add_argument("--gpu", type=str, default=None, choices=list(GPU_SMS), help="Take the SM count of this GPU")
+    parser.add_argument("--tiles", nargs="+", type=str, default=DEFAULT_TILES, help="Candidate output tiles, ROWSxCOLS[:RELATIVE_THROUGHPUT]")
+    parser.add_argument("--tile_k", type=int, default=32, help="Step of the kernels' main loop over the shared dimension")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    grid = subparsers.add_parser("grid", help="Predicted efficiency of (m, n) x (n, k) GEMMs, as in mm_flops.py")
+    m_group = grid.add_mutually_exclusive_group(required=True)
+    m_group.add_argument("-m", nargs="+", type=int, help='The first dimension of the GEMM, enter any number of arguments')
+    m_group.add_argument("--m_range", nargs='+', type=int, help="The first dimension of the GEMM, [start,stop,step]")
+    k_group = grid.add_mutually_exclusive_group(required=True)
+    k_group.add_argument("-k", nargs="+", type=int, help='The last dimension of the GEMM, enter any number of arguments')
+    k_group.add_argument("--k_range", nargs='+', type=int, help="The last dimension of the GEMM, [start,stop,step]")
+    grid.add_argument("-n", type=int, default=4096, help="The shared dimension of the GEMM")
+    grid.add_argument("-b", type=int, default=1, help="Batch of a BMM")
+
+    overlay = subparsers.add_parser("overlay", help="Compare the prediction with measured --results_file throughput")
+    overlay.add_argument("results", nargs="+", type=str,
+                         help="--results_file JSON lines (.jsonl) or logs of mm_flops.py, bmm_flops.py and transformer_flops.py")
+    overlay.add_argument("--peak_tflops", type=float, default=None, help="Peak TFLOP/s (default: calibrated on the measurements)")
+    overlay.add_argument("--plot", type=str, default=None, help="Save measured vs predicted throughput to this image (needs matplotlib)")
+
+    recommend = subparsers.add_parser("recommend", help="Nearest efficient hidden sizes and vocab padding for a model")
+    recommend.add_argument("--hidden_size", type=int, required=True)
+    recommend.add_argument("--num_attention_heads", type=int, required=True)
+    recommend.add_argument("--vocab_size", type=int, required=True)
+    recommend.add_argument("--seq_length", type=int, default=2048)
+    recommend.add_argument("--microbatch_size", type=int, default=4)
+    recommend.add_argument("--tensor_mp_size", type=int, default=1)
+    recommend.add_argument("--search", type=float, default=0.1, help="Search hidden sizes within this fraction of --hidden_size")
+    args = parser.parse_args()
+
+    sms = resolve_sms(args)
+    tiles = parse_tiles(args.tiles)
+    print(f"Wave quantization model: {sms} SMs, tiles {' '.join(args.tiles)}, tile_k {args.tile_k}\n")
+    if args.command == "grid":
+        print_grid(args, sms, tiles)
+    elif args.command == "overlay":
+        print_overlay(args, sms, tiles)
+    else:
+        print_recommendations(args, sms, tiles)
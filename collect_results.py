@@ -1,75 +1,220 @@
+import argparse
 import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
-TOTAL_PAYLOAD=20e9
-WARMUP=20
-TRIALS=20
+# Regular expressions to match the required patterns
+# short runs print durations like 9.25e-05, the exponent must not be cut off
+FLOAT = r"[\d.]+(?:[eE][-+]?\d+)?"
+MAIN_PATTERN = re.compile(rf"world_size=(\d+) bytes=(\d+) total_duration=({FLOAT})((?:\s.*)?)$")
+XFER_PATTERN = re.compile(rf"xfer time \(ms\): ({FLOAT})$")
+# key=value settings all-gather-gdb.py appends to the main line, logs of older versions have none
+SETTING_PATTERN = re.compile(r"(\w+)=(\S+)")
 
-def parse_log_files(root_dir, output_file):
-    # Regular expressions to match the required patterns
-    main_pattern = re.compile(r"world_size=(\d+) bytes=(\d+) total_duration=([\d.]+)")
-    xfer_pattern = re.compile(r"xfer time \(ms\): ([\d.]+)")
 
-    # List to collect extracted data
-    data = []
+def make_record(file_path, world_size, num_bytes, total_duration, settings, xfer_times):
+    def setting(key, convert):
+        return convert(settings[key]) if key in settings else None
 
-    # Recursively search through the directory
-    for subdir, _, files in os.walk(root_dir):
+    return {
+        "filename": file_path,
+        "op": setting("op", str),
+        "dtype": setting("dtype", str),
+        "total_payload": setting("size", int),
+        "warmup_steps": setting("warmups", int),
+        "trials": setting("iterations", int),
+        "world_size": int(world_size),
+        "bytes": int(num_bytes),
+        "total_duration": float(total_duration),
+        "xfer_times": xfer_times,
+    }
+
+
+def parse_log_file(file_path):
+    """
+    Records of one log file, read line by line so that large logs are never held in memory
+    """
+    records = []
+    current = None
+    xfer_times = []
+    with open(file_path, 'r', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            # Check for the main line pattern
+            main_match = MAIN_PATTERN.match(line)
+            if main_match:
+                # A new main line closes the previous entry
+                if current is not None:
+                    records.append(make_record(file_path, *current, xfer_times))
+                world_size, num_bytes, total_duration, rest = main_match.groups()
+                current = (world_size, num_bytes, total_duration, dict(SETTING_PATTERN.findall(rest)))
+                xfer_times = []
+                continue
+
+            # Check for xfer time pattern
+            xfer_match = XFER_PATTERN.match(line)
+            if xfer_match and current is not None:
+                xfer_times.append(float(xfer_match.group(1)))
+
+    # Process any remaining data in the file after looping
+    if current is not None:
+        records.append(make_record(file_path, *current, xfer_times))
+    return file_path, records
+
+
+def find_log_files(root_dir, exclude=()):
+    exclude = {os.path.realpath(path) for path in exclude}
+    for subdir, dirs, files in os.walk(root_dir):
+        dirs.sort()
         for file in sorted(files):
             file_path = os.path.join(subdir, file)
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-
-            # Temporary storage for the extracted values
-            current_world_size = None
-            current_bytes = None
-            current_total_duration = None
-            xfer_times = []
-
-            # Parse the file line by line
-            for line in lines:
-                # Check for the main line pattern
-                main_match = main_pattern.match(line.strip())
-                if main_match:
-                    # If a new main pattern is found, process the previous data if it exists
-                    if current_world_size is not None:
-                        # Append all collected data
-                        data.append({
-                            # "filename": file_path,
-                            "world_size": int(current_world_size),
-                            "bytes": int(current_bytes),
-                            "total_duration": float(current_total_duration),
-                            "xfer_times": xfer_times
-                        })
-                    # Update current main data
-                    current_world_size, current_bytes, current_total_duration = main_match.groups()
-                    xfer_times = []  # Reset xfer times for the new main entry
-
-                # Check for xfer time pattern
-                xfer_match = xfer_pattern.match(line.strip())
-                if xfer_match and current_world_size is not None:
-                    xfer_times.append(float(xfer_match.group(1)))
-
-            # Process any remaining data in the file after looping
-            if current_world_size is not None:
-                data.append({
-                    # "filename": file_path,
-                    "total_payload": int(TOTAL_PAYLOAD),
-                    "warmup_steps": int(WARMUP),
-                    "trials": int(TRIALS),
-                    "world_size": int(current_world_size),
-                    "bytes": int(current_bytes),
-                    "total_duration": float(current_total_duration),
-                    "xfer_times": xfer_times
-                })
-
-    # Write the collected data to the output JSON file
-    with open(output_file, 'w') as out_file:
-        json.dump(data, out_file, indent=4)
+            if os.path.realpath(file_path) not in exclude:
+                yield file_path
+
+
+def load_manifest(path):
+    """
+    mtime/size of every parsed log under "files", and the length of the output when they were all written
+    """
+    if not os.path.exists(path):
+        return {"files": {}, "output_size": 0}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_state(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def drop_records(output_file, filenames):
+    """
+    Rewrite the JSON lines output without the records of files that changed or were deleted since they were parsed
+    """
+    if len(filenames) == 0 or not os.path.exists(output_file):
+        return
+    tmp_path = f"{output_file}.tmp"
+    with open(output_file, 'r') as src, open(tmp_path, 'w') as dst:
+        for line in src:
+            if line.strip() and json.loads(line).get("filename") not in filenames:
+                dst.write(line)
+    os.replace(tmp_path, output_file)
+
+
+def parse_log_files(root_dir, output_file, manifest_file, workers=None, checkpoint_files=64):
+    """
+    Append the records of every new or changed log file below root_dir to output_file (JSON lines).
+
+    Files whose mtime and size match the manifest are skipped, so re-runs only parse new logs. The manifest is
+    rewritten every checkpoint_files files, and records written after the last one are dropped by the next run.
+    Returns the number of (parsed files, records written, deleted files).
+    """
+    manifest = load_manifest(manifest_file)
+    files = manifest["files"]
+    # an interrupted run appended records of files the manifest does not list yet
+    if os.path.exists(output_file) and os.path.getsize(output_file) > manifest["output_size"]:
+        os.truncate(output_file, manifest["output_size"])
+
+    changed = {}
+    for file_path in find_log_files(root_dir, exclude=(output_file, manifest_file)):
+        state = file_state(file_path)
+        if files.get(file_path) != state:
+            changed[file_path] = state
+    deleted = {path for path in files if not os.path.exists(path)}
+    stale = deleted | {path for path in changed if path in files}
+    drop_records(output_file, stale)
+    for path in stale:
+        del files[path]
+
+    def checkpoint():
+        out_file.flush()
+        manifest["output_size"] = out_file.tell()
+        write_manifest(manifest, manifest_file)
+
+    num_records = 0
+    with open(output_file, 'a') as out_file, ProcessPoolExecutor(max_workers=workers) as executor:
+        checkpoint()
+        # map yields in submission order as soon as each file is parsed, records are written as they arrive
+        for i, (file_path, records) in enumerate(executor.map(parse_log_file, changed, chunksize=16), start=1):
+            for record in records:
+                out_file.write(json.dumps(record) + "\n")
+            num_records += len(records)
+            files[file_path] = changed[file_path]
+            if i % checkpoint_files == 0:
+                checkpoint()
+        checkpoint()
+    return len(changed), num_records, len(deleted)
+
+
+def write_parquet(jsonl_file, parquet_file, batch_size=10000):
+    """
+    Export the JSON lines output to Parquet in batches, needs pyarrow
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+
+    # explicit, so that settings missing from older logs (None) do not decide the column types
+    schema = pa.schema([
+        ("filename", pa.string()),
+        ("op", pa.string()),
+        ("dtype", pa.string()),
+        ("total_payload", pa.int64()),
+        ("warmup_steps", pa.int64()),
+        ("trials", pa.int64()),
+        ("world_size", pa.int64()),
+        ("bytes", pa.int64()),
+        ("total_duration", pa.float64()),
+        ("xfer_times", pa.list_(pa.float64())),
+    ])
+    writer = pq.ParquetWriter(parquet_file, schema)
+    batch = []
+
+    def flush():
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        batch.clear()
+
+    with open(jsonl_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                flush()
+    if len(batch) > 0:
+        flush()
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect all-gather-gdb.py timings from Slurm logs")
+    parser.add_argument("root_dir", type=str, help="Directory searched recursively for logs, e.g. logs/all-gather-gdb")
+    parser.add_argument("--output", type=str, default="benchmark_data.jsonl", help="JSON lines file the records are appended to")
+    parser.add_argument(
+        "--manifest", type=str, default=None, help="mtime/size of every parsed log (default: <output>.manifest.json)"
+    )
+    parser.add_argument("--parquet", type=str, default=None, help="Also export all records to this Parquet file")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    manifest_file = args.manifest or f"{args.output}.manifest.json"
+    num_files, num_records, num_deleted = parse_log_files(args.root_dir, args.output, manifest_file, args.workers)
+    print(f"Parsed {num_files} new or changed logs, {num_records} records appended to {args.output}")
+    if num_deleted > 0:
+        print(f"Dropped the records of {num_deleted} deleted logs")
+    if args.parquet is not None:
+        write_parquet(args.output, args.parquet)
+        print(f"Data exported to {args.parquet}")
+
 
 if __name__ == "__main__":
-    root_dir = "/home/jeromek/cookbook-dev/logs/all-gather-gdb/pool0_datahall_a"
-    output_file = "benchmark_data.json"
-    parse_log_files(root_dir, output_file)
-    print(f"Data extracted and saved to {output_file}")
+    main()
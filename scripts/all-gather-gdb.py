@@ -1,49 +1,182 @@
+import argparse
+import contextlib
 import gc
+import json
 import os
-import socket
 import time
 import warnings
 
 import torch
 
-SIZE = 20e9
+DTYPES = {
+    "uint8": torch.uint8,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "float32": torch.float32,
+}
+OPS = ["all_gather", "reduce_scatter", "all_reduce", "all_to_all", "broadcast"]
 
 warnings.filterwarnings('ignore', message='process group has NOT been destroyed before we destruct ProcessGroupNCCL.')
-local_rank = int(os.environ["LOCAL_RANK"])
-rank = int(os.environ['RANK'])
-world_size = int(os.environ['WORLD_SIZE'])
-print(f"LOCAL_RANK: {local_rank}, RANK: {rank}, WORLD_SIZE: {world_size}")
 
-torch.distributed.init_process_group(backend='nccl')#, init_method='env://')
 
-data = torch.empty(int(SIZE / world_size), device=f'cuda:{local_rank}', dtype=torch.uint8)
-tensor_list = torch.zeros((world_size,) + data.shape, device=data.device, dtype=data.dtype)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time a large-payload collective for a number of iterations")
+    parser.add_argument("--op", type=str, default="all_gather", choices=OPS, help="Collective to time")
+    parser.add_argument(
+        "--size",
+        type=float,
+        default=20e9,
+        help="Bytes of the full (gathered / reduced) buffer, every rank holds size / world_size of it",
+    )
+    parser.add_argument("--dtype", type=str, default="uint8", choices=list(DTYPES))
+    parser.add_argument("--iterations", type=int, default=20, help="Timed iterations")
+    parser.add_argument("--warmups", type=int, default=0, help="Untimed iterations before the timed ones")
+    parser.add_argument(
+        "--backend", type=str, default=None, help="torch.distributed backend (default: nccl with CUDA, gloo without)"
+    )
+    parser.add_argument("--output", type=str, default=None, help="Append the per-iteration timings to this JSON lines file")
+    return parser.parse_args()
 
-torch.distributed.barrier()
-torch.cuda.synchronize()
 
-gc.disable()
+def nvtx_range(name):
+    # NVTX ranges only exist with CUDA, CPU runs get no-ops
+    if not torch.cuda.is_available():
+        return contextlib.nullcontext()
+    return torch.cuda.nvtx.range(name)
 
-# timers
-events = []
-for i in range(20):
-    start = torch.cuda.Event(enable_timing=True)
-    stop = torch.cuda.Event(enable_timing=True)
-    events.append((start, stop))
 
-for i in range(20):
-    if i == 1:
-        total_duration = time.time()
+class HostEvent:
+    """
+    Host-clock stand-in for torch.cuda.Event on CPU runs
+    """
 
-    start, stop = events[i]
-    start.record()
-    torch.cuda.nvtx.range_push(f'all_gather{i}')
-    torch.distributed.all_gather_into_tensor(tensor_list, data)
-    torch.cuda.nvtx.range_pop()
-    stop.record()
+    def record(self):
+        self.time = time.perf_counter()
 
-torch.cuda.synchronize()
+    def elapsed_time(self, end):
+        return (end.time - self.time) * 1e3
 
-if rank == 0:
-    print(f'world_size={world_size} bytes={data.numel()} total_duration={time.time()-total_duration}')
-    for start, stop in events: print(f'xfer time (ms): {start.elapsed_time(stop)}')
\ No newline at end of file
+
+def create_events(device):
+    if device.type == "cuda":
+        return torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+    return HostEvent(), HostEvent()
+
+
+def setup_buffers(op, size, dtype, world_size, device):
+    """
+    (input, output) of one rank, output is None for in-place collectives
+    """
+    element_size = torch.empty((), dtype=dtype).element_size()
+    shard_numel = int(size / world_size) // element_size
+    full_numel = shard_numel * world_size
+    if op == "all_gather":
+        return torch.empty(shard_numel, device=device, dtype=dtype), torch.zeros(full_numel, device=device, dtype=dtype)
+    elif op == "reduce_scatter":
+        return torch.empty(full_numel, device=device, dtype=dtype), torch.zeros(shard_numel, device=device, dtype=dtype)
+    elif op == "all_to_all":
+        return torch.empty(full_numel, device=device, dtype=dtype), torch.zeros(full_numel, device=device, dtype=dtype)
+    return torch.empty(full_numel, device=device, dtype=dtype), None
+
+
+def shard_bytes(op, input, world_size):
+    """
+    Bytes of one rank's shard of the full buffer, what bytes= reports for every op so that ops stay comparable
+    """
+    num_bytes = input.numel() * input.element_size()
+    return num_bytes if op == "all_gather" else num_bytes // world_size
+
+
+def issue_op(op, input, output, world_size):
+    dist = torch.distributed
+    if op == "all_gather":
+        if dist.get_backend() == "gloo":
+            # gloo has no all_gather_into_tensor, gather into chunk views of the output instead
+            dist.all_gather(list(output.chunk(world_size)), input)
+        else:
+            dist.all_gather_into_tensor(output, input)
+    elif op == "reduce_scatter":
+        dist.reduce_scatter_tensor(output, input)
+    elif op == "all_reduce":
+        dist.all_reduce(input)
+    elif op == "all_to_all":
+        dist.all_to_all_single(output, input)
+    elif op == "broadcast":
+        dist.broadcast(input, 0)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def main():
+    args = parse_args()
+    local_rank = int(os.environ["LOCAL_RANK"])
+    rank = int(os.environ['RANK'])
+    world_size = int(os.environ['WORLD_SIZE'])
+    print(f"LOCAL_RANK: {local_rank}, RANK: {rank}, WORLD_SIZE: {world_size}")
+
+    device = torch.device(f"cuda:{local_rank}" if torch.cuda.is_available() else "cpu")
+    if device.type == "cuda":
+        torch.cuda.set_device(device)
+    backend = args.backend or ("nccl" if device.type == "cuda" else "gloo")
+    torch.distributed.init_process_group(backend=backend)
+
+    input, output = setup_buffers(args.op, args.size, DTYPES[args.dtype], world_size, device)
+    events = [create_events(device) for i in range(args.iterations)]
+
+    for i in range(args.warmups):
+        issue_op(args.op, input, output, world_size)
+    torch.distributed.barrier()
+    synchronize(device)
+
+    gc.disable()
+
+    total_duration = time.time()
+    for i in range(args.iterations):
+        if i == 1:
+            # the first iteration pays for connection setup, the total covers the rest
+            total_duration = time.time()
+
+        start, stop = events[i]
+        start.record()
+        with nvtx_range(f'{args.op}{i}'):
+            issue_op(args.op, input, output, world_size)
+        stop.record()
+
+    synchronize(device)
+    total_duration = time.time() - total_duration
+    gc.enable()
+
+    if rank == 0:
+        xfer_times = [start.elapsed_time(stop) for start, stop in events]
+        num_bytes = shard_bytes(args.op, input, world_size)
+        # collect_results.py parses these lines from the srun logs
+        print(
+            f'world_size={world_size} bytes={num_bytes} total_duration={total_duration} op={args.op} '
+            f'size={int(args.size)} dtype={args.dtype} warmups={args.warmups} iterations={args.iterations}'
+        )
+        for xfer_time in xfer_times:
+            print(f'xfer time (ms): {xfer_time}')
+        if args.output is not None:
+            record = {
+                "op": args.op,
+                "world_size": world_size,
+                "bytes": num_bytes,
+                "total_payload": int(args.size),
+                "dtype": args.dtype,
+                "backend": backend,
+                "warmup_steps": args.warmups,
+                "trials": args.iterations,
+                "total_duration": total_duration,
+                "xfer_times": xfer_times,
+            }
+            with open(args.output, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    torch.distributed.destroy_process_group()
+
+
+if __name__ == "__main__":
+    main()
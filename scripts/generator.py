@@ -1,5 +1,9 @@
 import argparse
+import itertools
+import json
 import os
+import shlex
+import sys
 from pathlib import Path
 
 SCRIPT_DIR = Path(__file__).parent.resolve()
@@ -13,6 +17,7 @@ def create_sbatch_script(args):
     account = args.account
     partition = args.partition 
     program = args.program
+    program_args = args.program_args
     master_port = args.master_port or 6000
     job_name = Path(program).stem
     output = args.output or f"logs/{job_name}/{partition}/n{num_nodes}-g{num_gpus}/sbatch.out"
@@ -45,7 +50,7 @@ CMD="torchrun --nproc_per_node {num_gpus} \
 --node_rank \$SLURM_PROCID \
 --rdzv_endpoint $MASTER_ADDR:{master_port} \
 --rdzv_backend c10d \
---max_restarts 0 {program}"
+--max_restarts 0 {program} {program_args}"
 
 SRUN_ARGS="--output logs/{job_name}/{partition}/n{num_nodes}-g{num_gpus}/srun-%N.out \
 --error logs/{job_name}/{partition}/n{num_nodes}-g{num_gpus}/srun-%N.err \
@@ -67,6 +72,160 @@ echo "END TIME: $(date)"
     print(f"SLURM script generated: {os.path.realpath(script_filename)}")
 
 
+def sweep_entries(args):
+    """
+    One manifest entry per point of the node x GPU x program x program-args grid, grouped by allocation size
+    """
+    programs = args.programs or [args.program]
+    program_args_grid = args.program_args_grid or [args.program_args]
+    grid = itertools.product(sorted(args.nodes_grid), sorted(args.gpus_grid), programs, program_args_grid)
+    entries = []
+    for index, (num_nodes, num_gpus, program, program_args) in enumerate(grid):
+        log_dir = f"logs/{args.job_name}/{args.partition}/{index:03d}-n{num_nodes}-g{num_gpus}-{Path(program).stem}"
+        entries.append({
+            "index": index,
+            "num_nodes": num_nodes,
+            "num_gpus": num_gpus,
+            "program": Path(program).as_posix(),
+            "program_args": program_args,
+            "log_dir": log_dir,
+        })
+    return entries
+
+
+def array_groups(entries):
+    """
+    Contiguous index ranges sharing (num_nodes, num_gpus): every task of a Slurm array gets the same allocation,
+    so each range is submitted as its own array of the one script
+    """
+    groups = []
+    for (num_nodes, num_gpus), group in itertools.groupby(entries, key=lambda e: (e["num_nodes"], e["num_gpus"])):
+        group = list(group)
+        groups.append((num_nodes, num_gpus, group[0]["index"], group[-1]["index"]))
+    return groups
+
+
+def bash_array(name, values):
+    return f"{name}=({' '.join(shlex.quote(str(value)) for value in values)})"
+
+
+def create_sweep_script(args, entries):
+    job_name = args.job_name
+    partition = args.partition
+    master_port = args.master_port or 6000
+    arrays = "\n".join([
+        bash_array("NUM_NODES", [e["num_nodes"] for e in entries]),
+        bash_array("NUM_GPUS", [e["num_gpus"] for e in entries]),
+        bash_array("PROGRAMS", [e["program"] for e in entries]),
+        bash_array("PROGRAM_ARGS", [e["program_args"] for e in entries]),
+        bash_array("LOG_DIRS", [e["log_dir"] for e in entries]),
+    ])
+
+    return f"""#!/bin/bash
+#SBATCH --job-name={job_name}
+#SBATCH --ntasks-per-node={args.ntasks_per_node}
+#SBATCH --time={args.time or "0:30:00"}
+#SBATCH --partition={partition}
+#SBATCH --output=logs/{job_name}/{partition}/sbatch-%A_%a.out
+#SBATCH --error=logs/{job_name}/{partition}/sbatch-%A_%a.err
+#SBATCH --account={args.account}
+# --array, --nodes and --gres are given on the sbatch command line, see {job_name}.submit.sh
+
+echo "START TIME: $(date)"
+
+set -eo pipefail
+
+{arrays}
+
+i=$SLURM_ARRAY_TASK_ID
+NUM_NODES=${{NUM_NODES[$i]}}
+NUM_GPUS=${{NUM_GPUS[$i]}}
+LOG_DIR=${{LOG_DIRS[$i]}}
+mkdir -p $LOG_DIR
+
+echo "SWEEP_INDEX=$i SLURM_GPUS_ON_NODE=$SLURM_GPUS_ON_NODE SLURM_NNODES=$SLURM_NNODES"
+
+MASTER_ADDR=$(scontrol show hostnames $SLURM_JOB_NODELIST | head -n 1)
+
+CMD="torchrun --nproc_per_node $NUM_GPUS \
+--nnodes $NUM_NODES \
+--node_rank \$SLURM_PROCID \
+--rdzv_endpoint $MASTER_ADDR:{master_port} \
+--rdzv_backend c10d \
+--max_restarts 0 ${{PROGRAMS[$i]}} ${{PROGRAM_ARGS[$i]}}"
+
+SRUN_ARGS="--output $LOG_DIR/srun-%N.out \
+--error $LOG_DIR/srun-%N.err \
+--container-image {args.container} \
+--container-mounts {ROOT_DIR.as_posix()}:{ROOT_DIR.as_posix()}"
+echo "Running: $CMD"
+srun $SRUN_ARGS bash -c "$CMD"
+
+echo "END TIME: $(date)"
+"""
+
+
+def create_submit_script(args, entries, script_filename):
+    lines = ["#!/bin/bash", "set -eo pipefail", f"mkdir -p logs/{args.job_name}/{args.partition}"]
+    for num_nodes, num_gpus, first, last in array_groups(entries):
+        lines.append(f"sbatch --array={first}-{last} --nodes={num_nodes} --gres=gpu:{num_gpus} {script_filename}")
+    return "\n".join(lines) + "\n"
+
+
+def create_sweep(args):
+    """
+    Write a Slurm job-array script, the manifest mapping array index to parameters and a submit script
+    """
+    entries = sweep_entries(args)
+    script_filename = f"{args.job_name}-{args.partition}-sweep.sbatch"
+    submit_filename = f"{args.job_name}.submit.sh"
+    manifest_filename = f"{args.job_name}-{args.partition}-sweep.json"
+    sweep_script = create_sweep_script(args, entries)
+    submit_script = create_submit_script(args, entries, script_filename)
+
+    if args.dry_run:
+        print(f"# {script_filename}\n{sweep_script}\n# {submit_filename}\n{submit_script}")
+        print(f"{'Index':6s} {'Nodes':6s} {'GPUs':6s} {'Program':30s} Args")
+        for e in entries:
+            print(f"{e['index']:<6d} {e['num_nodes']:<6d} {e['num_gpus']:<6d} {Path(e['program']).name:30s} {e['program_args']}")
+        return
+
+    for filename, text in ((script_filename, sweep_script), (submit_filename, submit_script)):
+        with open(filename, 'w') as f:
+            f.write(text)
+        os.chmod(filename, 0o755)
+    with open(manifest_filename, 'w') as f:
+        json.dump({"script": script_filename, "entries": entries}, f, indent=4)
+    print(f"SLURM array script generated: {os.path.realpath(script_filename)}")
+    print(f"Manifest with {len(entries)} entries: {os.path.realpath(manifest_filename)}")
+    print(f"Submit with: bash {os.path.realpath(submit_filename)}")
+
+
+def run_local(manifest_filename):
+    """
+    Fake Slurm: run every manifest entry in order on this host with the local launcher, logging like srun would
+    """
+    sys.path.append((ROOT_DIR / "benchmarks").as_posix())
+    from communication.launcher import launch_script
+
+    with open(manifest_filename, 'r') as f:
+        entries = json.load(f)["entries"]
+
+    failed = 0
+    for e in entries:
+        world_size = e["num_nodes"] * e["num_gpus"]
+        os.makedirs(e["log_dir"], exist_ok=True)
+        print(f"[{e['index']}/{len(entries) - 1}] {Path(e['program']).name} {e['program_args']} on {world_size} local ranks")
+        env = {"SLURM_ARRAY_TASK_ID": str(e["index"]), "SLURM_NNODES": str(e["num_nodes"])}
+        with open(os.path.join(e["log_dir"], "srun-local.out"), 'w') as log:
+            returncode = launch_script(e["program"], shlex.split(e["program_args"]), world_size, stdout=log, extra_env=env)
+        if returncode != 0:
+            failed += 1
+            print(f"  failed with exit code {returncode}, see {e['log_dir']}/srun-local.out")
+    print(f"{len(entries) - failed}/{len(entries)} sweep entries succeeded")
+    return 1 if failed > 0 else 0
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate SLURM batch script.")
     parser.add_argument("--job-name", type=str,default="all-gather-bench", help="Job name for SLURM")
@@ -78,12 +237,43 @@ def main():
     parser.add_argument("--error", type=str, help="Error file path")
     parser.add_argument("--container", type=str, help="Container image", default="/lustre/fs01/portfolios/dir/projects/dir_arc/heimdall/scalable_container_images/nvidia_evo2_efa_latest.sqsh")
     parser.add_argument("--program", type=Path, help="Program to run", default=SCRIPT_DIR / "all-gather-gdb.py")
+    parser.add_argument(
+        "--program-args",
+        type=str,
+        default="",
+        help="Arguments passed to the program, e.g. \"--op reduce_scatter --size 4e9 --output results.jsonl\"",
+    )
     parser.add_argument("--master-port", type=int, default=6000, help="Master port for distributed training")
     parser.add_argument("--num-gpus", type=int, default=8, help="Number of GPUs to allocate")
     parser.add_argument("--num-nodes", type=int, default=1, help="Number of nodes to allocate")
 
+    sweep = parser.add_argument_group("sweep", "Grids expanded into one Slurm job array (any grid enables sweep mode)")
+    sweep.add_argument("--nodes-grid", type=int, nargs="+", help="Node counts to sweep")
+    sweep.add_argument("--gpus-grid", type=int, nargs="+", help="GPUs per node to sweep")
+    sweep.add_argument("--programs", type=Path, nargs="+", help="Programs to sweep (default: --program)")
+    sweep.add_argument(
+        "--program-args-grid",
+        type=str,
+        nargs="+",
+        help="Argument strings to sweep, e.g. \"--op all_gather --size 4e9\" \"--op reduce_scatter --size 4e9\"",
+    )
+    sweep.add_argument("--dry-run", action="store_true", help="Print the sweep script, submit commands and manifest without writing")
+    sweep.add_argument(
+        "--run-local",
+        type=str,
+        metavar="MANIFEST",
+        help="Run the entries of a sweep manifest sequentially on this host instead of generating anything",
+    )
+
     args = parser.parse_args()
-    create_sbatch_script(args)
+    if args.run_local is not None:
+        sys.exit(run_local(args.run_local))
+    elif any(grid is not None for grid in (args.nodes_grid, args.gpus_grid, args.programs, args.program_args_grid)):
+        args.nodes_grid = args.nodes_grid or [args.num_nodes]
+        args.gpus_grid = args.gpus_grid or [args.num_gpus]
+        create_sweep(args)
+    else:
+        create_sbatch_script(args)
 
 
 if __name__ == "__main__":